@@ -0,0 +1,170 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from car_engine import normalize_code
+
+# ==========================================
+# 異常報酬 (Abnormal_Return) 產生器
+# ==========================================
+# 取代 TEJ 匯出的 final_model_complete.csv：估計期、基準 (大盤 / Fama-French) 都能自己換。
+#   R_it - rf_t = α_i + β_i' F_t + ε_it
+#   AR_it = (R_it - rf_t) - (α̂_i + β̂_i' F_t)，α̂ / β̂ 由 [t - gap - window + 1, t - gap] 估計
+# 全部股票一起算：報酬攤成 (日期 × 股票) 矩陣，X'X 與 X'y 的每個元素沿時間 cumsum，
+# 任一個滾動視窗的動差 = 兩列相減；再把 T × N 個 (k+1)×(k+1) 小方程組一次 np.linalg.solve。
+# 缺值只影響該股自己的動差 (有效樣本 < min_obs 的日期 AR 為 NaN)。
+# 預設 gap = 21：t = E + 10 的估計期止於 E - 11，事件日前後 ±10 天的 AR 所用的估計期都不含事件窗。
+# 輸出 (Code, Date, Abnormal_Return [, alpha, beta_*]) 的 parquet，car_engine.load_ar_panel 可直接讀。
+
+ESTIMATION_WINDOW = 250
+GAP = 21
+MIN_OBS = 120
+
+
+# ==========================================
+# 1. 矩陣
+# ==========================================
+def returns_matrix(df, dates, code_col="Code", date_col="Date", ret_col="Return"):
+    """long format 報酬 → (dates × codes) 矩陣；不在 dates 裡的日期丟掉，缺值為 NaN"""
+    codes = normalize_code(df[code_col]).astype(str)
+    day = pd.to_datetime(df[date_col]).to_numpy(dtype="datetime64[ns]")
+    ret = pd.to_numeric(df[ret_col], errors="coerce").to_numpy(dtype=float)
+
+    dates = np.asarray(dates, dtype="datetime64[ns]")
+    row = np.searchsorted(dates, day)
+    hit = (row < len(dates)) & (dates[np.minimum(row, len(dates) - 1)] == day)
+    code_id, uniques = pd.factorize(codes[hit], sort=True)
+    R = np.full((len(dates), len(uniques)), np.nan)
+    R[row[hit], code_id] = ret[hit]
+    return R, np.asarray(uniques, dtype=str)
+
+
+def _window_sums(A, window, gap):
+    """A: T × ...；回傳每個 t 在 [t - gap - window + 1, t - gap] 的加總 (不足的前段只加到第 0 天)"""
+    T = len(A)
+    C = np.concatenate([np.zeros((1,) + A.shape[1:]), np.cumsum(A, axis=0)])
+    hi = np.clip(np.arange(T) - gap + 1, 0, T)
+    lo = np.maximum(hi - window, 0)
+    return C[hi] - C[lo]
+
+
+# ==========================================
+# 2. 滾動回歸
+# ==========================================
+def rolling_factor_model(Y, F, window=ESTIMATION_WINDOW, gap=GAP, min_obs=MIN_OBS):
+    """
+    Y : T × N 報酬 (NaN 為缺值)
+    F : T × k 因子 (大盤報酬時 k = 1)
+    回傳 coef T × N × (k + 1)：[α, β_1 … β_k]，樣本不足或共線為 NaN
+    """
+    T, N = Y.shape
+    X = np.column_stack([np.ones(T), F])             # T × (k+1)
+    p = X.shape[1]
+    valid = ~np.isnan(Y) & ~np.isnan(X).any(axis=1)[:, None]
+    V = valid.astype(float)
+    Yz = np.where(valid, Y, 0.0)
+    Xz = np.where(np.isnan(X), 0.0, X)
+
+    n = _window_sums(V, window, gap)
+    XtX = np.empty((T, N, p, p))
+    Xty = np.empty((T, N, p))
+    for a in range(p):
+        Xty[:, :, a] = _window_sums(Yz * Xz[:, a:a + 1], window, gap)
+        for b in range(a, p):
+            XtX[:, :, a, b] = XtX[:, :, b, a] = _window_sums(V * (Xz[:, a] * Xz[:, b])[:, None], window, gap)
+
+    diag = np.prod(np.diagonal(XtX, axis1=2, axis2=3), axis=2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bad = (n < min_obs) | ~(np.linalg.det(XtX) / diag > 1e-10)
+    XtX[bad] = np.eye(p)
+    coef = np.linalg.solve(XtX, Xty[..., None])[..., 0]
+    coef[bad] = np.nan
+    return coef
+
+
+def abnormal_returns(Y, F, coef):
+    X = np.column_stack([np.ones(len(Y)), F])
+    return Y - np.einsum("tnp,tp->tn", coef, X)
+
+
+def build_abnormal_returns(returns, market, factors=None, rf=None, window=ESTIMATION_WINDOW, gap=GAP,
+                           min_obs=MIN_OBS, keep_params=False, code_col="Code", date_col="Date", ret_col="Return"):
+    """
+    returns : long format 日報酬 (code_col, date_col, ret_col)，小數 (TEJ 的 % 請先除以 100)
+    market  : 以日期為 index 的大盤報酬 Series；其日期即為交易日曆
+    factors : 以日期為 index 的因子 DataFrame (例如 SMB、HML)；None = 市場模型
+    rf      : 以日期為 index 的無風險利率 Series；給了就以超額報酬回歸 (Fama-French)
+    回傳 long format (Code, Date, Abnormal_Return [, alpha, beta_market, beta_*])，依 (Code, Date) 排序
+    """
+    market = market.sort_index()
+    dates = pd.to_datetime(market.index)
+    F = market.to_numpy(dtype=float)[:, None]
+    names = ["market"]
+    if factors is not None:
+        f = factors.reindex(market.index)
+        F = np.column_stack([F, f.to_numpy(dtype=float)])
+        names += [str(c) for c in f.columns]
+
+    Y, codes = returns_matrix(returns, dates, code_col, date_col, ret_col)
+    if rf is not None:
+        r = rf.reindex(market.index).to_numpy(dtype=float)
+        Y = Y - r[:, None]
+        F[:, 0] = F[:, 0] - r
+
+    coef = rolling_factor_model(Y, F, window, gap, min_obs)
+    AR = abnormal_returns(Y, F, coef)
+
+    t_idx, c_idx = np.nonzero(~np.isnan(AR))
+    order = np.lexsort((t_idx, c_idx))
+    t_idx, c_idx = t_idx[order], c_idx[order]
+    out = pd.DataFrame({
+        "Code": codes[c_idx],
+        "Date": dates[t_idx],
+        "Abnormal_Return": AR[t_idx, c_idx].astype(np.float32),
+    })
+    if keep_params:
+        out["alpha"] = coef[t_idx, c_idx, 0].astype(np.float32)
+        for j, name in enumerate(names, start=1):
+            out[f"beta_{name}"] = coef[t_idx, c_idx, j].astype(np.float32)
+    return out
+
+
+# ==========================================
+# 3. 輸出
+# ==========================================
+def save_ar_parquet(ar, path, **run_info):
+    """Code 存成 dictionary、Date 存成 date32、數值 float32；估計設定寫在 schema metadata"""
+    table = pa.table({
+        "Code": pa.array(ar["Code"].astype(str)).dictionary_encode(),
+        "Date": pa.array(pd.to_datetime(ar["Date"]).dt.date, pa.date32()),
+        **{c: pa.array(ar[c].to_numpy(dtype=np.float32)) for c in ar.columns if c not in ("Code", "Date")},
+    })
+    meta = {f"ar_{k}".encode(): str(v).encode() for k, v in run_info.items()}
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), **meta})
+    tmp = path + ".tmp"
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, path)
+    return path
+
+
+if __name__ == "__main__":
+    BASE_DIR = r"D:\我才不要走量化"
+    base_path = os.path.join(BASE_DIR, "法說會")
+    # TEJ 匯出：個股日報酬 (Code, Date=%Y%m%d, Return %) 與大盤 (Date, Market_Return %)
+    df_ret = pd.read_csv(os.path.join(base_path, "daily_returns.csv"))
+    df_mkt = pd.read_csv(os.path.join(base_path, "market_returns.csv"))
+    df_ret["Date"] = pd.to_datetime(df_ret["Date"].astype(str), format="%Y%m%d")
+    df_ret["Return"] = df_ret["Return"] / 100
+    market = df_mkt.assign(Date=pd.to_datetime(df_mkt["Date"].astype(str), format="%Y%m%d")) \
+        .set_index("Date")["Market_Return"] / 100
+
+    for window in (250, 120):
+        t0 = time.perf_counter()
+        ar = build_abnormal_returns(df_ret, market, window=window, keep_params=True)
+        path = os.path.join(base_path, f"abnormal_returns_mm{window}.parquet")
+        save_ar_parquet(ar, path, model="market", window=window, gap=GAP, min_obs=MIN_OBS)
+        print(f"⏱️ 市場模型 (估計期 {window} 天)：{len(ar)} 筆，{time.perf_counter() - t0:.2f} 秒 → {path}")
@@ -0,0 +1,230 @@
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from feature_store import apply_filters
+from info_metrics import event_metrics
+from oib_lambda import build_bucket_index, compute_vwap, session_window, sort_ticks
+from tick_store import read_ticks
+from tick_writer import read_day_ticks
+
+# ==========================================
+# 法說會兩層濾網策略的 tick 回測
+# ==========================================
+# (1) 第一層：T-1 11:00~11:30 info_pressure < 0 的事件進股池
+# (2) 第二層：T0 9:00~9:30 info_pressure 最高的 top_n 檔 (不為負)，都為負就不交易
+# (3) 進場：T0 9:35:00~9:35:59 的 VWAP；出場：T+2 10:00:00~10:00:59 的 VWAP
+# (4) 每天投入 capital，當天有數檔就等權分配；成本 0.1425% (買)、0.4425% (賣)
+# 流程分成兩段：
+#   load_candidates + attach_fills：所有候選事件的指標與進出場 VWAP 一次算好 (分組加總，不逐筆迴圈)
+#   select_trades + run_backtest：只在候選表上篩選、分配資金，換參數 (top_n、門檻) 不必重讀 tick
+# 進出場價在候選階段就算好，所以換 entry / exit 時段或持有天數需要重新 attach_fills。
+# 額外濾網 (成交值、妖股、營收、9:30 漲幅)：FeatureStore 以 date_0 as-of attach 到候選表，
+#   cfg.filters 的 Predicate 只是欄位條件，換門檻不必重算特徵。
+
+REL_DAYS = (-2, -1, 0, 1, 2)
+
+
+@dataclass(frozen=True)
+class StrategyConfig:
+    top_n: int = 2
+    t1_window: str = "1100_1130"   # 第一層濾網：T-1 的時段
+    t1_below: float = 0.0          # T-1 指標 < t1_below 才進股池
+    t0_window: str = "0900_0930"   # 第二層濾網：T0 的時段
+    t0_min: float = 0.0            # T0 指標 >= t0_min 才買 (不為負)
+    entry: tuple = ("09:35", "09:36")
+    exit: tuple = ("10:00", "10:01")
+    hold_days: int = 2             # 出場日 T+hold_days；event_days 只存到 T+2
+    capital: float = 1_000_000
+    buy_cost: float = 0.001425
+    sell_cost: float = 0.004425
+    filters: tuple = ()            # feature_store.Predicate，例如 README_FILTERS
+
+
+# ==========================================
+# 1. 候選事件
+# ==========================================
+def load_event_calendar(db_path):
+    """每場 event 一列：各相對日的實際交易日 date_{rel} 與 day_id day_{rel}"""
+    conn = sqlite3.connect(db_path)
+    links = pd.read_sql("SELECT event_id, relative_day, day_id, code, real_date FROM event_days", conn)
+    conn.close()
+    wide = links.pivot(index="event_id", columns="relative_day", values=["real_date", "day_id"])
+    cal = pd.DataFrame(index=wide.index)
+    for rel in REL_DAYS:
+        cal[f"date_{rel}"] = wide["real_date"].get(rel)
+        cal[f"day_{rel}"] = wide["day_id"].get(rel)
+    codes = links.drop_duplicates("event_id").set_index("event_id")["code"]
+    cal.insert(0, "code", codes.reindex(cal.index).astype(str))
+    return cal.reset_index()
+
+
+def load_candidates(db_path, cfg=StrategyConfig()):
+    """事件 + 交易日 + T-1 / T0 指標 (ip_t1、ip_t0)"""
+    feats = event_metrics(db_path, {"ip_t1": (cfg.t1_window, -1), "ip_t0": (cfg.t0_window, 0)})
+    cands = load_event_calendar(db_path).merge(feats.drop(columns="code"), on="event_id", how="left")
+    return cands.dropna(subset=["date_0"]).reset_index(drop=True)
+
+
+def _window_vwaps(ticks, window):
+    if ticks is None or not len(ticks):
+        return pd.DataFrame(columns=["code", "date", "vwap"])
+    vwap = compute_vwap(ticks, build_bucket_index(ticks, window))
+    vwap["code"] = vwap["code"].astype(str)
+    return vwap[["code", "date", "vwap"]]
+
+
+def attach_fills(cands, db_path, cfg=StrategyConfig(), tick_store_dir=None):
+    """
+    所有候選事件的進場價 (T0 entry 時段 VWAP) 與出場價 (T+hold_days exit 時段 VWAP)。
+    tick_store_dir 有值時讀 parquet (時段條件推到 row group)，否則讀 day_ticks 的那幾天。
+    """
+    entry_w = session_window("entry", *cfg.entry)
+    exit_w = session_window("exit", *cfg.exit)
+    exit_col = f"date_{cfg.hold_days}"
+    legs = [("entry_price", "date_0", "day_0", entry_w), ("exit_price", exit_col, f"day_{cfg.hold_days}", exit_w)]
+
+    out = cands.copy()
+    ticks = None
+    if not tick_store_dir:
+        # 進出場兩天的 ticks 一次讀、一次排序，兩個時段共用
+        day_ids = pd.concat([cands[day_col] for _, _, day_col, _ in legs]).dropna().unique()
+        df = read_day_ticks(db_path, columns=("code", "ts", "close", "volume"), day_ids=day_ids)
+        ticks = sort_ticks(df, columns=("close", "volume")) if len(df) else None
+
+    for price_col, date_col, _, window in legs:
+        need = cands[["code", date_col]].dropna()
+        if tick_store_dir:
+            df = read_ticks(
+                tick_store_dir, codes=need["code"].unique(), dates=need[date_col].unique(),
+                start=window.start, end=window.end, columns=["code", "ts", "close", "volume"],
+            )
+            ticks = sort_ticks(df, columns=("close", "volume")) if len(df) else None
+        vwap = _window_vwaps(ticks, window).rename(columns={"date": date_col, "vwap": price_col})
+        vwap[date_col] = vwap[date_col].dt.strftime("%Y-%m-%d")
+        out = out.merge(vwap, on=["code", date_col], how="left")
+    return out
+
+
+# ==========================================
+# 2. 選股與損益
+# ==========================================
+def select_trades(cands, cfg=StrategyConfig(), start=None, end=None):
+    """兩層濾網 + 每個 T0 取 ip_t0 最高的 top_n 檔"""
+    pool = cands[(cands["ip_t1"] < cfg.t1_below) & (cands["ip_t0"] >= cfg.t0_min) & apply_filters(cands, cfg.filters)]
+    if start is not None:
+        pool = pool[pool["date_0"] >= str(pd.Timestamp(start).date())]
+    if end is not None:
+        pool = pool[pool["date_0"] <= str(pd.Timestamp(end).date())]
+    rank = pool.groupby("date_0")["ip_t0"].rank(method="first", ascending=False)
+    return pool[rank <= cfg.top_n].sort_values(["date_0", "ip_t0"], ascending=[True, False]).reset_index(drop=True)
+
+
+@dataclass
+class BacktestResult:
+    trades: pd.DataFrame
+    daily: pd.DataFrame
+    summary: dict
+
+
+def run_backtest(trades, cfg=StrategyConfig()):
+    """
+    trades 需有 date_0、entry_price、exit_price。
+    沒有進場或出場價的交易不成交 (filled = False)，當天資金只分給成交的檔數。
+    """
+    trades = trades.copy()
+    trades["filled"] = (trades["entry_price"] > 0) & (trades["exit_price"] > 0)
+    filled = trades["filled"].to_numpy()
+    n_day = trades.loc[filled].groupby("date_0")["code"].transform("size")
+    trades["alloc"] = 0.0
+    trades.loc[filled, "alloc"] = cfg.capital / n_day
+
+    entry, exit_ = trades["entry_price"], trades["exit_price"]
+    trades["gross_ret"] = np.where(filled, exit_ / entry - 1, np.nan)
+    trades["net_ret"] = np.where(filled, exit_ * (1 - cfg.sell_cost) / (entry * (1 + cfg.buy_cost)) - 1, np.nan)
+    trades["gross_pnl"] = trades["alloc"] * trades["gross_ret"].fillna(0)
+    trades["pnl"] = trades["alloc"] * trades["net_ret"].fillna(0)
+
+    daily = trades[trades["filled"]].groupby("date_0").agg(
+        n_trades=("code", "size"), gross_pnl=("gross_pnl", "sum"), pnl=("pnl", "sum"),
+    ).reset_index().rename(columns={"date_0": "date"})
+    daily["ret"] = daily["pnl"] / cfg.capital
+    daily["cum_pnl"] = daily["pnl"].cumsum()
+    daily["cum_gross_pnl"] = daily["gross_pnl"].cumsum()
+    return BacktestResult(trades=trades, daily=daily, summary=summarize(trades, daily))
+
+
+def summarize(trades, daily):
+    filled = trades[trades["filled"]]
+    ret = daily["ret"]
+    return {
+        "n_days": len(daily),
+        "n_trades": len(filled),
+        "n_unfilled": int((~trades["filled"]).sum()),
+        "total_pnl": float(daily["pnl"].sum()),
+        "total_gross_pnl": float(daily["gross_pnl"].sum()),
+        "hit_rate": float((filled["net_ret"] > 0).mean()) if len(filled) else np.nan,
+        "avg_trade_ret": float(filled["net_ret"].mean()) if len(filled) else np.nan,
+        # 只以有交易的日子計算 (沒交易的日子資金閒置)
+        "sharpe": float(ret.mean() / ret.std() * np.sqrt(252)) if len(ret) > 1 and ret.std() > 0 else np.nan,
+        "max_drawdown": float((daily["cum_pnl"].cummax().clip(lower=0) - daily["cum_pnl"]).max()) if len(daily) else 0.0,
+    }
+
+
+def backtest(db_path, cfg=StrategyConfig(), tick_store_dir=None, start=None, end=None, features=None):
+    """features：FeatureStore，cfg.filters 用到的特徵以 T0 (date_0) 當下已知的值 attach"""
+    cands = load_candidates(db_path, cfg)
+    if features is not None:
+        cands = features.attach(cands, "code", "date_0")
+    cands = attach_fills(cands, db_path, cfg, tick_store_dir)
+    return run_backtest(select_trades(cands, cfg, start, end), cfg)
+
+
+def plot_equity(daily, path, title="法說會策略累積損益"):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(12, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    dates = pd.to_datetime(daily["date"])
+    ax.plot(dates, daily["cum_gross_pnl"], color='gray', linewidth=1.5, label='未扣成本')
+    ax.plot(dates, daily["cum_pnl"], color='#1f77b4', linewidth=2, label='已扣成本')
+    ax.axhline(y=0, color='gray', linestyle='-', linewidth=0.5)
+    ax.set_title(title, fontsize=16)
+    ax.set_ylabel('累積損益 (元)', fontsize=12)
+    ax.legend(loc='best')
+    ax.grid(True, alpha=0.3)
+    fig.savefig(path)
+    return path
+
+
+if __name__ == "__main__":
+    BASE_DIR = r"D:\我才不要走量化"
+    db_path = os.path.join(BASE_DIR, "Data_Warehouse", "event01.db")
+    tick_store_dir = os.path.join(BASE_DIR, "Data_Warehouse", "ticks_parquet")
+    feature_store_dir = os.path.join(BASE_DIR, "Data_Warehouse", "feature_store")
+    out_dir = os.path.join(BASE_DIR, "法說會", "Backtest")
+    os.makedirs(out_dir, exist_ok=True)
+
+    features = None
+    cfg = StrategyConfig()
+    if os.path.isdir(feature_store_dir):
+        from feature_store import README_FILTERS, FeatureStore
+        features = FeatureStore.load(feature_store_dir)
+        cfg = StrategyConfig(filters=README_FILTERS)
+    t0 = time.perf_counter()
+    result = backtest(db_path, cfg, tick_store_dir if os.path.isdir(tick_store_dir) else None,
+                      start="2021-01-01", end="2025-06-30", features=features)
+    print(f"⏱️ 回測耗時 {time.perf_counter() - t0:.2f} 秒")
+    for k, v in result.summary.items():
+        print(f"  {k}: {v}")
+
+    result.trades.to_csv(os.path.join(out_dir, "trades.csv"), index=False, encoding="utf-8-sig")
+    result.daily.to_csv(os.path.join(out_dir, "daily_pnl.csv"), index=False, encoding="utf-8-sig")
+    plot_equity(result.daily, os.path.join(out_dir, "equity.png"))
+    print(f"📂 請查看資料夾：{out_dir}")
@@ -0,0 +1,321 @@
+import contextlib
+import io
+import logging
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from car_engine import build_ar_panel
+from car_render import render_car_charts, set_chinese_font
+from oib_lambda import build_bucket_index, compute_lambda, compute_oib, encode_side, sort_ticks
+from tick_writer import TickWriter, read_day_ticks
+from trade_sign import SIGN_COLUMNS, classify
+
+# ==========================================
+# 效能基準：合成台股 tick / 事件 / 異常報酬 + 各階段計時
+# ==========================================
+# 不需要永豐帳號，也不需要 D:\ 的資料，全部以固定 seed 產生 (同參數每次結果相同)：
+#   synthetic_ticks : 證交所交易時段 — 9:00:00 開盤集合競價、9:00~13:25 逐筆、13:30:00 收盤集合競價
+#                     集合競價 tick_type = 0，逐筆為 1 (外盤) / 2 (內盤)，少數 0 (未知)
+#                     每分鐘強度 = U 型日內曲線 × gamma 分配的突發倍數 (多數分鐘冷清、少數爆量)，
+#                     單筆張數為 Pareto 厚尾且在爆量分鐘放大；買賣方向有持續性，價格依升降單位跳動
+#   synthetic_events: TMBA_Events_Master.csv 格式 (Code, Name, Date, Time, Location)
+#   synthetic_ar    : (Code, Date, Abnormal_Return)，t 分配厚尾
+# 計時的階段：DB 寫入、DB 讀取、side 編碼、trade sign、排序、OIB、lambda、CAR 取值、CAR 畫圖。
+# 每個階段取 repeat 次中最快的秒數 (DB 寫入 / 讀取只跑一次)，另跑一次 tracemalloc 量峰值記憶體
+# (Python 與 numpy 的配置，不含 SQLite 內部，所以 DB 寫入不量)。scaling = log(秒數比) / log(資料量比)，相對前一個 scale：≈ 1 為線性，明顯 > 1 就是退化。
+
+TWSE_OPEN_S = 9 * 3600
+CONTINUOUS_END_S = 13 * 3600 + 25 * 60
+TWSE_CLOSE_S = 13 * 3600 + 30 * 60
+N_MINUTES = (CONTINUOUS_END_S - TWSE_OPEN_S) // 60
+
+SCALES = {
+    "small": dict(n_codes=50, n_days=5, ticks_per_day=1_000, n_events=100),
+    "medium": dict(n_codes=200, n_days=10, ticks_per_day=2_000, n_events=1_000),
+    "large": dict(n_codes=400, n_days=20, ticks_per_day=2_000, n_events=5_000),
+}
+CAR_WINDOWS = [(-5, 5), (-2, 2), (-1, 1), (0, 2), (0, 1), (-1, 2)]
+
+
+# ==========================================
+# 1. 合成資料
+# ==========================================
+def tick_size(price):
+    """證交所股票升降單位"""
+    return np.select(
+        [price < 10, price < 50, price < 100, price < 500, price < 1000],
+        [0.01, 0.05, 0.1, 0.5, 1.0],
+        5.0,
+    )
+
+
+def _intraday_shape():
+    """9:00~13:25 每分鐘的相對強度：開盤最熱、收盤前回升"""
+    x = np.arange(N_MINUTES) / (N_MINUTES - 1)
+    return 1 + 4 * (1 - x) ** 10 + 1.5 * x ** 8
+
+
+def _group_cumsum(values, starts):
+    """各組 (starts 為每組第一列) 內的累加"""
+    c = np.cumsum(values)
+    sizes = np.diff(np.r_[starts, len(values)])
+    base = np.repeat(c[starts] - values[starts], sizes)
+    return c - base
+
+
+def trading_days(start, n_days):
+    return pd.bdate_range(start, periods=n_days)
+
+
+def synthetic_codes(n_codes):
+    return np.array([str(1101 + i) for i in range(n_codes)])
+
+
+def synthetic_ticks(n_codes=50, n_days=5, ticks_per_day=1_000, seed=0, start="2021-01-04"):
+    """
+    回傳依 (code, ts) 排序的 DataFrame：code, ts, close, volume (張), bid_price, ask_price, tick_type
+    以及每個 (code, 日期) 的起點 starts (寫入 DB 時切段用)。
+    """
+    rng = np.random.default_rng(seed)
+    codes = synthetic_codes(n_codes)
+    days = trading_days(start, n_days)
+    G = n_codes * n_days
+    g_code = np.repeat(np.arange(n_codes), n_days)
+    g_day = np.tile(np.arange(n_days), n_codes)
+
+    # 每檔活躍度不同；逐筆筆數 ~ Poisson
+    activity = rng.lognormal(0.0, 0.8, n_codes)
+    n_cont = rng.poisson(ticks_per_day * activity / activity.mean())[g_code] + 1
+    # 每分鐘強度 = U 型 × gamma(0.3) 突發 (平均 1、變異很大)
+    burst = rng.gamma(0.3, 1 / 0.3, (G, N_MINUTES))
+    w = _intraday_shape() * burst
+    cdf = np.cumsum(w, axis=1)
+    cdf /= cdf[:, -1:]
+    grp = np.repeat(np.arange(G), n_cont)
+    minute = np.searchsorted((cdf + np.arange(G)[:, None]).ravel(), grp + rng.random(len(grp)), side="right")
+    minute = np.minimum(minute - grp * N_MINUTES, N_MINUTES - 1)
+    sec_ms = (TWSE_OPEN_S + minute * 60) * 1000 + rng.integers(0, 60_000, len(grp))
+    sec_ms = np.maximum(sec_ms, TWSE_OPEN_S * 1000 + 1)    # 9:00:00.000 留給開盤集合競價
+    intensity = burst[grp, minute]
+
+    # 加上開盤、收盤集合競價各一筆
+    auction_grp = np.repeat(np.arange(G), 2)
+    auction_ms = np.tile([TWSE_OPEN_S * 1000, TWSE_CLOSE_S * 1000], G)
+    grp = np.r_[grp, auction_grp]
+    ms = np.r_[sec_ms, auction_ms]
+    auction = np.r_[np.zeros(len(sec_ms), bool), np.ones(len(auction_ms), bool)]
+    intensity = np.r_[intensity, np.full(len(auction_ms), 20.0)]
+    order = np.lexsort((ms, grp))
+    grp, ms, auction, intensity = grp[order], ms[order], auction[order], intensity[order]
+    K = len(grp)
+    starts = np.flatnonzero(np.r_[True, grp[1:] != grp[:-1]])
+
+    # 買賣方向：每筆 30% 機率換邊 (order flow 有持續性)
+    flips = (rng.random(K) < 0.3).astype(np.int64)
+    flips[starts] = 0
+    parity = _group_cumsum(flips, starts) % 2
+    first = np.where(rng.random(G) < 0.5, 1, -1)
+    side = first[grp] * np.where(parity == 0, 1, -1)
+    tick_type = np.where(side > 0, 1, 2)
+    tick_type[auction | (rng.random(K) < 0.02)] = 0
+
+    # 價格：每檔基準價 + 日間隨機漫步；日內依方向以升降單位跳動 (40% 機率變價)
+    base = np.exp(rng.normal(np.log(60), 1.0, n_codes)).clip(10, 1500)
+    daily = base[g_code] * np.exp(_group_cumsum(rng.normal(0, 0.02, G), np.arange(0, G, n_days)))
+    tick = tick_size(daily)
+    open_px = np.round(daily / tick) * tick
+    move = np.where(rng.random(K) < 0.4, side, 0)
+    move[starts] = 0
+    close = open_px[grp] + _group_cumsum(move, starts) * tick[grp]
+    close = np.maximum(close, tick[grp])
+
+    # 張數：Pareto 厚尾，爆量分鐘放大；集合競價量較大
+    volume = np.ceil((rng.pareto(1.3, K) + 1) * np.sqrt(intensity)).clip(1, 5_000)
+
+    spread = tick[grp]
+    bid = np.where(tick_type == 2, close, close - spread)
+    ask = np.where(tick_type == 2, close + spread, close)
+    day_ns = days.to_numpy(dtype="datetime64[ns]").view("int64")[g_day]
+    ts = (day_ns[grp] + ms * 1_000_000).view("datetime64[ns]")
+    df = pd.DataFrame({
+        "code": codes[g_code[grp]],
+        "ts": ts,
+        "close": np.round(close, 2),
+        "volume": volume,
+        "bid_price": np.round(bid, 2),
+        "ask_price": np.round(ask, 2),
+        "tick_type": tick_type,
+    })
+    return df, starts
+
+
+def synthetic_events(n_codes=50, n_days=5, n_events=100, seed=0, start="2021-01-04"):
+    """TMBA_Events_Master.csv 格式的事件表；事件日落在 tick 日期範圍內"""
+    rng = np.random.default_rng(seed + 1)
+    codes = synthetic_codes(n_codes)
+    days = trading_days(start, n_days)
+    code = rng.choice(codes, n_events)
+    date = days[rng.integers(0, n_days, n_events)]
+    times = np.array(["08:00", "09:00", "10:00", "14:00", "14:30", "15:00", "16:00"])
+    locations = np.array(["線上法說會", "臺灣證券交易所業績發表會", "元大證券投資論壇", "Morgan Stanley Asia Conference"])
+    return pd.DataFrame({
+        "Code": code,
+        "Name": [f"公司{c}" for c in code],
+        "Date": [f"{d.year}/{d.month}/{d.day}" for d in date],
+        "Time": rng.choice(times, n_events),
+        "Location": rng.choice(locations, n_events),
+    })
+
+
+def synthetic_ar(n_codes=50, n_days=5, seed=0, start="2021-01-04", pad=30):
+    """(Code, Date, Abnormal_Return)；日期前後各多 pad 個交易日，事件視窗不會超出範圍"""
+    rng = np.random.default_rng(seed + 2)
+    codes = synthetic_codes(n_codes)
+    days = pd.bdate_range(end=pd.Timestamp(start) - pd.offsets.BDay(1), periods=pad).append(
+        trading_days(start, n_days + pad))
+    return pd.DataFrame({
+        "Code": np.repeat(codes, len(days)),
+        "Date": np.tile(days, n_codes),
+        "Abnormal_Return": 0.015 * rng.standard_t(4, n_codes * len(days)),
+    })
+
+
+# ==========================================
+# 2. 計時
+# ==========================================
+def measure(fn, repeat=3, memory=True):
+    """回傳 (最快秒數, 峰值 MB, 最後一次的回傳值)"""
+    best = np.inf
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    peak = np.nan
+    if memory:
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return best, peak, out
+
+
+def run_scale(name, n_codes, n_days, ticks_per_day, n_events, workdir, repeat=3, max_charts=100, seed=0,
+              memory=True):
+    rows = []
+
+    def record(stage, unit, n, fn, repeat=repeat, memory=memory):
+        seconds, peak, out = measure(fn, repeat, memory)
+        rows.append(dict(scale=name, stage=stage, n_items=n, unit=unit, seconds=seconds,
+                         throughput=n / seconds if seconds > 0 else np.nan, peak_mb=peak))
+        print(f"  ⏱️ {stage:<13} {n:>12,} {unit:<7} {seconds:8.3f} 秒  {n / max(seconds, 1e-12):>14,.0f} /秒  "
+              f"峰值 {peak:8.1f} MB")
+        return out
+
+    # --- 合成資料 ---
+    t0 = time.perf_counter()
+    df, starts = synthetic_ticks(n_codes, n_days, ticks_per_day, seed)
+    events = synthetic_events(n_codes, n_days, n_events, seed)
+    ar = synthetic_ar(n_codes, n_days, seed)
+    rows.append(dict(scale=name, stage="generate", n_items=len(df), unit="ticks",
+                     seconds=time.perf_counter() - t0, throughput=np.nan, peak_mb=np.nan))
+    print(f"🧪 {name}：{n_codes} 檔 × {n_days} 天，{len(df):,} 筆 tick，{n_events:,} 場事件")
+
+    # --- DB 寫入：每個 (code, 日期) 一場 event，與 抓tickdata.py 的寫入路徑相同 ---
+    bounds = np.r_[starts, len(df)]
+    days = [(df["code"].iat[a], df["ts"].iat[a].strftime("%Y-%m-%d"), df.iloc[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+    db_runs = iter(range(10**9))
+
+    def write_db():
+        path = os.path.join(workdir, f"{name}_{next(db_runs)}.db")
+        writer = TickWriter(path, batch_days=50)
+        for code, day, part in days:
+            writer.add_event(f"{code}_{day}", code, day, "14:30", [(day, 0, part)])
+        writer.close()
+        return path
+
+    db_path = record("db_write", "ticks", len(df), write_db, repeat=1, memory=False)
+    ticks_df = record("db_read", "ticks", len(df),
+                      lambda: read_day_ticks(db_path, columns=("code", "ts", "close", "volume", "side")), repeat=1)
+    record("side_encode", "ticks", len(df), lambda: encode_side(df["tick_type"]))
+    ticks = record("sort", "ticks", len(df), lambda: sort_ticks(ticks_df, columns=("close", "volume", "side")))
+
+    signed = sort_ticks(df.assign(side=encode_side(df["tick_type"])), columns=SIGN_COLUMNS)
+    record("trade_sign", "ticks", len(df), lambda: classify(signed, "lee_ready"))
+
+    index = build_bucket_index(ticks, "30min")
+    record("oib", "ticks", len(df), lambda: compute_oib(ticks, build_bucket_index(ticks, "30min")))
+    record("lambda", "ticks", len(df), lambda: compute_lambda(ticks, index))
+
+    # --- CAR：異常報酬表攤平 + 所有事件一次取 6 個視窗 ---
+    def gather():
+        panel = build_ar_panel(ar)
+        loc = panel.locate(events["Code"], pd.to_datetime(events["Date"], format="%Y/%m/%d"))
+        return {w: panel.car(loc, w) for w in CAR_WINDOWS}
+
+    cars = record("car_gather", "events", n_events * len(CAR_WINDOWS), gather)
+
+    # --- 畫圖：單一 process，全部重畫 ---
+    res = cars[(-5, 5)]
+    ok = np.flatnonzero(res.ok)[:max_charts]
+    res_sub = type(res)(rel_days=res.rel_days, ar=res.ar[ok], car=res.car[ok], reason=res.reason[ok])
+    ev_sub = events.iloc[ok].reset_index(drop=True)
+    chart_dir = os.path.join(workdir, f"{name}_charts")
+    os.makedirs(chart_dir, exist_ok=True)
+    set_chinese_font()
+
+    def render():
+        # 沒有中文字型的機器會一直警告缺字
+        with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+            warnings.simplefilter("ignore")
+            return render_car_charts(res_sub, ev_sub, chart_dir, workers=1, force=True)
+
+    logging.getLogger("matplotlib.font_manager").setLevel(logging.ERROR)
+
+    record("chart_render", "charts", len(ok), render)
+    return rows
+
+
+def add_scaling(report):
+    """每個階段相對前一個 scale 的 log(秒數比) / log(資料量比)"""
+    report = report.copy()
+    report["scaling"] = np.nan
+    for _, g in report.groupby("stage", sort=False):
+        t, n = g["seconds"].to_numpy(), g["n_items"].to_numpy(dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scaling = np.log(t[1:] / t[:-1]) / np.log(n[1:] / n[:-1])
+        report.loc[g.index[1:], "scaling"] = np.where(n[1:] != n[:-1], scaling, np.nan)
+    return report
+
+
+def run_benchmark(scales=("small", "medium"), repeat=3, max_charts=100, seed=0, workdir=None, memory=True,
+                  keep_files=False):
+    """回傳 DataFrame：scale, stage, n_items, unit, seconds, throughput, peak_mb, scaling"""
+    workdir = workdir or tempfile.mkdtemp(prefix="event_trade_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    rows = []
+    try:
+        for name in scales:
+            rows += run_scale(name, workdir=workdir, repeat=repeat, max_charts=max_charts, seed=seed,
+                              memory=memory, **SCALES[name])
+    finally:
+        if not keep_files:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return add_scaling(pd.DataFrame(rows))
+
+
+if __name__ == "__main__":
+    SCALES_TO_RUN = ("small", "medium", "large")
+    out_path = os.path.join(tempfile.gettempdir(), "event_trade_benchmark.csv")
+
+    report = run_benchmark(SCALES_TO_RUN)
+    print(report.to_string(index=False, float_format=lambda v: f"{v:,.3f}"))
+    report.to_csv(out_path, index=False, encoding="utf-8-sig")
+    print(f"📂 結果：{out_path}")
@@ -0,0 +1,121 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# ==========================================
+# 分組彙總 CAR (五爪圖)
+# ==========================================
+# 取代「每個事件一張 PNG」：事件依某個欄位 (預設 T0 9:00~9:30 info_pressure) 的分位數分組，
+# 每組算平均 / 中位數 CAR 路徑、t 值與 bootstrap 信賴區間，每組一張圖，數字另存 CSV 方便跨次比較。
+# bootstrap 以多項分配權重一次抽 block 組：boot_mean = W @ CAR / n (W: block × n)，不逐次重抽 DataFrame。
+
+SUMMARY_COLS = ["group", "rel_day", "n", "mean", "median", "std", "t_stat", "ci_low", "ci_high"]
+
+
+def quantile_groups(values, n_groups=5):
+    """依分位數切成 1..n_groups 組 (1 = 最小)，缺值為 0"""
+    v = pd.Series(np.asarray(values, dtype=float))
+    out = np.zeros(len(v), dtype=np.int64)
+    ok = v.notna().to_numpy()
+    if ok.sum() >= n_groups:
+        out[ok] = pd.qcut(v[ok], n_groups, labels=False, duplicates="drop").to_numpy() + 1
+    return out
+
+
+def bootstrap_mean_ci(car, n_boot=2000, ci=0.95, seed=0, block=250):
+    """car: events × 相對天數；回傳 (ci_low, ci_high)，各為長度 = 相對天數的陣列"""
+    n = len(car)
+    rng = np.random.default_rng(seed)
+    means = np.empty((n_boot, car.shape[1]))
+    p = np.full(n, 1.0 / n)
+    for s in range(0, n_boot, block):
+        b = min(block, n_boot - s)
+        means[s:s + b] = rng.multinomial(n, p, size=b) @ car / n
+    alpha = (1 - ci) / 2
+    return np.quantile(means, alpha, axis=0), np.quantile(means, 1 - alpha, axis=0)
+
+
+def aggregate_car(res, groups, n_boot=2000, ci=0.95, seed=0):
+    """
+    res    : car_engine.CarResult
+    groups : 每個事件的組別 (<= 0 表示不納入)
+    回傳 long format：每組每個相對天一列 (SUMMARY_COLS)
+    """
+    groups = np.asarray(groups)
+    keep = res.ok & (groups > 0)
+    parts = []
+    for g in np.unique(groups[keep]):
+        car = res.car[keep & (groups == g)]
+        n = len(car)
+        mean = car.mean(axis=0)
+        std = car.std(axis=0, ddof=1) if n > 1 else np.full(car.shape[1], np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_stat = mean / (std / np.sqrt(n))
+        lo, hi = bootstrap_mean_ci(car, n_boot=n_boot, ci=ci, seed=seed + int(g))
+        parts.append(pd.DataFrame({
+            "group": int(g), "rel_day": res.rel_days, "n": n,
+            "mean": mean, "median": np.median(car, axis=0), "std": std,
+            "t_stat": t_stat, "ci_low": lo, "ci_high": hi,
+        }))
+    if not parts:
+        return pd.DataFrame(columns=SUMMARY_COLS)
+    return pd.concat(parts, ignore_index=True)
+
+
+# ==========================================
+# 輸出
+# ==========================================
+def _group_figure():
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.axvline(x=0, color='red', linestyle='--', alpha=0.8)
+    ax.axhline(y=0, color='gray', linestyle='-', linewidth=0.5)
+    ax.set_xlabel('相對天數', fontsize=12)
+    ax.set_ylabel('累積異常報酬 (CAR)', fontsize=12)
+    ax.grid(True, alpha=0.3)
+    return fig, ax
+
+
+def render_group_charts(summary, output_folder, label, ci=0.95):
+    """每組一張 (平均、中位數、信賴區間)，再加一張各組平均疊在一起的總覽；回傳檔案路徑"""
+    os.makedirs(output_folder, exist_ok=True)
+    paths = []
+    for g, d in summary.groupby("group"):
+        fig, ax = _group_figure()
+        ax.fill_between(d["rel_day"], d["ci_low"], d["ci_high"], color='#1f77b4', alpha=0.2,
+                        label=f'{ci:.0%} bootstrap CI')
+        ax.plot(d["rel_day"], d["mean"], marker='o', color='#1f77b4', linewidth=2, label='平均 CAR')
+        ax.plot(d["rel_day"], d["median"], marker='s', color='#ff7f0e', linestyle='--', label='中位數 CAR')
+        last = d.iloc[-1]
+        ax.set_title(f"{label} 第 {g} 組 (n={int(last['n'])})\n"
+                     f"末日平均 CAR {last['mean']:.2%}，t = {last['t_stat']:.2f}", fontsize=16)
+        ax.legend(loc='best')
+        path = os.path.join(output_folder, f"CAR_group_{g}.png")
+        fig.savefig(path)
+        paths.append(path)
+
+    fig, ax = _group_figure()
+    for g, d in summary.groupby("group"):
+        ax.plot(d["rel_day"], d["mean"], marker='o', linewidth=2, label=f'第 {g} 組 (n={int(d["n"].iloc[0])})')
+    ax.set_title(f"{label} 各組平均 CAR", fontsize=16)
+    ax.legend(loc='best')
+    path = os.path.join(output_folder, "CAR_groups.png")
+    fig.savefig(path)
+    paths.append(path)
+    return paths
+
+
+def save_group_summary(summary, path, **run_info):
+    """附加到同一個 CSV (每次執行標上 run_at 與設定)，方便比較不同次的結果"""
+    out = summary.copy()
+    out.insert(0, "run_at", datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    # 設定收成一欄，欄位數固定，不同設定也能附加到同一個檔案
+    out.insert(1, "config", "; ".join(f"{k}={v}" for k, v in run_info.items()))
+    header = not os.path.exists(path)
+    out.to_csv(path, mode="a", header=header, index=False, encoding="utf-8-sig" if header else "utf-8")
+    return path
@@ -0,0 +1,226 @@
+import os
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from oib_lambda import DAY_NS
+
+# ==========================================
+# 向量化事件研究 CAR 引擎
+# ==========================================
+# 1. build_ar_panel：異常報酬表依 (code, date) 排序一次，攤平成一條陣列 + 每檔股票的 offsets，
+#    等同一個 (code × 該股第幾個交易日) 的矩陣 (各股長度不同，不補 NaN)。
+# 2. ARPanel.locate：所有事件一次 searchsorted 成整數位置 (flat 位置 + 在該股中的第幾天)。
+# 3. ARPanel.car：位置 + arange(a, b+1) 一次 fancy indexing 取出所有事件的 [a, b] 視窗，
+#    沿 axis=1 cumsum 即為 CAR。換視窗只重做這一步，不必重新對表。
+# 相對日以「該股票自己的交易日」計算，與原本 stock_data.iloc[loc - k : loc + k + 1] 相同。
+# 被跳過的事件不再靜默丟掉，每一筆都有 reason code。
+
+OK = 0
+NO_CODE = 1
+NO_DATE = 2
+OUT_OF_RANGE = 3
+NAN_AR = 4
+BAD_INPUT = 5
+
+REASONS = {
+    OK: "ok",
+    NO_CODE: "代碼不在異常報酬表",
+    NO_DATE: "事件日不是該股交易日",
+    OUT_OF_RANGE: "視窗超出資料範圍",
+    NAN_AR: "視窗內有缺值",
+    BAD_INPUT: "日期或代碼格式錯誤",
+}
+
+
+def normalize_code(codes):
+    """CSV 讀進來的代碼可能是 int 或 str，一律轉成去空白的字串"""
+    s = pd.Series(codes)
+    s = s.where(s.isna(), s.astype(str).str.strip().str.replace(r"\.0$", "", regex=True))
+    return s.to_numpy(dtype=object)
+
+
+def to_day(dates):
+    """日期 → 自 1970-01-01 起的天數 (int64)；無法解析的回傳 -1 並標記為無效"""
+    d = pd.to_datetime(pd.Series(dates), errors="coerce")
+    valid = d.notna().to_numpy()
+    ns = d.to_numpy(dtype="datetime64[ns]").view("int64")
+    return np.where(valid, ns // DAY_NS, -1), valid
+
+
+# ==========================================
+# 1. 異常報酬矩陣
+# ==========================================
+@dataclass
+class ARPanel:
+    """
+    codes  : 排序後的股票代碼 (str)
+    starts : 長度 n_codes + 1，第 i 檔股票的資料在 [starts[i], starts[i+1])
+    day    : 每筆的日期 (自 1970 起的天數)，各股內遞增
+    ar     : 每筆的異常報酬
+    """
+    codes: np.ndarray
+    starts: np.ndarray
+    day: np.ndarray
+    ar: np.ndarray
+
+    @property
+    def n_codes(self):
+        return len(self.codes)
+
+    def _key(self, code_idx, day):
+        # (code, day) 合成單一遞增整數，一次 searchsorted 就能對到位置；
+        # 超出資料日期範圍的事件日被夾到 0 或 span - 1，不會撞到相鄰股票
+        lo, hi = (self.day.min(), self.day.max()) if len(self.day) else (0, 0)
+        span = hi - lo + 3
+        return code_idx * span + np.clip(day - lo + 1, 0, span - 1)
+
+    def locate(self, codes, dates, align="exact"):
+        """
+        事件 → 整數位置。
+        align="exact"：事件日必須是該股交易日 (原本的邏輯)
+        align="next" ：不是交易日就對到之後最近的交易日
+        """
+        codes = normalize_code(codes)
+        day, valid = to_day(dates)
+        valid = valid & pd.notna(codes)
+        codes = np.where(valid, codes, "").astype(str)
+        n = len(codes)
+        reason = np.full(n, NO_CODE, dtype=np.int8)
+        reason[~valid] = BAD_INPUT
+        if self.n_codes == 0:
+            zeros = np.zeros(n, dtype=np.int64)
+            return EventIndex(pos=zeros, row=zeros, length=zeros, reason=reason)
+
+        code_idx = np.minimum(np.searchsorted(self.codes, codes), self.n_codes - 1)
+        has_code = valid & (self.codes[code_idx] == codes)
+        seg_start, seg_end = self.starts[code_idx], self.starts[code_idx + 1]
+
+        panel_key = self._key(np.repeat(np.arange(self.n_codes), np.diff(self.starts)), self.day)
+        event_key = self._key(code_idx, day)
+        pos = np.searchsorted(panel_key, event_key)
+        hit = has_code & (pos < seg_end)
+        if align == "exact":
+            hit &= panel_key[np.minimum(pos, len(panel_key) - 1)] == event_key
+
+        reason[has_code] = NO_DATE
+        reason[hit] = OK
+        return EventIndex(pos=pos, row=pos - seg_start, length=seg_end - seg_start, reason=reason)
+
+    def car(self, events, window=(-5, 5)):
+        """所有事件的 [a, b] 視窗一次取出並 cumsum；回傳 CarResult"""
+        a, b = window
+        rel = np.arange(a, b + 1)
+        ok = (events.reason == OK) & (events.row + a >= 0) & (events.row + b < events.length)
+        idx = np.where(ok, events.pos, 0)[:, None] + rel[None, :]
+        ar = self.ar[np.clip(idx, 0, max(len(self.ar) - 1, 0))] if len(self.ar) else np.zeros(idx.shape)
+        ar = np.where(ok[:, None], ar, np.nan)
+
+        reason = events.reason.copy()
+        reason[(reason == OK) & ~ok] = OUT_OF_RANGE
+        has_nan = ok & np.isnan(ar).any(axis=1)
+        reason[has_nan] = NAN_AR
+        ar[has_nan] = np.nan
+        return CarResult(rel_days=rel, ar=ar, car=np.cumsum(ar, axis=1), reason=reason)
+
+
+def build_ar_panel(df, code_col="Code", date_col="Date", ar_col="Abnormal_Return"):
+    codes = normalize_code(df[code_col]).astype(str)
+    day, valid = to_day(df[date_col])
+    ar = pd.to_numeric(df[ar_col], errors="coerce").to_numpy(dtype=float)
+    codes, day, ar = codes[valid], day[valid], ar[valid]
+
+    code_id, uniques = pd.factorize(codes, sort=True)
+    order = np.lexsort((day, code_id))
+    code_id, day, ar = code_id[order], day[order], ar[order]
+    # 同一天重複的列只留第一筆
+    keep = np.ones(len(day), dtype=bool)
+    keep[1:] = (code_id[1:] != code_id[:-1]) | (day[1:] != day[:-1])
+    code_id, day, ar = code_id[keep], day[keep], ar[keep]
+
+    starts = np.zeros(len(uniques) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(code_id, minlength=len(uniques)), out=starts[1:])
+    return ARPanel(codes=np.asarray(uniques, dtype=str), starts=starts, day=day, ar=ar)
+
+
+def read_ar_table(path_model):
+    """
+    異常報酬表 → DataFrame (Code, Date datetime, Abnormal_Return, ...)
+    .csv：TEJ 匯出的 final_model_complete.csv (Date=%Y%m%d)；.parquet：ar_model.save_ar_parquet 的輸出
+    """
+    if path_model.endswith(".parquet"):
+        df = pd.read_parquet(path_model)
+        df["Code"] = df["Code"].astype(str)
+        df["Date"] = pd.to_datetime(df["Date"])
+        return df
+    df = pd.read_csv(path_model)
+    if "StockCode" in df.columns:
+        df = df.rename(columns={"StockCode": "Code"})
+    df["Date"] = pd.to_datetime(df["Date"].astype(str), format="%Y%m%d", errors="coerce")
+    return df
+
+
+def load_ar_panel(path_model):
+    """final_model_complete.csv 或 ar_model 產生的 parquet"""
+    return build_ar_panel(read_ar_table(path_model))
+
+
+# ==========================================
+# 2. 結果
+# ==========================================
+@dataclass
+class EventIndex:
+    """每個事件：pos = 在 ARPanel 的 flat 位置，row = 該股第幾個交易日，length = 該股資料長度"""
+    pos: np.ndarray
+    row: np.ndarray
+    length: np.ndarray
+    reason: np.ndarray
+
+
+@dataclass
+class CarResult:
+    """
+    rel_days : 相對天數 a..b
+    ar / car : events × 相對天數；被跳過的事件整列為 NaN
+    reason   : 每個事件的 reason code (OK 才有值)
+    """
+    rel_days: np.ndarray
+    ar: np.ndarray
+    car: np.ndarray
+    reason: np.ndarray
+
+    @property
+    def ok(self):
+        return self.reason == OK
+
+    @property
+    def final(self):
+        """每個事件視窗末端的 CAR"""
+        return self.car[:, -1]
+
+    def reason_counts(self):
+        counts = pd.Series(self.reason).value_counts().sort_index()
+        counts.index = [REASONS[r] for r in counts.index]
+        return counts
+
+
+def sweep_windows(panel, events, windows):
+    """多個視窗共用同一份 EventIndex；回傳 {(a, b): CarResult}"""
+    return {tuple(w): panel.car(events, w) for w in windows}
+
+
+if __name__ == "__main__":
+    base_path = r"D:\我才不要走量化\法說會"
+    panel = load_ar_panel(os.path.join(base_path, "final_model_complete.csv"))
+    df_events = pd.read_csv(os.path.join(base_path, "TMBA_Events_Master.csv"))
+    events = panel.locate(df_events["Code"], df_events["Date"])
+
+    # TMBA 建議的視窗
+    for w in [(-5, 5), (-2, 2), (-1, 1), (0, 2), (0, 1), (-1, 2)]:
+        t0 = time.perf_counter()
+        res = panel.car(events, w)
+        ms = (time.perf_counter() - t0) * 1000
+        print(f"CAR{list(w)}：{res.ok.sum()} / {len(res.reason)} 筆，平均 {np.nanmean(res.final):.4%}，耗時 {ms:.2f} ms")
+    print(res.reason_counts())
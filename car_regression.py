@@ -0,0 +1,255 @@
+import os
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from scipy.stats import t as student_t
+
+from car_engine import sweep_windows
+
+# ==========================================
+# 回歸檢定：CAR ~ 資訊指標 (批次求解)
+# ==========================================
+# 原本每個 (時間窗, CAR 視窗, 控制變數) 各跑一次 smf.ols；這裡把很多條回歸式一次解：
+#   資料先攤成一個 (events × 欄位) float 矩陣，每條 RegSpec 只是挑欄位 (y、x、controls，一律含截距)
+#   同樣個數解釋變數的 spec 疊成 S × n × k 的設計矩陣，缺值的列權重為 0 (各 spec 自己的有效樣本)，
+#   X'X、X'y 以 einsum 一次算完，再 batched np.linalg.inv。
+# 標準誤：
+#   pooled OLS：cluster=None → HC1；"date" / "firm" → 依事件日 / 股票 cluster
+#               (列先依 cluster 排序一次，score 以 np.add.reduceat 加總；小樣本修正同 Stata：G/(G-1)·(n-1)/(n-k))
+#   Fama-MacBeth：每期 (事件日，或 fm_freq="M" 依月) 一條橫斷面回歸，係數的時間序列平均；
+#                 nw_lags > 0 時以 Newey-West 調整序列相關。樣本數 <= k 或共線的期數不計入。
+# 輸出一張 tidy 表：spec, y, model, se_type, term, coef, se, t, p, n_obs, n_groups, r2
+
+MODELS = ("pooled", "fama_macbeth")
+
+
+@dataclass(frozen=True)
+class RegSpec:
+    name: str
+    y: str
+    x: tuple
+    controls: tuple = ()
+
+    @property
+    def terms(self):
+        return ("const",) + tuple(self.x) + tuple(self.controls)
+
+
+def spec_grid(targets, features, controls=()):
+    """每個 (CAR 欄位, 指標欄位) 一條：y ~ const + feature + controls"""
+    return [RegSpec(f"{y}~{x}", y, (x,), tuple(controls)) for y in targets for x in features]
+
+
+# ==========================================
+# 1. 資料
+# ==========================================
+def car_columns(windows):
+    return [f"CAR[{a},{b}]" for a, b in windows]
+
+
+def build_regression_data(metrics, panel, car_windows, code_col="code", date_col="event_date"):
+    """
+    metrics : 每個事件一列 (例如 info_metrics.event_metrics 的輸出)
+    panel   : car_engine.ARPanel
+    在 metrics 後面加上各視窗的 CAR 欄位 (CAR[a,b]；被跳過的事件為 NaN)
+    """
+    events = panel.locate(metrics[code_col], metrics[date_col])
+    out = metrics.reset_index(drop=True).copy()
+    for (a, b), res in sweep_windows(panel, events, car_windows).items():
+        out[f"CAR[{a},{b}]"] = res.final
+    return out
+
+
+def _sorted_groups(keys):
+    """依 keys 排序的列順序與每組的起點 (np.add.reduceat 用)"""
+    codes, _ = pd.factorize(pd.Series(keys), sort=True)
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]) if len(codes) else np.zeros(0, int)
+    return order, starts
+
+
+def _design(A, col, specs):
+    """S × n × k 設計矩陣、S × n 的 y 與有效樣本 (缺值列歸零)"""
+    X = np.stack([
+        np.column_stack([np.ones(len(A))] + [A[:, col[c]] for c in s.terms[1:]]) for s in specs
+    ])
+    y = np.stack([A[:, col[s.y]] for s in specs])
+    valid = np.isfinite(y) & np.isfinite(X).all(axis=2)
+    X = np.where(valid[:, :, None], X, 0.0)
+    y = np.where(valid, y, 0.0)
+    return X, y, valid.astype(float)
+
+
+def _batched_inv(A):
+    """(..., k, k) 反矩陣；共線 (det / 對角線乘積 <= 1e-10) 的為 NaN"""
+    k = A.shape[-1]
+    diag = np.prod(np.diagonal(A, axis1=-2, axis2=-1), axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bad = ~(np.linalg.det(A) / diag > 1e-10)
+    A = np.where(bad[..., None, None], np.eye(k), A)
+    inv = np.linalg.inv(A)
+    inv[bad] = np.nan
+    return inv
+
+
+# ==========================================
+# 2. 估計
+# ==========================================
+def _pooled(X, y, v, cluster_starts):
+    S, n, k = X.shape
+    inv = _batched_inv(np.einsum("sni,snj->sij", X, X))
+    coef = np.einsum("sij,sj->si", inv, np.einsum("sni,sn->si", X, y))
+    e = (y - np.einsum("sni,si->sn", X, coef)) * v
+
+    n_obs = v.sum(axis=1)
+    ybar = (y * v).sum(axis=1) / np.maximum(n_obs, 1)
+    tss = (((y - ybar[:, None]) * v) ** 2).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r2 = 1 - (e * e).sum(axis=1) / tss
+
+    u = X * e[:, :, None]
+    if cluster_starts is None:
+        meat = np.einsum("sni,snj->sij", u, u)
+        n_groups = n_obs
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scale = n_obs / (n_obs - k)
+        df = n_obs - k
+    else:
+        U = np.add.reduceat(u, cluster_starts, axis=1)
+        meat = np.einsum("sgi,sgj->sij", U, U)
+        n_groups = (np.add.reduceat(v, cluster_starts, axis=1) > 0).sum(axis=1).astype(float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scale = n_groups / (n_groups - 1) * (n_obs - 1) / (n_obs - k)
+        df = n_groups - 1
+    cov = np.einsum("sij,sjk,skl->sil", inv, meat, inv) * scale[:, None, None]
+    se = np.sqrt(np.clip(np.diagonal(cov, axis1=1, axis2=2), 0.0, None))
+    bad = (n_obs <= k) | (df < 1)
+    coef[bad] = np.nan
+    se[bad] = np.nan
+    return coef, se, df, n_obs, n_groups, r2
+
+
+def _fama_macbeth(X, y, v, period_starts, nw_lags):
+    S, n, k = X.shape
+    XX = np.add.reduceat(X[:, :, :, None] * X[:, :, None, :], period_starts, axis=1)   # S × T × k × k
+    Xy = np.add.reduceat(X * y[:, :, None], period_starts, axis=1)
+    n_t = np.add.reduceat(v, period_starts, axis=1)
+    inv = _batched_inv(XX)
+    b = np.einsum("stij,stj->sti", inv, Xy)
+    ok = (n_t > k) & np.isfinite(b).all(axis=2)
+
+    # 每期的 R²
+    fit = np.einsum("sni,sni->sn", X, np.repeat(b, np.diff(np.r_[period_starts, n]), axis=1))
+    y_t = np.add.reduceat(y, period_starts, axis=1) / np.maximum(n_t, 1)
+    dev = (y - np.repeat(y_t, np.diff(np.r_[period_starts, n]), axis=1)) * v
+    rss = np.add.reduceat(((y - fit) * v) ** 2, period_starts, axis=1)
+    tss = np.add.reduceat(dev ** 2, period_starts, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r2_t = 1 - rss / tss
+    r2_t = np.where(ok & np.isfinite(r2_t), r2_t, np.nan)
+
+    T = ok.sum(axis=1).astype(float)
+    b = np.where(ok[:, :, None], b, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = b.sum(axis=1) / T[:, None]
+        d = np.where(ok[:, :, None], b - mean[:, None, :], 0.0)
+        # 沒有估計值的期數視為 0 偏差；nw_lags = 0 時 var = 樣本變異數 (ddof = 1) / T
+        gamma = (d * d).sum(axis=1) / T[:, None]
+        for lag in range(1, nw_lags + 1):
+            gamma = gamma + 2 * (1 - lag / (nw_lags + 1)) * (d[:, lag:] * d[:, :-lag]).sum(axis=1) / T[:, None]
+        se = np.sqrt(np.clip(gamma, 0.0, None) / (T[:, None] - 1))
+        r2 = np.nansum(r2_t, axis=1) / T
+    bad = T < 2
+    mean[bad] = np.nan
+    se[bad] = np.nan
+    return mean, se, T - 1, (n_t * ok).sum(axis=1), T, r2
+
+
+def run_regressions(data, specs, cluster="date", fama_macbeth=True, date_col="event_date", firm_col="code",
+                    fm_freq=None, nw_lags=0, chunk_size=64):
+    """
+    data     : 每個事件一列，含 specs 用到的所有欄位 (build_regression_data 的輸出)
+    specs    : RegSpec 的 list (可數百條)
+    cluster  : None (HC1)、"date" 或 "firm"
+    fm_freq  : Fama-MacBeth 的期別；None = 事件日，"M" / "W" = 月 / 週
+    回傳 tidy 表：spec, y, model, se_type, term, coef, se, t, p, n_obs, n_groups, r2
+    """
+    cols = sorted({c for s in specs for c in (s.y,) + s.terms[1:]})
+    col = {c: i for i, c in enumerate(cols)}
+    A = data[cols].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+
+    # pooled 與 Fama-MacBeth 各自的列順序 (依 cluster / 期別排序一次)
+    dates = pd.to_datetime(data[date_col])
+    cluster_keys = {"date": dates, "firm": data[firm_col].astype(str)}
+    if cluster is not None and cluster not in cluster_keys:
+        raise ValueError(f"未知的 cluster {cluster}，可用：None、date、firm")
+    c_order, c_starts = _sorted_groups(cluster_keys[cluster]) if cluster else (np.arange(len(A)), None)
+    periods = dates if fm_freq is None else dates.dt.to_period(fm_freq)
+    p_order, p_starts = _sorted_groups(periods)
+    A_pooled, A_fm = A[c_order], A[p_order]
+    se_type = "HC1" if cluster is None else f"cluster_{cluster}"
+    fm_type = "fama_macbeth" if nw_lags == 0 else f"newey_west_{nw_lags}"
+
+    by_k = {}
+    for s in specs:
+        by_k.setdefault(len(s.terms), []).append(s)
+
+    frames = []
+    for k, group in by_k.items():
+        for i in range(0, len(group), chunk_size):
+            chunk = group[i:i + chunk_size]
+            runs = [("pooled", se_type, _pooled(*_design(A_pooled, col, chunk), c_starts))]
+            if fama_macbeth:
+                runs.append(("fama_macbeth", fm_type, _fama_macbeth(*_design(A_fm, col, chunk), p_starts, nw_lags)))
+            for model, kind, (coef, se, df, n_obs, n_groups, r2) in runs:
+                S = len(chunk)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    tval = coef / se
+                p = 2 * student_t.sf(np.abs(tval), np.where(df >= 1, df, np.nan)[:, None])
+                frames.append(pd.DataFrame({
+                    "spec": np.repeat([s.name for s in chunk], k),
+                    "y": np.repeat([s.y for s in chunk], k),
+                    "model": model,
+                    "se_type": kind,
+                    "term": np.concatenate([s.terms for s in chunk]),
+                    "coef": coef.ravel(),
+                    "se": se.ravel(),
+                    "t": tval.ravel(),
+                    "p": p.ravel(),
+                    "n_obs": np.repeat(n_obs, k).astype(int),
+                    "n_groups": np.repeat(n_groups, k).astype(int),
+                    "r2": np.repeat(r2, k),
+                }))
+    if not frames:
+        return pd.DataFrame(columns=["spec", "y", "model", "se_type", "term", "coef", "se", "t", "p",
+                                     "n_obs", "n_groups", "r2"])
+    rank = {**{s.name: i for i, s in enumerate(specs)}, **{m: i for i, m in enumerate(MODELS)}}
+    out = pd.concat(frames, ignore_index=True)
+    return out.sort_values(["spec", "model"], key=lambda c: c.map(rank), kind="stable").reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    from car_engine import load_ar_panel
+    from info_metrics import event_metrics
+
+    BASE_DIR = r"D:\我才不要走量化"
+    base_path = os.path.join(BASE_DIR, "法說會")
+    db_path = os.path.join(BASE_DIR, "Data_Warehouse", "event01.db")
+
+    panel = load_ar_panel(os.path.join(base_path, "final_model_complete.csv"))
+    metrics = event_metrics(db_path)
+    car_windows = [(-5, 5), (-2, 2), (-1, 1), (0, 2), (0, 1), (-1, 2)]
+    data = build_regression_data(metrics, panel, car_windows)
+
+    features = ["ip_0900_0930_t0", "ip_1100_1130_tm1"]
+    specs = spec_grid(car_columns(car_windows), features)
+    specs += [RegSpec(f"{y}~all", y, tuple(features)) for y in car_columns(car_windows)]
+
+    t0 = time.perf_counter()
+    table = run_regressions(data, specs, cluster="date", fm_freq="M")
+    print(f"⏱️ {len(specs)} 條回歸式：{time.perf_counter() - t0:.2f} 秒")
+    print(table[table["term"] != "const"].to_string(index=False))
+    table.to_csv(os.path.join(base_path, "car_regressions.csv"), index=False, encoding="utf-8-sig")
@@ -0,0 +1,141 @@
+import os
+import platform
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# ==========================================
+# 批次 CAR 圖輸出
+# ==========================================
+# 原本每張圖都 plt.figure → plot → savefig → plt.close，matplotlib 建圖的成本比 CAR 本身還高。
+# CarChart：每個 worker 只建一次 Agg Figure 與所有 artist，之後每張圖只換線的資料、標題與圖例文字。
+# render_car_charts：
+#   - 輸出的 PNG 比輸入檔 (模型 CSV、事件 CSV) 新的事件直接跳過，只重畫過期或不存在的
+#   - 其餘事件切成 batch 丟給 process pool，每個 worker 用自己的 CarChart
+# 不經過 pyplot，所以也不會累積 figure manager。
+# PNG 用低壓縮等級存檔：zlib 壓縮原本占單張圖約三成時間，檔案只大一點。
+
+PNG_COMPRESS_LEVEL = 1
+
+
+def set_chinese_font():
+    system = platform.system()
+    if system == 'Windows':
+        font_list = ['Microsoft JhengHei', 'SimHei', 'Arial']
+        matplotlib.rcParams['font.sans-serif'] = font_list
+    elif system == 'Darwin':
+        matplotlib.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'Heiti TC']
+    else:
+        matplotlib.rcParams['font.sans-serif'] = ['WenQuanYi Micro Hei']
+    matplotlib.rcParams['axes.unicode_minus'] = False
+
+
+def chart_filename(ticker, event_date, event_time):
+    # 檔名加上時間以防重複
+    time_clean = str(event_time).replace(':', '')
+    return f"{ticker}_{pd.Timestamp(event_date).strftime('%Y%m%d')}_{time_clean}.png"
+
+
+def chart_title(name, ticker, event_date, event_time):
+    return f"{name} ({ticker}) - 法說會 CAR 走勢\n日期: {pd.Timestamp(event_date).strftime('%Y-%m-%d')} 時間: {event_time}"
+
+
+class CarChart:
+    """可重複使用的 CAR 圖：artist 只建一次，render 時更新資料後存檔"""
+
+    def __init__(self):
+        self.fig = Figure(figsize=(10, 6))
+        FigureCanvasAgg(self.fig)
+        ax = self.ax = self.fig.add_subplot()
+        self.line, = ax.plot([], [], marker='o', color='#1f77b4', linewidth=2)
+        # 標記線
+        ax.axvline(x=0, color='red', linestyle='--', alpha=0.8, label='法說會')
+        ax.axhline(y=0, color='gray', linestyle='-', linewidth=0.5)
+        self.title = ax.set_title("", fontsize=16)
+        ax.set_xlabel('相對天數', fontsize=12)
+        ax.set_ylabel('累積異常報酬 (CAR)', fontsize=12)
+        self.legend = ax.legend(loc='best')
+        ax.grid(True, alpha=0.3)
+
+    def render(self, rel_days, car, title, label, path):
+        self.line.set_data(rel_days, car)
+        self.title.set_text(title)
+        self.legend.get_texts()[0].set_text(label)
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.fig.savefig(path, pil_kwargs={'compress_level': PNG_COMPRESS_LEVEL})
+
+
+_chart = None
+
+
+def _init_worker():
+    set_chinese_font()
+
+
+def _render_batch(rel_days, cars, jobs):
+    """jobs: [(path, title, label), ...]，與 cars 的列一一對應"""
+    global _chart
+    if _chart is None:
+        _chart = CarChart()
+    for car, (path, title, label) in zip(cars, jobs):
+        _chart.render(rel_days, car, title, label, path)
+    return len(jobs)
+
+
+def is_fresh(path, input_mtime):
+    """PNG 存在且比所有輸入檔都新"""
+    try:
+        return os.path.getmtime(path) >= input_mtime
+    except OSError:
+        return False
+
+
+def render_car_charts(res, df_events, output_folder, inputs=(), workers=None, batch_size=200, force=False):
+    """
+    res        : car_engine.CarResult，列與 df_events 一一對應
+    df_events  : 需要 Code、Date、Time 欄位 (StockName 可有可無)
+    inputs     : 圖的來源檔；PNG 比它們都新就跳過 (force=True 全部重畫)
+    workers    : process 數，<= 1 就在目前的 process 畫
+    回傳實際畫出的張數。
+    """
+    input_mtime = max((os.path.getmtime(p) for p in inputs if os.path.exists(p)), default=0.0)
+    names = df_events['StockName'] if 'StockName' in df_events.columns else pd.Series(np.nan, index=df_events.index)
+
+    rows, jobs = [], []
+    skipped = 0
+    for k in np.flatnonzero(res.ok):
+        ticker, event_date, event_time = df_events['Code'].iat[k], df_events['Date'].iat[k], df_events['Time'].iat[k]
+        path = os.path.join(output_folder, chart_filename(ticker, event_date, event_time))
+        if not force and is_fresh(path, input_mtime):
+            skipped += 1
+            continue
+        raw_name = names.iat[k]
+        name = str(raw_name) if pd.notna(raw_name) else str(ticker)
+        rows.append(k)
+        jobs.append((path, chart_title(name, ticker, event_date, event_time), f'法說會 ({event_time})'))
+    if skipped:
+        print(f"⏭️ {skipped} 張圖已是最新，略過")
+
+    batches = [
+        (res.rel_days, res.car[rows[i:i + batch_size]], jobs[i:i + batch_size])
+        for i in range(0, len(jobs), batch_size)
+    ]
+    workers = os.cpu_count() if workers is None else workers
+    count = 0
+    if workers <= 1 or len(batches) <= 1:
+        _init_worker()
+        for batch in batches:
+            count += _render_batch(*batch)
+            print(f"✅ 已完成 {count} 張圖...")
+        return count
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for n in pool.map(_render_batch, *zip(*batches)):
+            count += n
+            print(f"✅ 已完成 {count} 張圖...")
+    return count
@@ -2,7 +2,10 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import os
 import platform
-from datetime import datetime
+
+from car_engine import build_ar_panel, read_ar_table
+from events_master import after_market_close, load_events
+from car_render import render_car_charts
 
 # --- 1. 設定路徑 ---
 base_path = r"D:\我才不要走量化\法說會"
@@ -27,106 +30,34 @@ def set_chinese_font():
 
 set_chinese_font()
 
-# --- 輔助函數：判斷時間是否晚於 13:30 ---
-def is_after_market_close(time_str):
-    try:
-        # 將字串 (如 "14:30") 轉為時間物件
-        t = datetime.strptime(str(time_str).strip(), '%H:%M').time()
-        cutoff = datetime.strptime('13:30', '%H:%M').time()
-        return t >= cutoff # 大於等於 13:30 回傳 True
-    except:
-        return False # 格式錯誤或空值就略過
-
 def generate_car_plots_all_after_1330():
     print("🚀 載入資料中...")
-    df_model = pd.read_csv(path_model)
-    df_events = pd.read_csv(path_events)
-
-    # --- 格式清洗 ---
-    print("📅 格式化日期與代碼...")
-    df_model['Date'] = pd.to_datetime(df_model['Date'], format='%Y%m%d')
-    df_events['Date'] = pd.to_datetime(df_events['Date'])
-
-    if 'StockCode' in df_events.columns:
-        df_events.rename(columns={'StockCode': 'Code'}, inplace=True)
-    if 'StockCode' in df_model.columns:
-        df_model.rename(columns={'StockCode': 'Code'}, inplace=True)
+    # TEJ 的 final_model_complete.csv 或 ar_model.py 產生的 parquet (可自訂估計期 / 基準)
+    df_model = read_ar_table(path_model)
+    df_events = load_events(path_events)  # Code / Date 已正規化，結果快取在 CSV 旁
 
     # --- 關鍵修改：篩選 13:30 (含) 以後的所有事件 ---
     print("🔍 正在篩選 13:30 後的法說會...")
-    # 使用 apply 搭配上面的輔助函數
-    mask = df_events['Time'].apply(is_after_market_close)
-    df_events_filtered = df_events[mask].copy()
+    df_events_filtered = df_events[after_market_close(df_events)].copy()
     
     print(f"👉 原始事件數：{len(df_events)}")
     print(f"👉 篩選後 (>=13:30) 事件數：{len(df_events_filtered)}")
 
-    # --- 準備 CAR 計算 ---
-    df_model.sort_values(by=['Code', 'Date'], inplace=True)
-    df_model.set_index(['Code', 'Date'], inplace=True)
+    # --- 準備 CAR 計算 (所有事件一次算完) ---
+    window = 5
+    panel = build_ar_panel(df_model)
+    events = panel.locate(df_events_filtered['Code'], df_events_filtered['Date'])
+    res = panel.car(events, (-window, window))
+    print("📋 事件狀態：")
+    print(res.reason_counts().to_string())
 
-    window = 5 
-    count = 0
+    # --- 畫圖：重複使用同一張 Agg figure，已是最新的 PNG 跳過 ---
+    # 這支檔案下面還有整段 tick 計算寫在模組層級，開 process pool (spawn) 會在每個 worker 重跑，所以只用單一 process
     print(f"🎨 開始繪製 CAR 圖表 (輸出至 {output_folder})...")
-
-    # --- 迴圈處理 ---
-    for idx, row in df_events_filtered.iterrows():
-        ticker = row['Code']
-        event_date = row['Date']
-        event_time = row['Time']
-        raw_name = row.get('StockName')
-        name = str(raw_name) if pd.notna(raw_name) else str(ticker)
-
-        try:
-            # 檢查是否有該股票資料
-            if ticker not in df_model.index.levels[0]:
-                continue
-                
-            stock_data = df_model.loc[ticker]
-            
-            # 檢查日期是否存在
-            if event_date in stock_data.index:
-                loc_idx = stock_data.index.get_loc(event_date)
-                start_loc = loc_idx - window
-                end_loc = loc_idx + window
-                
-                # 確保窗口在資料範圍內
-                if start_loc >= 0 and end_loc < len(stock_data):
-                    subset = stock_data.iloc[start_loc : end_loc+1].copy()
-                    
-                    # 計算 CAR
-                    subset['CAR'] = subset['Abnormal_Return'].cumsum()
-                    subset['Relative_Day'] = range(-window, window + 1)
-
-                    # 繪圖
-                    plt.figure(figsize=(10, 6))
-                    plt.plot(subset['Relative_Day'], subset['CAR'], marker='o', color='#1f77b4', linewidth=2)
-                    
-                    # 標記線
-                    plt.axvline(x=0, color='red', linestyle='--', alpha=0.8, label=f'法說會 ({event_time})')
-                    plt.axhline(y=0, color='gray', linestyle='-', linewidth=0.5)
-                    
-                    # 標題
-                    plt.title(f"{name} ({ticker}) - 法說會 CAR 走勢\n日期: {event_date.strftime('%Y-%m-%d')} 時間: {event_time}", fontsize=16)
-                    plt.xlabel('相對天數', fontsize=12)
-                    plt.ylabel('累積異常報酬 (CAR)', fontsize=12)
-                    plt.legend(loc='best')
-                    plt.grid(True, alpha=0.3)
-                    
-                    # 存檔 (檔名加上時間以防重複)
-                    time_clean = str(event_time).replace(':', '')
-                    filename = f"{ticker}_{event_date.strftime('%Y%m%d')}_{time_clean}.png"
-                    save_path = os.path.join(output_folder, filename)
-                    plt.savefig(save_path)
-                    plt.close()
-                    
-                    count += 1
-                    if count % 100 == 0:
-                        print(f"✅ 已完成 {count} 張圖...")
-
-        except Exception as e:
-            # print(f"❌ Error: {e}") # 錯誤太多時可以註解掉
-            continue
+    count = render_car_charts(
+        res, df_events_filtered, output_folder,
+        inputs=[path_model, path_events], workers=1,
+    )
 
     print("-" * 30)
     print(f"🎉 全部完成！共產生 {count} 張圖表")
@@ -164,112 +95,101 @@ from scipy.stats import pearsonr
 from scipy.stats import ttest_1samp
 from arch import arch_model
 import statsmodels.formula.api as smf
+from tick_store import read_ticks
+from tick_writer import has_table, read_day_ticks
+from oib_lambda import (
+    README_WINDOWS, build_bucket_index, compute_info_pressure, compute_lambda,
+    compute_oib, encode_side, floor_window, sort_ticks,
+)
+from oib_stream import compute_info_pressure_streaming, iter_sqlite_chunks, iter_store_chunks
+from trade_sign import SIGN_COLUMNS, add_side
+from lambda_estimators import DEFAULT_VARIANTS, compute_lambda_variants
 
 ####用database資料去計算以每半小時為單位的lambda跟oib####
 ##change 內外
 db_path = "event01.db"
 
-conn = sqlite3.connect(db_path)
-cursor = conn.cursor()
-
-#（1）確認 side 欄位是否已存在，沒有就新增
-cursor.execute("""
-PRAGMA table_info(ticks);
-""")
-cols = [row[1] for row in cursor.fetchall()]
-
-if "side" not in cols:
-    cursor.execute("ALTER TABLE ticks ADD COLUMN side TEXT;")
-    print("✓ 已新增 side 欄位")
-else:
-    print("✓ side 欄位已存在，直接更新")
-
-#（2）將 tick_type → side（b/s）
-cursor.execute("UPDATE ticks SET side = 'b' WHERE tick_type = 1;")
-cursor.execute("UPDATE ticks SET side = 's' WHERE tick_type = 2;")
-
-conn.commit()
-conn.close()
-
-#print("✓ 已完成 side 填寫（b/s）")
+# side 已在寫入時由 tick_type 算好 (+1 買 / -1 賣 / 0)，不再每次 ALTER TABLE + UPDATE 全表
+# 舊資料庫請先跑一次 migrate_side.py
 
 ########計算oib#########
 db_path = "event01.db"
-conn = sqlite3.connect(db_path)
-# 讀取需要的欄位
-df = pd.read_sql("SELECT code, ts, close, volume, side FROM ticks", conn)
-conn.close()
-
-df["ts"] = pd.to_datetime(df["ts"], format="mixed")
-df["date"] = df["ts"].dt.date
-df["half_hour"] = df["ts"].dt.floor("30T")
-
-# ***** 修正 OIB: 使用 volume 替代 amount *****
-# 買方量 (使用 volume)
-buy = (
-    df[df["side"] == "b"]
-    .groupby(["code", "date", "half_hour"])["volume"] # *** 修正點：用 volume ***
-    .sum()
-    .rename("buy_volume")
-)
-
-# 賣方量 (使用 volume)
-sell = (
-    df[df["side"] == "s"]
-    .groupby(["code", "date", "half_hour"])["volume"] # *** 修正點：用 volume ***
-    .sum()
-    .rename("sell_volume")
-)
-
-# OIB 應該是淨買/賣量，不需要取絕對值，保留方向，才能反映壓力方向
-oib = pd.concat([buy, sell], axis=1).fillna(0)
-# ***** 修正 OIB: 移除 abs，反映方向性 *****
-oib["OIB"] = oib["buy_volume"] - oib["sell_volume"]
-
-
-######算lambda#####
-results = []
-for (code, hh), g in df.groupby(["code", "half_hour"]):
-    g = g.sort_values("ts").reset_index(drop=True)
-    
-    if len(g) < 3: continue
-
-    g["dP"] = g["close"].diff()
-    # ***** 修正 lambda X 變數: 使用 volume 替代 amount (dAmt) *****
-    g["dVol"] = g["volume"].diff() 
-
-    g = g.dropna(subset=["dP", "dVol"])
-
-    if g["dVol"].abs().sum() == 0: continue # 避免成交量變化總和為零
-
-    X = sm.add_constant(g["dVol"])
-    y = g["dP"]
-
-    model = sm.OLS(y, X).fit()
-
-    # lambda_hat 現在代表價格衝擊對 (成交量變化) 的敏感度
-    lambda_hat = model.params["dVol"] 
-    # ***** 修正 lambda: 移除絕對值，保留 lambda 原始數值 *****
-    results.append({
-        "code": code,
-        "half_hour": hh,
-        "lambda_30m": lambda_hat, 
-        "n_ticks": len(g)
-    })
-
-lambda_df = pd.DataFrame(results)
-
-#####合併######
-merged = pd.merge(
-    lambda_df,
-    oib,
-    on=["code", "half_hour"],
-    how="inner"
-)
-
-# ***** 修正 info_pressure: OIB * Lambda 應該是 Pressure * Sensitivity *****
-# 注意：lambda_30m 已經有正負號 (價格衝擊方向)，OIB 也有正負號 (買賣壓力方向)
-# Pressure = 價格衝擊方向 * 壓力大小
-merged["info_pressure"] = merged["OIB"] * merged["lambda_30m"]
-
-print(merged.head())
\ No newline at end of file
+tick_store_dir = "ticks_parquet"
+# True：分 chunk 串流讀 ticks (需 day_ticks 或 parquet)，記憶體上限約一個 chunk，結果與一次讀完相同
+STREAMING = False
+STRATEGY_WINDOWS = README_WINDOWS + [floor_window("5min"), floor_window("15min")]
+# OIB 的買賣方向："tick_type" (永豐標記，0 不計) 或 trade_sign 的 "lee_ready"、"tick_rule"、"bvc" …
+# (串流模式只支援 tick_type)
+SIGN_METHOD = "tick_type"
+# lambda 的其他估計方式 (Huber、成交量加權、signed volume)，例如 DEFAULT_VARIANTS；空 list 不計算
+LAMBDA_VARIANTS = []
+
+if STREAMING:
+    if os.path.isdir(tick_store_dir):
+        chunks = iter_store_chunks(tick_store_dir)
+    else:
+        chunks = iter_sqlite_chunks(db_path)
+    result = compute_info_pressure_streaming(chunks, [floor_window("30min")] + STRATEGY_WINDOWS)
+    is_30m = result["window"] == "30min"
+    merged = (
+        result[is_30m].drop(columns="window")
+        .rename(columns={"bucket": "half_hour", "lambda": "lambda_30m"})
+        .reset_index(drop=True)
+    )
+    window_pressure = result[~is_30m].reset_index(drop=True)
+else:
+    tick_cols = ["close", "volume", "side"] if SIGN_METHOD == "tick_type" else list(SIGN_COLUMNS)
+    if os.path.isdir(tick_store_dir):
+        # 欄式儲存：只讀需要的欄位，ts 已是 int64 奈秒，不用再 parse 字串
+        df = read_ticks(tick_store_dir, columns=["code", "ts", *tick_cols])
+    elif has_table(db_path, "day_ticks"):
+        # 批次寫入器的 schema：每個 (code, real_date) 一份 ticks，ts 為 int64 奈秒
+        df = read_day_ticks(db_path, columns=("code", "ts", *tick_cols))
+    else:
+        conn = sqlite3.connect(db_path)
+        # 讀取需要的欄位 (舊版 ticks 表：side 由 tick_type 在記憶體換算，不寫回 DB)
+        df = pd.read_sql("SELECT code, ts, close, volume, bid_price, ask_price, tick_type FROM ticks", conn)
+        conn.close()
+        df["ts"] = pd.to_datetime(df["ts"], format="mixed")
+        df["side"] = encode_side(df.pop("tick_type"))
+
+    # 整張表只排序一次 (code, date, ts)，之後各種時間窗都在排好的陣列上切 offsets
+    # diff 不會跨日、跨股票，也不再逐組 sort_values / copy
+    ticks = sort_ticks(df, columns=tick_cols)
+    del df
+    side_col = "side" if SIGN_METHOD == "tick_type" else add_side(ticks, SIGN_METHOD)
+    index = build_bucket_index(ticks, "30min", bucket_col="half_hour")
+
+    # ***** 修正 OIB: 使用 volume 替代 amount *****
+    # OIB 應該是淨買/賣量，不需要取絕對值，保留方向，才能反映壓力方向
+    oib = compute_oib(ticks, index, side_col)
+
+
+    ######算lambda#####
+    # 以分組加總的閉式解一次算完所有 (code, date, half_hour)，取代逐組 sm.OLS
+    lambda_df = compute_lambda(ticks, index)
+
+    #####合併######
+    merged = pd.merge(
+        lambda_df,
+        oib,
+        on=["code", "date", "half_hour"],
+        how="inner"
+    )
+
+    # ***** 修正 info_pressure: OIB * Lambda 應該是 Pressure * Sensitivity *****
+    # 注意：lambda_30m 已經有正負號 (價格衝擊方向)，OIB 也有正負號 (買賣壓力方向)
+    # Pressure = 價格衝擊方向 * 壓力大小
+    merged["info_pressure"] = merged["OIB"] * merged["lambda_30m"]
+
+
+    #####策略時段 (9:00~9:30、11:00~11:30、10:00~12:00、9:30:00~9:34:59)######
+    # 沿用同一份排序好的 ticks，不必重新讀表、重新分組；要試新時段只要加 WindowSpec
+    window_pressure = compute_info_pressure(ticks, STRATEGY_WINDOWS, side_col)
+
+    if LAMBDA_VARIANTS:
+        lambda_variants = compute_lambda_variants(ticks, STRATEGY_WINDOWS, LAMBDA_VARIANTS, side_col)
+        print(lambda_variants.groupby(["window", "variant"])["lambda"].describe())
+
+print(merged.head())
+print(window_pressure.groupby("window")["info_pressure"].describe())
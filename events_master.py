@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# ==========================================
+# 法說會事件表 (TMBA_Events_Master.csv) 共用載入器
+# ==========================================
+# - Date / Time 一次向量化解析：Time → 距離午夜的分鐘數 (minutes，無法解析為 -1) 與時段 session
+# - Location 分類：正規法說會 vs 券商邀約 (host)
+# - 解析結果存成同目錄的 parquet 快取，metadata 記錄 CSV 的 mtime、大小與 sha1：
+#     mtime 與大小沒變 → 直接讀快取；mtime 變了但內容 hash 相同 → 更新 metadata 後沿用；否則重新解析
+# 所有腳本都用同一個 session 判斷，13:30 (含) 以後即 SESSION_AFTER_CLOSE。
+
+PARSER_VERSION = 1
+
+MARKET_OPEN_MIN = 9 * 60
+MARKET_CLOSE_MIN = 13 * 60 + 30
+
+SESSION_UNKNOWN = -1
+SESSION_PRE_OPEN = 0
+SESSION_INTRADAY = 1
+SESSION_AFTER_CLOSE = 2
+SESSIONS = {
+    SESSION_UNKNOWN: "未知",
+    SESSION_PRE_OPEN: "盤前",
+    SESSION_INTRADAY: "盤中",
+    SESSION_AFTER_CLOSE: "盤後",
+}
+
+HOST_REGULAR = 0
+HOST_BROKER = 1
+HOSTS = {HOST_REGULAR: "正規", HOST_BROKER: "券商邀約"}
+
+# 證交所 / 櫃買中心辦的業績發表會算正規；其餘提到券商、外資券商、論壇、受邀的算券商邀約
+_EXCHANGE = r"證券交易所|證交所|櫃買|櫃檯買賣"
+_BROKER = (
+    r"證券|投顧|受邀|邀請|邀約|論壇|座談|所舉辦|主辦|"
+    r"[Ss]ecurities|[Cc]onference|[Ff]orum|[Ss]ummit|"
+    r"UBS|Morgan|Citi|Goldman|Nomura|Daiwa|Macquarie|CLSA|HSBC|BofA|Jefferies|Mizuho|KGI|"
+    r"摩根|高盛|花旗|瑞銀|野村|大和|麥格理|美林|匯豐|滙豐|德意志|里昂|凱基|元大|元富|群益|宏遠|福邦|國票"
+)
+
+
+def parse_minutes(time_col):
+    """'14:30' / '14:30:00' / ' 9:00 ' → 分鐘數 (int16)，無法解析為 -1"""
+    parts = pd.Series(time_col, dtype="string").str.extract(r"^\s*(\d{1,2}):(\d{2})(?::\d{2})?\s*$")
+    h = pd.to_numeric(parts[0], errors="coerce")
+    m = pd.to_numeric(parts[1], errors="coerce")
+    minutes = h * 60 + m
+    valid = (h < 24) & (m < 60)
+    return minutes.where(valid).fillna(-1).to_numpy(dtype=np.int16)
+
+
+def classify_session(minutes):
+    minutes = np.asarray(minutes)
+    session = np.full(len(minutes), SESSION_INTRADAY, dtype=np.int8)
+    session[minutes < MARKET_OPEN_MIN] = SESSION_PRE_OPEN
+    session[minutes >= MARKET_CLOSE_MIN] = SESSION_AFTER_CLOSE
+    session[minutes < 0] = SESSION_UNKNOWN
+    return session
+
+
+def classify_host(location):
+    loc = pd.Series(location, dtype="string").fillna("")
+    broker = loc.str.contains(_BROKER, regex=True) & ~loc.str.contains(_EXCHANGE, regex=True)
+    return np.where(broker.to_numpy(dtype=bool), HOST_BROKER, HOST_REGULAR).astype(np.int8)
+
+
+def parse_events(df):
+    """原始事件表 → 型別化欄位 (Code str、Date datetime、event_id、minutes、session、host)"""
+    df = df.copy()
+    df.columns = [str(c).strip().lstrip("﻿") for c in df.columns]
+    if "StockCode" in df.columns:
+        df = df.rename(columns={"StockCode": "Code"})
+
+    df["Code"] = df["Code"].astype(str).str.strip().str.replace(r"\.0$", "", regex=True)
+    df["Date"] = pd.to_datetime(df["Date"].astype(str).str.strip(), format="mixed", errors="coerce")
+    df["Time"] = df["Time"].astype("string").str.strip()
+    df["event_id"] = df["Code"] + "_" + df["Date"].dt.strftime("%Y%m%d")
+    df["minutes"] = parse_minutes(df["Time"])
+    df["session"] = classify_session(df["minutes"])
+    df["host"] = classify_host(df["Location"]) if "Location" in df.columns else np.int8(HOST_REGULAR)
+    return df
+
+
+# ==========================================
+# 快取
+# ==========================================
+def _file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_path_for(csv_path):
+    return csv_path + ".parsed.parquet"
+
+
+def _read_meta(cache_path):
+    try:
+        meta = pq.read_schema(cache_path).metadata or {}
+        return json.loads(meta.get(b"events_master", b"{}"))
+    except (OSError, pa.ArrowInvalid, ValueError):
+        return {}
+
+
+def _write_cache(df, cache_path, meta):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}), b"events_master": json.dumps(meta).encode(),
+    })
+    tmp = cache_path + ".tmp"
+    pq.write_table(table, tmp)
+    os.replace(tmp, cache_path)
+
+
+def load_events(csv_path, use_cache=True):
+    """讀事件表 (優先用快取)；回傳 parse_events 的結果"""
+    st = os.stat(csv_path)
+    cache_path = cache_path_for(csv_path)
+    stamp = {"version": PARSER_VERSION, "mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+    if use_cache and os.path.exists(cache_path):
+        meta = _read_meta(cache_path)
+        if meta.get("version") == PARSER_VERSION and meta.get("size") == st.st_size:
+            if meta.get("mtime_ns") == st.st_mtime_ns:
+                return pq.read_table(cache_path).to_pandas()
+            sha1 = _file_sha1(csv_path)
+            if meta.get("sha1") == sha1:
+                # 只是檔案被碰過 (複製、重新存檔)，內容沒變
+                df = pq.read_table(cache_path).to_pandas()
+                _write_cache(df, cache_path, {**stamp, "sha1": sha1})
+                return df
+
+    df = parse_events(pd.read_csv(csv_path, encoding="utf-8-sig"))
+    if use_cache:
+        try:
+            _write_cache(df, cache_path, {**stamp, "sha1": _file_sha1(csv_path)})
+        except OSError as e:
+            print(f"⚠️ 無法寫入事件表快取: {e}")
+    return df
+
+
+def after_market_close(events):
+    """13:30 (含) 以後的事件"""
+    return (events["session"] == SESSION_AFTER_CLOSE).to_numpy()
+
+
+if __name__ == "__main__":
+    csv_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "TMBA_Events_Master.csv")
+    for label in ("解析", "快取"):
+        t0 = time.perf_counter()
+        events = load_events(csv_path)
+        print(f"⏱️ {label}：{(time.perf_counter() - t0) * 1000:.1f} ms，{len(events)} 筆")
+    print(events["session"].map(SESSIONS).value_counts().to_string())
+    print(events["host"].map(HOSTS).value_counts().to_string())
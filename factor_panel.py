@@ -0,0 +1,298 @@
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from oib_lambda import build_bucket_index, compute_info_pressure, compute_vwap, session_window, sort_ticks
+from tick_store import list_dates, read_date_ticks
+from trade_sign import SIGN_COLUMNS, add_side
+
+# ==========================================
+# 全市場 OIB × Lambda 日因子 (date × code panel)
+# ==========================================
+# 不限事件窗：tick store 裡每個交易日的所有股票都算一次 (TMBA 建議 1、同事建議 9)。
+# 1. build_panel：依交易日切分給 process pool，每個 worker 讀一天 (只掃該日目錄)、排序一次、
+#    算完所有時段後直接寫 parts/{date}.npz (float32)，不把結果 pickle 回主程式；已算過的日期跳過。
+# 2. assemble_panel：把所有 part 拼成 {field}.npy (dates × codes，float32，缺值 NaN) + axes.npz，
+#    FactorPanel 以 mmap 開啟，評估時只載入用到的欄位。
+# 3. evaluate_ic：每個再平衡日做橫斷面 rank IC (Spearman) 與分位數組合報酬；
+#    週再平衡 (rebalance="W") 時取每週最後一個交易日，持有到下一個再平衡日。
+# 欄位：ip_{window} / oib_{window} / lambda_{window} (window 見 FACTOR_WINDOWS)、close、volume。
+# OIB 的買賣方向預設用永豐 tick_type；sign_method 可換成 trade_sign 的其他分類 (不同方法請用不同 panel_dir)。
+
+FACTOR_WINDOWS = [
+    session_window("daily", "09:00", "13:31"),   # 含 13:30 收盤集合競價
+    session_window("0900_0930", "09:00", "09:30"),
+    session_window("1000_1200", "10:00", "12:00"),
+    session_window("1100_1130", "11:00", "11:30"),
+    session_window("1300_1330", "13:00", "13:31"),
+]
+METRICS = {"ip": "info_pressure", "oib": "OIB", "lambda": "lambda"}
+TICK_COLUMNS = ["code", "ts", "close", "volume", "side"]
+
+
+def panel_fields(windows=FACTOR_WINDOWS):
+    return [f"{m}_{w.name}" for w in windows for m in METRICS] + ["close", "volume"]
+
+
+# ==========================================
+# 1. 單日計算
+# ==========================================
+def day_factors(ticks, windows=FACTOR_WINDOWS, side_col="side"):
+    """
+    ticks : 一個交易日的 sort_ticks 結果
+    side_col : OIB 用的方向欄位 (見 compute_oib)
+    回傳 (codes, {field: float32 陣列})，codes 依字串排序，沒有值的欄位為 NaN
+    """
+    codes = np.asarray(ticks.code_uniques).astype(str)
+    n = len(codes)
+    out = {}
+
+    def put(field, keys, values):
+        arr = np.full(n, np.nan, dtype=np.float32)
+        arr[np.searchsorted(codes, keys["code"].to_numpy().astype(str))] = values
+        out[field] = arr
+
+    ip = compute_info_pressure(ticks, windows, side_col)
+    for w in windows:
+        part = ip[ip["window"] == w.name]
+        for m, col in METRICS.items():
+            put(f"{m}_{w.name}", part, part[col].to_numpy())
+
+    # 收盤價 (最後一筆) 與成交量，IC 的遠期報酬用
+    full = build_bucket_index(ticks, FACTOR_WINDOWS[0])
+    last = full.take(ticks, "close").astype(float)[full.offsets[1:] - 1] if full.n_groups else np.array([])
+    put("close", full.keys, last)
+    vwap = compute_vwap(ticks, full)
+    put("volume", vwap, vwap["volume"].to_numpy())
+    return codes, out
+
+
+def _part_path(panel_dir, date):
+    return os.path.join(panel_dir, "parts", f"{date}.npz")
+
+
+def build_day(args):
+    """worker：算一天並寫 part 檔，回傳 (date, tick 筆數, 秒數)"""
+    tick_store_dir, panel_dir, date, windows, sign_method = args
+    t0 = time.perf_counter()
+    columns = TICK_COLUMNS if sign_method == "tick_type" else ["code", "ts", *SIGN_COLUMNS]
+    df = read_date_ticks(tick_store_dir, date, columns=columns)
+    n_ticks = len(df)
+    if n_ticks:
+        ticks = sort_ticks(df, columns=columns[2:])
+        side_col = "side" if sign_method == "tick_type" else add_side(ticks, sign_method)
+        codes, fields = day_factors(ticks, windows, side_col)
+    else:
+        codes, fields = np.array([], dtype=str), {f: np.array([], dtype=np.float32) for f in panel_fields(windows)}
+    del df
+
+    path = _part_path(panel_dir, date)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, codes=codes, **fields)
+    os.replace(tmp, path)
+    return date, n_ticks, time.perf_counter() - t0
+
+
+def build_panel(tick_store_dir, panel_dir, dates=None, windows=FACTOR_WINDOWS, workers=None, force=False,
+                sign_method="tick_type"):
+    """
+    依交易日平行計算；dates 預設為 store 裡的所有交易日。
+    sign_method：trade_sign.METHODS 的名稱 (tick_type、lee_ready、bvc …)。
+    已存在的 part 不重算 (force=True 全部重算)，最後呼叫 assemble_panel。
+    """
+    os.makedirs(os.path.join(panel_dir, "parts"), exist_ok=True)
+    dates = list_dates(tick_store_dir) if dates is None else [str(pd.Timestamp(d).date()) for d in dates]
+    todo = [d for d in dates if force or not os.path.exists(_part_path(panel_dir, d))]
+    print(f"📅 共 {len(dates)} 個交易日，需計算 {len(todo)} 天")
+
+    jobs = [(tick_store_dir, panel_dir, d, windows, sign_method) for d in todo]
+    workers = os.cpu_count() if workers is None else workers
+    t0 = time.perf_counter()
+    total = 0
+    if workers <= 1:
+        results = map(build_day, jobs)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        # 一天就是一個夠大的工作單位，不需要 chunksize
+        results = pool.map(build_day, jobs)
+    try:
+        for i, (date, n_ticks, sec) in enumerate(results, 1):
+            total += n_ticks
+            if i % 20 == 0 or i == len(jobs):
+                rate = total / max(time.perf_counter() - t0, 1e-9)
+                print(f"✅ {i} / {len(jobs)} ({date}，{n_ticks} 筆 {sec:.1f} 秒)，累計 {rate / 1e6:.2f} M ticks/s")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return assemble_panel(panel_dir, windows)
+
+
+def assemble_panel(panel_dir, windows=FACTOR_WINDOWS):
+    """parts/*.npz → {field}.npy (dates × codes，float32) + axes.npz；先寫到 .tmp 再換上"""
+    parts_dir = os.path.join(panel_dir, "parts")
+    dates = sorted(f[:-4] for f in os.listdir(parts_dir) if f.endswith(".npz") and not f.endswith(".tmp.npz"))
+    parts = [np.load(_part_path(panel_dir, d)) for d in dates]
+    codes = np.unique(np.concatenate([p["codes"] for p in parts])) if parts else np.array([], dtype=str)
+    fields = panel_fields(windows)
+
+    tmp = os.path.join(panel_dir, "panel.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for field in fields:
+        arr = np.lib.format.open_memmap(os.path.join(tmp, f"{field}.npy"), mode="w+",
+                                        dtype=np.float32, shape=(len(dates), len(codes)))
+        arr[:] = np.nan
+        for i, p in enumerate(parts):
+            if field in p.files and len(p["codes"]):
+                arr[i, np.searchsorted(codes, p["codes"])] = p[field]
+        arr.flush()
+        del arr
+    np.savez(os.path.join(tmp, "axes.npz"), dates=np.array(dates), codes=codes, fields=np.array(fields))
+
+    final = os.path.join(panel_dir, "panel")
+    shutil.rmtree(final, ignore_errors=True)
+    os.replace(tmp, final)
+    print(f"🎉 panel 完成：{len(dates)} 天 × {len(codes)} 檔，{len(fields)} 個欄位")
+    return final
+
+
+class FactorPanel:
+    """
+    panel = FactorPanel(panel_dir)
+    panel["ip_1100_1130"]     → np.memmap (dates × codes)
+    panel.frame("close")      → DataFrame (index = 日期，columns = 代碼)
+    """
+
+    def __init__(self, panel_dir):
+        self.path = os.path.join(panel_dir, "panel")
+        axes = np.load(os.path.join(self.path, "axes.npz"))
+        self.dates = pd.to_datetime(axes["dates"])
+        self.codes = axes["codes"].astype(str)
+        self.fields = list(axes["fields"].astype(str))
+
+    def __getitem__(self, field):
+        if field not in self.fields:
+            raise KeyError(field)
+        return np.load(os.path.join(self.path, f"{field}.npy"), mmap_mode="r")
+
+    def frame(self, field):
+        return pd.DataFrame(np.asarray(self[field]), index=self.dates, columns=self.codes)
+
+
+# ==========================================
+# 2. Rank IC 評估
+# ==========================================
+def rank_rows(x):
+    """每列 (橫斷面) 的平均名次，NaN 保持 NaN"""
+    return pd.DataFrame(x).rank(axis=1, method="average").to_numpy()
+
+
+def rank_ic(factor, fwd_ret):
+    """每列 Spearman IC 與有效樣本數；只用兩者都有值的股票"""
+    both = ~np.isnan(factor) & ~np.isnan(fwd_ret)
+    n = both.sum(axis=1)
+    x = rank_rows(np.where(both, factor, np.nan))
+    y = rank_rows(np.where(both, fwd_ret, np.nan))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = x - np.nansum(x, axis=1, keepdims=True) / n[:, None]
+        y = y - np.nansum(y, axis=1, keepdims=True) / n[:, None]
+        ic = np.nansum(x * y, axis=1) / np.sqrt(np.nansum(x * x, axis=1) * np.nansum(y * y, axis=1))
+    ic[n < 3] = np.nan
+    return ic, n
+
+
+def rebalance_rows(dates, rebalance=None):
+    """再平衡日在 panel 中的列號；None = 每個交易日，"W" = 每週最後一個交易日，"M" = 每月"""
+    if rebalance is None:
+        return np.arange(len(dates))
+    period = pd.DatetimeIndex(dates).to_period(rebalance)
+    last = np.r_[period[1:] != period[:-1], True]
+    return np.flatnonzero(last)
+
+
+def evaluate_ic(panel, field, rebalance=None, horizon=1, lookback=1, n_quantiles=5, min_volume=0):
+    """
+    field     : 因子欄位 (例如 "ip_1100_1130")
+    rebalance : None / "W" / "M"；有值時 horizon 以「再平衡期」計 (持有到下 horizon 個再平衡日)
+    lookback  : 因子取最近 lookback 個交易日的平均 (週再平衡時可用 5)
+    min_volume: 當日成交量 (張) 低於此值的股票不納入
+    回傳 (每期 IC 表, 摘要 dict, 分位數平均報酬表)
+    """
+    factor = panel.frame(field)
+    if lookback > 1:
+        factor = factor.rolling(lookback, min_periods=1).mean()
+    factor = factor.to_numpy(dtype=float)
+    close = np.asarray(panel["close"], dtype=float)
+    if min_volume > 0:
+        factor[~(np.asarray(panel["volume"]) >= min_volume)] = np.nan
+
+    rows = rebalance_rows(panel.dates, rebalance)
+    f, c = factor[rows], close[rows]
+    fwd = np.full_like(c, np.nan)
+    if len(rows) > horizon:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fwd[:-horizon] = c[horizon:] / c[:-horizon] - 1
+    ic, n = rank_ic(f, fwd)
+
+    table = pd.DataFrame({"date": panel.dates[rows], "ic": ic, "n": n})
+    valid = table["ic"].dropna()
+    mean, sd = valid.mean(), valid.std(ddof=1)
+    periods_per_year = {None: 252, "W": 52, "M": 12}.get(rebalance, 252) / horizon
+    summary = {
+        "field": field, "rebalance": rebalance or "D", "horizon": horizon, "n_periods": len(valid),
+        "mean_ic": mean, "ic_std": sd,
+        "icir": mean / sd * np.sqrt(periods_per_year) if sd > 0 else np.nan,
+        "t_stat": mean / sd * np.sqrt(len(valid)) if sd > 0 else np.nan,
+        "hit_rate": (valid > 0).mean() if len(valid) else np.nan,
+    }
+
+    # 分位數組合：每期依因子名次切 n_quantiles 組，等權平均報酬
+    both = ~np.isnan(f) & ~np.isnan(fwd)
+    pct = rank_rows(np.where(both, f, np.nan)) / np.maximum(both.sum(axis=1, keepdims=True), 1)
+    q = np.where(both, np.ceil(pct * n_quantiles), 0).astype(np.int64)
+    period = np.repeat(np.arange(len(rows)), f.shape[1]).reshape(f.shape)
+    key = (period * (n_quantiles + 1) + q)[both]
+    size = (n_quantiles + 1) * len(rows)
+    cnt = np.bincount(key, minlength=size).reshape(len(rows), -1)[:, 1:]
+    tot = np.bincount(key, weights=fwd[both], minlength=size).reshape(len(rows), -1)[:, 1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        q_ret = tot / cnt
+    quantiles = pd.DataFrame({
+        "quantile": np.arange(1, n_quantiles + 1),
+        "mean_ret": np.nanmean(q_ret, axis=0) if len(rows) else np.nan,
+        "n_periods": (cnt > 0).sum(axis=0),
+    })
+    spread = q_ret[:, -1] - q_ret[:, 0]
+    summary["long_short_ret"] = np.nanmean(spread) if np.isfinite(spread).any() else np.nan
+    return table, summary, quantiles
+
+
+def ic_report(panel, fields=None, rebalance=None, **kwargs):
+    """多個因子欄位的 IC 摘要表"""
+    fields = fields or [f for f in panel.fields if f.split("_", 1)[0] in METRICS]
+    return pd.DataFrame([evaluate_ic(panel, f, rebalance=rebalance, **kwargs)[1] for f in fields])
+
+
+if __name__ == "__main__":
+    BASE_DIR = r"D:\我才不要走量化"
+    # 全市場 tick (目錄結構同 tick_store；事件用的 ticks_parquet 只有事件股票)
+    tick_store_dir = os.path.join(BASE_DIR, "Data_Warehouse", "ticks_universe")
+    panel_dir = os.path.join(BASE_DIR, "Data_Warehouse", "factor_panel")
+    out_dir = os.path.join(BASE_DIR, "法說會", "Factor")
+    os.makedirs(out_dir, exist_ok=True)
+
+    t0 = time.perf_counter()
+    build_panel(tick_store_dir, panel_dir)
+    print(f"⏱️ 建 panel {time.perf_counter() - t0:.1f} 秒")
+
+    panel = FactorPanel(panel_dir)
+    for rebalance, lookback in ((None, 1), ("W", 5)):
+        report = ic_report(panel, rebalance=rebalance, lookback=lookback, min_volume=500)
+        print(report.to_string(index=False))
+        report.to_csv(os.path.join(out_dir, f"ic_{rebalance or 'D'}.csv"), index=False, encoding="utf-8-sig")
+    print(f"📂 請查看資料夾：{out_dir}")
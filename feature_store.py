@@ -0,0 +1,358 @@
+import json
+import operator
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from car_engine import normalize_code, to_day
+
+# ==========================================
+# Point-in-time 特徵庫 (as-of join)
+# ==========================================
+# 同事建議的濾網 (日成交值 3000 萬、妖股、月營收成長、9:30 前漲 7~8%) 都要「事件當下已知」的資料：
+#   每張 FeatureTable 依 (code, 可用日) 排序成一條陣列 + 每檔股票的 offsets (同 ARPanel)，
+#   可用日 = 資料日期經過公告落後 (release) 之後的日期，例如月營收 = 次月 10 日。
+#   asof：所有事件一次 searchsorted，取「可用日 < 事件日」的最後一列 (inclusive 的表為 <=)，
+#         不必逐表 merge，也不會偷看到事件當天才公告的資料。
+#   收盤後才知道的資料 (日成交值、漲幅、營收) 預設 inclusive=False：T0 早上只看得到 T-1 收盤；
+#   盤中 9:30 就知道的 (9:30 漲幅) 用 inclusive=True。
+#   每張表有自己的 max_age (資料日期距事件日最多幾個日曆天)：沒有當天 9:30 漲幅的事件不能拿到
+#   一年前另一場事件的值，停牌很久的股票也不能沿用停牌前的成交值。
+# 特徵 attach 到事件表之後，濾網只是欄位條件 (Predicate)，CAR 與回測共用同一組 README_FILTERS。
+
+
+@dataclass
+class FeatureTable:
+    """
+    codes     : 排序後的股票代碼 (str)
+    starts    : 長度 n_codes + 1，第 i 檔在 [starts[i], starts[i+1])
+    avail     : 每列可使用的日期 (自 1970 起的天數)，各股內遞增
+    obs       : 每列資料本身的日期 (天數)
+    values    : 欄名 → float 陣列
+    inclusive : True = 可用日當天即可使用 (盤中已知)；False = 要到可用日之後
+    max_age   : 預設的過期天數 (資料日期距事件日超過即視為缺值)；None = 不限
+    """
+    codes: np.ndarray
+    starts: np.ndarray
+    avail: np.ndarray
+    obs: np.ndarray
+    values: dict
+    inclusive: bool = False
+    max_age: int = None
+
+    def locate(self, codes, day):
+        """每個 (code, day) 對到的列位置；沒有可用資料的為 -1"""
+        n = len(codes)
+        if not len(self.codes) or not len(self.avail):
+            return np.full(n, -1, dtype=np.int64)
+        code_idx = np.minimum(np.searchsorted(self.codes, codes), len(self.codes) - 1)
+        has_code = self.codes[code_idx] == codes
+
+        # (code, day) 合成單一遞增整數；超出範圍的日期夾到 0 或 span - 1，不會跨到相鄰股票
+        lo, hi = self.avail.min(), self.avail.max()
+        span = hi - lo + 3
+        code_of_row = np.repeat(np.arange(len(self.codes)), np.diff(self.starts))
+        table_key = code_of_row * span + (self.avail - lo + 1)
+        event_key = code_idx * span + np.clip(day - lo + 1, 0, span - 1)
+        pos = np.searchsorted(table_key, event_key, side="right" if self.inclusive else "left") - 1
+        ok = has_code & (pos >= self.starts[code_idx])
+        return np.where(ok, pos, -1)
+
+
+def build_table(df, columns, code_col="Code", date_col="Date", release=None, inclusive=False, max_age=None):
+    """
+    df      : long format (code_col, date_col, columns...)
+    release : 資料日期 → 可用日期 的函式 (例如 monthly_release(10))；None = 資料日期當天
+    """
+    codes = normalize_code(df[code_col]).astype(str)
+    obs, valid = to_day(df[date_col])
+    avail = to_day(release(pd.to_datetime(df[date_col])) if release else df[date_col])[0]
+    valid = valid & (avail >= 0)
+    values = {c: pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=float)[valid] for c in columns}
+    return _sorted_table(codes[valid], obs[valid], avail[valid], values, inclusive, max_age)
+
+
+def _sorted_table(codes, obs, avail, values, inclusive, max_age=None):
+    code_id, uniques = pd.factorize(codes, sort=True)
+    order = np.lexsort((obs, avail, code_id))
+    starts = np.zeros(len(uniques) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(code_id, minlength=len(uniques)), out=starts[1:])
+    return FeatureTable(codes=np.asarray(uniques, dtype=str), starts=starts, avail=avail[order], obs=obs[order],
+                        values={c: v[order] for c, v in values.items()}, inclusive=inclusive, max_age=max_age)
+
+
+def monthly_release(day=10):
+    """月資料 (任何該月日期) → 次月 day 日公告 (月營收：次月 10 日前)"""
+    def release(dates):
+        month = pd.to_datetime(pd.Series(dates)).dt.to_period("M").dt.to_timestamp()
+        return month + pd.offsets.MonthBegin(1) + pd.Timedelta(days=day - 1)
+    return release
+
+
+def lag_release(days):
+    """資料日期 + days 個日曆天才公告"""
+    return lambda dates: pd.to_datetime(pd.Series(dates)) + pd.Timedelta(days=days)
+
+
+# 各表預設的過期天數 (日曆天)
+MAX_AGE = {
+    "daily": 10,       # T-1 收盤；春節連假最長約 9 天
+    "revenue": 75,     # 資料月份月初 → 下下個月 10 日才有新的一期，最多約 72 天
+    "open_gap": 0,     # 只能是事件當天的 9:30 漲幅
+}
+
+
+# ==========================================
+# 1. 特徵庫
+# ==========================================
+class FeatureStore:
+    """
+    store = FeatureStore()
+    store.add("daily", daily_features(prices), ["turnover_20d", "runup_20d"])
+    store.add("revenue", revenue_features(rev), ["revenue_yoy"], release=monthly_release(10))
+    events = store.attach(events, "code", "date_0")      # 所有特徵一次 as-of join
+    """
+
+    def __init__(self):
+        self.tables = {}
+
+    @property
+    def features(self):
+        """特徵名 → 表名"""
+        return {c: name for name, t in self.tables.items() for c in t.values}
+
+    def add(self, name, df, columns, code_col="Code", date_col="Date", release=None, inclusive=False,
+            max_age=None):
+        """max_age：這張表預設的過期天數；None 時沿用 MAX_AGE 裡同名表的設定"""
+        taken = self.features
+        dup = [c for c in columns if c in taken and taken[c] != name]
+        if dup:
+            raise ValueError(f"特徵名稱重複：{', '.join(dup)}")
+        max_age = MAX_AGE.get(name) if max_age is None else max_age
+        self.tables[name] = build_table(df, columns, code_col, date_col, release, inclusive, max_age)
+        return self
+
+    def asof(self, codes, dates, features=None, max_age=None, with_dates=False):
+        """
+        每個事件 (codes[i], dates[i]) 當下已知的最新特徵值；回傳與事件同順序的 DataFrame。
+        max_age : 資料日期距事件日超過 max_age 個日曆天視為缺值 (int，或 {表名: int})；
+                  沒指定的表用該表自己的 max_age
+        with_dates : 另外輸出每張表對到的資料日期 ({表名}_date)
+        """
+        owner = self.features
+        features = list(owner) if features is None else list(features)
+        missing = [f for f in features if f not in owner]
+        if missing:
+            raise KeyError(f"特徵庫沒有：{', '.join(missing)}")
+
+        codes = normalize_code(codes)
+        day, valid = to_day(dates)
+        codes = np.where(valid & pd.notna(codes), codes, "").astype(str)
+        out = {}
+        for name in dict.fromkeys(owner[f] for f in features):
+            table = self.tables[name]
+            pos = table.locate(codes, day)
+            limit = max_age.get(name, table.max_age) if isinstance(max_age, dict) else max_age
+            if limit is None:
+                limit = table.max_age
+            hit = valid & (pos >= 0)
+            if limit is not None:
+                hit &= day - table.obs[np.maximum(pos, 0)] <= limit
+            safe = np.where(hit, pos, 0)
+            for f in features:
+                if owner[f] == name:
+                    col = table.values[f]
+                    out[f] = np.where(hit, col[safe], np.nan) if len(col) else np.full(len(codes), np.nan)
+            if with_dates:
+                obs = table.obs[safe] if len(table.obs) else np.zeros(len(codes), dtype=np.int64)
+                out[f"{name}_date"] = pd.to_datetime(np.where(hit, obs, np.iinfo(np.int64).min), unit="D",
+                                                     errors="coerce")
+        return pd.DataFrame({f: out[f] for f in out})
+
+    def attach(self, events, code_col="code", date_col="date_0", features=None, max_age=None):
+        """events 後面加上特徵欄位 (同名欄位會被覆蓋)"""
+        feats = self.asof(events[code_col], events[date_col], features, max_age)
+        out = events.drop(columns=[c for c in feats.columns if c in events.columns]).reset_index(drop=True)
+        return pd.concat([out, feats], axis=1)
+
+    # --- 存檔：每張表一個 parquet，inclusive / max_age 寫在 schema metadata ---
+    def save(self, root):
+        os.makedirs(root, exist_ok=True)
+        for name, t in self.tables.items():
+            table = pa.table({
+                "code": pa.array(np.repeat(t.codes, np.diff(t.starts))).dictionary_encode(),
+                "obs": pa.array(t.obs.astype("int32"), pa.int32()).cast(pa.date32()),
+                "avail": pa.array(t.avail.astype("int32"), pa.int32()).cast(pa.date32()),
+                **{c: pa.array(v) for c, v in t.values.items()},
+            })
+            meta = {b"feature_store": json.dumps({"inclusive": t.inclusive, "max_age": t.max_age}).encode()}
+            table = table.replace_schema_metadata({**(table.schema.metadata or {}), **meta})
+            path = os.path.join(root, f"{name}.parquet")
+            pq.write_table(table, path + ".tmp", compression="zstd")
+            os.replace(path + ".tmp", path)
+        return root
+
+    @classmethod
+    def load(cls, root):
+        store = cls()
+        for fname in sorted(os.listdir(root)):
+            if not fname.endswith(".parquet"):
+                continue
+            table = pq.read_table(os.path.join(root, fname))
+            info = json.loads(table.schema.metadata[b"feature_store"])
+            # 可用日直接沿用存檔的值 (release 已套用過)
+            days = {c: table[c].cast(pa.int32()).to_numpy().astype(np.int64) for c in ("obs", "avail")}
+            values = {c: table[c].to_numpy() for c in table.column_names if c not in ("code", "obs", "avail")}
+            codes = table["code"].to_pandas().astype(str).to_numpy()
+            name = fname[:-len(".parquet")]
+            store.tables[name] = _sorted_table(codes, days["obs"], days["avail"], values, info["inclusive"],
+                                               info.get("max_age", MAX_AGE.get(name)))
+        return store
+
+
+# ==========================================
+# 2. 特徵產生器
+# ==========================================
+def _rolling_sum(values, group_pos, window):
+    """同一股票內最近 window 列的加總 (不足 window 列為 NaN)；列須依 (code, date) 排序"""
+    c = np.concatenate([[0.0], np.cumsum(np.nan_to_num(values))])
+    n = np.concatenate([[0], np.cumsum(~np.isnan(values))])
+    hi = np.arange(len(values)) + 1
+    lo = np.maximum(hi - window, 0)
+    full = (group_pos >= window - 1) & (n[hi] - n[lo] == window)
+    return np.where(full, c[hi] - c[lo], np.nan)
+
+
+def daily_features(prices, window=20, code_col="Code", date_col="Date", close_col="Close", value_col="Turnover"):
+    """
+    TEJ 日資料 (收盤價、成交值 [元]) → 每個 (code, date)：
+      turnover_{window}d : 最近 window 日平均成交值
+      runup_{window}d    : 最近 window 日累積漲幅 (close / window 日前 close - 1)，妖股濾網
+    """
+    df = prices[[code_col, date_col, close_col, value_col]].copy()
+    df[code_col] = normalize_code(df[code_col]).astype(str)
+    df[date_col] = pd.to_datetime(df[date_col])
+    df = df.sort_values([code_col, date_col], kind="stable").reset_index(drop=True)
+    code_id = pd.factorize(df[code_col])[0]
+    first = np.r_[True, code_id[1:] != code_id[:-1]]
+    group_pos = np.arange(len(df)) - np.maximum.accumulate(np.where(first, np.arange(len(df)), 0))
+
+    close = pd.to_numeric(df[close_col], errors="coerce").to_numpy(dtype=float)
+    value = pd.to_numeric(df[value_col], errors="coerce").to_numpy(dtype=float)
+    base = np.full(len(df), np.nan)
+    if len(df) > window:
+        base[window:] = close[:-window]
+    base[group_pos < window] = np.nan
+    return pd.DataFrame({
+        "Code": df[code_col],
+        "Date": df[date_col],
+        f"turnover_{window}d": _rolling_sum(value, group_pos, window) / window,
+        f"runup_{window}d": close / base - 1,
+    })
+
+
+def revenue_features(revenue, code_col="Code", month_col="Month", revenue_col="Revenue"):
+    """月營收 → revenue_yoy (年增率)、revenue_mom (月增率)；Date 為資料月份的月初 (公告落後另外給 release)"""
+    df = revenue[[code_col, month_col, revenue_col]].copy()
+    df["Code"] = normalize_code(df[code_col]).astype(str)
+    month = pd.to_datetime(df[month_col]).dt.to_period("M")
+    df["m"] = month.dt.year * 12 + month.dt.month - 1
+    df["rev"] = pd.to_numeric(df[revenue_col], errors="coerce")
+    df = df.drop_duplicates(["Code", "m"], keep="last")
+    key = df.set_index(["Code", "m"])["rev"]
+
+    def prior(lag):
+        return key.reindex(pd.MultiIndex.from_arrays([df["Code"], df["m"] - lag])).to_numpy()
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        yoy = df["rev"].to_numpy() / prior(12) - 1
+        mom = df["rev"].to_numpy() / prior(1) - 1
+    return pd.DataFrame({
+        "Code": df["Code"].to_numpy(),
+        "Date": month.dt.to_timestamp().to_numpy(),
+        "revenue_yoy": np.where(np.isfinite(yoy), yoy, np.nan),
+        "revenue_mom": np.where(np.isfinite(mom), mom, np.nan),
+    })
+
+
+def open_gap_features(feats):
+    """
+    sweep.build_features 的輸出 → 每個 (code, T0)：gap_0930 = T0 9:30 前最後價 / T-1 收盤 - 1。
+    9:30 就已知，請以 inclusive=True 加入特徵庫。
+    """
+    df = pd.DataFrame({
+        "Code": feats["code"].astype(str).to_numpy(),
+        "Date": pd.to_datetime(feats["date_0"]).to_numpy(),
+        "gap_0930": (feats["p_0930_0"] / feats["close_-1"] - 1).to_numpy(dtype=float),
+    })
+    return df.drop_duplicates(["Code", "Date"]).reset_index(drop=True)
+
+
+# ==========================================
+# 3. 濾網
+# ==========================================
+OPS = {
+    "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge, "==": operator.eq, "!=": operator.ne,
+}
+
+
+@dataclass(frozen=True)
+class Predicate:
+    feature: str
+    op: str
+    value: float
+    keep_missing: bool = False   # 特徵缺值時保留 (True) 或剔除 (False)
+
+    def mask(self, df):
+        col = pd.to_numeric(df[self.feature], errors="coerce").to_numpy(dtype=float)
+        with np.errstate(invalid="ignore"):
+            hit = OPS[self.op](col, self.value)
+        return hit | (np.isnan(col) & self.keep_missing)
+
+
+def apply_filters(df, predicates):
+    """所有 predicate 的 AND；回傳布林陣列"""
+    mask = np.ones(len(df), dtype=bool)
+    for p in predicates:
+        mask &= p.mask(df)
+    return mask
+
+
+# README「同事+主管們的建議」
+README_FILTERS = (
+    Predicate("turnover_20d", ">=", 30_000_000),   # 日成交值至少 3000 萬
+    Predicate("runup_20d", "<", 0.30),             # 妖股：近 20 日漲幅 30% 以上剔除
+    Predicate("revenue_yoy", ">", 0.0, keep_missing=True),   # 月營收年增 (沒有營收資料的不剔除)
+    Predicate("gap_0930", "<", 0.07),              # 9:30 前已漲 7% 以上剔除 (漲停可能掛不到)
+)
+
+
+if __name__ == "__main__":
+    import time
+
+    from sweep import build_features
+
+    BASE_DIR = r"D:\我才不要走量化"
+    base_path = os.path.join(BASE_DIR, "法說會")
+    db_path = os.path.join(BASE_DIR, "Data_Warehouse", "event01.db")
+    tick_store_dir = os.path.join(BASE_DIR, "Data_Warehouse", "ticks_parquet")
+    store_dir = os.path.join(BASE_DIR, "Data_Warehouse", "feature_store")
+    # TEJ 匯出：日資料 (Code, Date=%Y%m%d, Close, Turnover 千元) 與月營收 (Code, Month=%Y%m, Revenue)
+    prices = pd.read_csv(os.path.join(base_path, "daily_prices.csv"))
+    prices["Date"] = pd.to_datetime(prices["Date"].astype(str), format="%Y%m%d")
+    prices["Turnover"] = prices["Turnover"] * 1000
+    rev = pd.read_csv(os.path.join(base_path, "monthly_revenue.csv"))
+    rev["Month"] = pd.to_datetime(rev["Month"].astype(str), format="%Y%m")
+
+    t0 = time.perf_counter()
+    store = FeatureStore()
+    store.add("daily", daily_features(prices), ["turnover_20d", "runup_20d"])
+    store.add("revenue", revenue_features(rev), ["revenue_yoy", "revenue_mom"], release=monthly_release(10))
+    feats = build_features(db_path, tick_store_dir=tick_store_dir if os.path.isdir(tick_store_dir) else None)
+    store.add("open_gap", open_gap_features(feats), ["gap_0930"], inclusive=True)
+    store.save(store_dir)
+    print(f"⏱️ 特徵庫建立 {time.perf_counter() - t0:.2f} 秒 → {store_dir}")
@@ -0,0 +1,228 @@
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from oib_lambda import README_WINDOWS, compute_info_pressure, floor_window
+from tick_store import read_ticks
+from tick_writer import PRAGMAS, read_day_ticks
+from tick_writer import connect as connect_ticks
+
+# ==========================================
+# 增量計算的 info_metrics 表
+# ==========================================
+# info_metrics      : (code, real_date, window, bucket) → OIB / lambda / info_pressure
+# info_metrics_done : 每個 (code, real_date, window) 上次計算時的資料版本
+#   SQLite 來源的版本 = tick_days.version (沒改寫過為 NULL，用 day_id)；parquet 來源的版本 = 檔案 mtime
+#   新增的交易日、以及 ticks 被改寫過 (bump_day_versions) 的交易日版本不同，才重算，其餘直接沿用。
+# info_windows      : 時間窗定義；同名 window 的定義改了就整個 window 重算
+# 每天收盤前的篩選 (「明天開法說會、今天 11:00~11:30 指標 < 0」) 直接查表即可。
+
+DEFAULT_WINDOWS = [floor_window("30min")] + README_WINDOWS
+
+METRIC_COLS = [
+    "buy_volume", "sell_volume", "OIB", "lambda", "intercept", "lambda_se", "n_ticks", "info_pressure",
+]
+
+SCHEMA = [
+    f"""
+    CREATE TABLE IF NOT EXISTS info_metrics (
+        code TEXT,
+        real_date TEXT,
+        window TEXT,
+        bucket INTEGER,
+        {', '.join(f'{c} REAL' for c in METRIC_COLS)},
+        PRIMARY KEY (code, real_date, window, bucket)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_info_metrics_date ON info_metrics (real_date, window)",
+    """
+    CREATE TABLE IF NOT EXISTS info_metrics_done (
+        code TEXT,
+        real_date TEXT,
+        window TEXT,
+        version INTEGER,
+        PRIMARY KEY (code, real_date, window)
+    )
+    """,
+    "CREATE TABLE IF NOT EXISTS info_windows (window TEXT PRIMARY KEY, spec TEXT)",
+]
+
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path)
+    for p in PRAGMAS:
+        conn.execute(p)
+    for stmt in SCHEMA:
+        conn.execute(stmt)
+    conn.commit()
+    return conn
+
+
+def _spec(w):
+    return f"{w.freq}|{w.start}|{w.end}"
+
+
+def sync_windows(conn, windows):
+    """時間窗定義有變的 window：清掉舊結果，讓它全部重算"""
+    known = dict(conn.execute("SELECT window, spec FROM info_windows").fetchall())
+    with conn:
+        for w in windows:
+            if known.get(w.name) == _spec(w):
+                continue
+            conn.execute("DELETE FROM info_metrics WHERE window = ?", (w.name,))
+            conn.execute("DELETE FROM info_metrics_done WHERE window = ?", (w.name,))
+            conn.execute("INSERT OR REPLACE INTO info_windows (window, spec) VALUES (?, ?)", (w.name, _spec(w)))
+
+
+# ==========================================
+# 1. 資料分區與版本
+# ==========================================
+def sqlite_partitions(db_path):
+    """(code, real_date, day_id, version)；connect_ticks 會替舊 DB 補上 version 欄位"""
+    conn = connect_ticks(db_path)
+    parts = pd.read_sql(
+        "SELECT code, real_date, day_id, COALESCE(version, day_id) AS version FROM tick_days", conn,
+    )
+    conn.close()
+    return parts
+
+
+def store_partitions(root):
+    rows = []
+    for date_dir in os.listdir(root):
+        if not date_dir.startswith("real_date="):
+            continue
+        for code_dir in os.listdir(os.path.join(root, date_dir)):
+            path = os.path.join(root, date_dir, code_dir, "part-0.parquet")
+            if code_dir.startswith("code=") and os.path.exists(path):
+                rows.append((code_dir[5:], date_dir[10:], os.stat(path).st_mtime_ns))
+    return pd.DataFrame(rows, columns=["code", "real_date", "version"])
+
+
+def dirty_partitions(conn, parts, windows):
+    """任何一個 window 沒算過或版本不同的 (code, real_date)"""
+    done = pd.read_sql("SELECT code, real_date, window, version FROM info_metrics_done", conn)
+    need = parts.merge(pd.DataFrame({"window": [w.name for w in windows]}), how="cross")
+    need = need.merge(done, on=["code", "real_date", "window"], how="left", suffixes=("", "_done"))
+    stale = need["version_done"].isna() | (need["version_done"] != need["version"])
+    return parts.merge(need.loc[stale, ["code", "real_date"]].drop_duplicates(), on=["code", "real_date"])
+
+
+def _load(db_path, tick_store_dir, batch):
+    if tick_store_dir:
+        df = read_ticks(
+            tick_store_dir, codes=batch["code"].unique(), dates=batch["real_date"].unique(),
+            columns=["code", "real_date", "ts", "close", "volume", "side"],
+        )
+        return df.merge(batch[["code", "real_date"]], on=["code", "real_date"])
+    return read_day_ticks(db_path, columns=("code", "ts", "close", "volume", "side"), day_ids=batch["day_id"])
+
+
+# ==========================================
+# 2. 增量重算
+# ==========================================
+def refresh_info_metrics(db_path, windows=DEFAULT_WINDOWS, tick_store_dir=None, batch_size=500):
+    """
+    只重算新增或變動的 (code, real_date)；tick_store_dir 有值時以 parquet 為來源，否則讀 day_ticks。
+    回傳重算的分區數。
+    """
+    conn = connect(db_path)
+    sync_windows(conn, windows)
+    parts = store_partitions(tick_store_dir) if tick_store_dir else sqlite_partitions(db_path)
+    dirty = dirty_partitions(conn, parts, windows)
+    print(f"🔍 {len(parts)} 個 (code, date) 中有 {len(dirty)} 個需要重算")
+
+    for start in range(0, len(dirty), batch_size):
+        batch = dirty.iloc[start:start + batch_size]
+        ticks = _load(db_path, tick_store_dir, batch)
+        metrics = compute_info_pressure(ticks, windows) if len(ticks) else pd.DataFrame()
+
+        rows = []
+        if len(metrics):
+            rows = zip(
+                metrics["code"].astype(str),
+                metrics["date"].dt.strftime("%Y-%m-%d"),
+                metrics["window"],
+                metrics["bucket"].to_numpy(dtype="datetime64[ns]").view("int64").tolist(),
+                *(metrics[c].astype(float).tolist() for c in METRIC_COLS),
+            )
+        keys = [(c, d, w.name) for c, d in zip(batch["code"], batch["real_date"]) for w in windows]
+        with conn:
+            conn.executemany("DELETE FROM info_metrics WHERE code = ? AND real_date = ? AND window = ?", keys)
+            conn.executemany(
+                f"INSERT INTO info_metrics VALUES ({', '.join('?' * (4 + len(METRIC_COLS)))})", rows,
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO info_metrics_done (code, real_date, window, version) VALUES (?, ?, ?, ?)",
+                [(c, d, w.name, int(v)) for c, d, v in batch[["code", "real_date", "version"]].itertuples(index=False)
+                 for w in windows],
+            )
+        print(f"✅ 已重算 {min(start + batch_size, len(dirty))} / {len(dirty)}")
+
+    conn.close()
+    return len(dirty)
+
+
+# ==========================================
+# 3. 查詢
+# ==========================================
+def load_metrics(db_path, window=None, codes=None, dates=None):
+    where, params = [], []
+    if window is not None:
+        where.append("window = ?")
+        params.append(window)
+    if codes is not None:
+        codes = [str(c) for c in codes]
+        where.append(f"code IN ({', '.join('?' * len(codes))})")
+        params += codes
+    if dates is not None:
+        dates = [str(pd.Timestamp(d).date()) for d in dates]
+        where.append(f"real_date IN ({', '.join('?' * len(dates))})")
+        params += dates
+
+    conn = sqlite3.connect(db_path)
+    df = pd.read_sql(
+        "SELECT * FROM info_metrics" + (" WHERE " + " AND ".join(where) if where else ""), conn, params=params,
+    )
+    conn.close()
+    df["bucket"] = df["bucket"].to_numpy(dtype="int64").view("datetime64[ns]")
+    return df
+
+
+def pressure_screen(db_path, codes, real_date, window="1100_1130", below=0.0):
+    """第一層濾網：real_date 當天 window 的 info_pressure < below 的股票"""
+    df = load_metrics(db_path, window=window, codes=codes, dates=[real_date])
+    return df[df["info_pressure"] < below].sort_values("info_pressure").reset_index(drop=True)
+
+
+# 事件層級特徵：欄名 → (window, relative_day)
+EVENT_FEATURES = {
+    "ip_0900_0930_t0": ("0900_0930", 0),
+    "ip_1100_1130_tm1": ("1100_1130", -1),
+}
+
+
+def event_metrics(db_path, features=EVENT_FEATURES, col="info_pressure"):
+    """
+    每場 event 一列：code、event_date 與各 (window, relative_day) 當天的指標
+    (同一天有多個 bucket 時加總)；透過 event_days 對到 T0、T-1 的實際交易日。
+    """
+    conn = sqlite3.connect(db_path)
+    links = pd.read_sql("SELECT event_id, relative_day, code, event_date, real_date FROM event_days", conn)
+    conn.close()
+    out = links[["event_id", "code", "event_date"]].drop_duplicates("event_id")
+    for name, (window, rel_day) in features.items():
+        daily = load_metrics(db_path, window=window).groupby(["code", "real_date"], as_index=False)[col].sum(min_count=1)
+        f = links[links["relative_day"] == rel_day].merge(daily, on=["code", "real_date"], how="left")
+        out = out.merge(f[["event_id", col]].rename(columns={col: name}), on="event_id", how="left")
+    out["event_date"] = pd.to_datetime(out["event_date"], format="mixed")
+    return out.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    BASE_DIR = r"D:\我才不要走量化"
+    db_path = os.path.join(BASE_DIR, "Data_Warehouse", "event01.db")
+    tick_store_dir = os.path.join(BASE_DIR, "Data_Warehouse", "ticks_parquet")
+    refresh_info_metrics(db_path, tick_store_dir=tick_store_dir if os.path.isdir(tick_store_dir) else None)
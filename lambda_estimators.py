@@ -0,0 +1,218 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from oib_lambda import build_bucket_index, compute_oib, floor_window
+
+# ==========================================
+# Lambda 的其他估計方式 (批次求解)
+# ==========================================
+# compute_lambda 是每個 bucket 一條 OLS：dP ~ dVol。薄量股一個 bucket 只有幾筆，斜率很吵，這裡提供：
+#   spec   : 回歸式
+#     "dvol"       dP = a + λ·dVol                 (同 compute_lambda)
+#     "kyle"       dP = a + λ·q，q = side × volume  (signed volume，Kyle 1985)
+#     "kyle_psi"   dP = λ·q + ψ·Δside               (Glosten-Harris：另估固定成本 ψ，無截距)
+#   weight : None 或 "volume" (以每筆成交量加權，大單的價格變化比較可信)
+#   robust : Huber IRLS (c = 1.345，尺度為組內殘差 MAD，每輪重估)，壓低少數跳價 tick 的影響
+# 所有 bucket 一起解：X'WX (G × k × k) 與 X'Wy 由 bincount 加總，再以 np.linalg.inv 一次反矩陣；
+# IRLS 每一輪也是全部 bucket 一起更新權重，不做逐組 statsmodels fit。
+# se 為最後一輪 WLS 的 sqrt(σ² (X'WX)⁻¹)，robust 時只是近似值。
+
+HUBER_C = 1.345
+SPECS = {
+    "dvol": ("intercept", "lambda"),
+    "kyle": ("intercept", "lambda"),
+    "kyle_psi": ("lambda", "psi"),
+}
+
+
+@dataclass(frozen=True)
+class LambdaVariant:
+    name: str
+    spec: str = "dvol"
+    weight: str = None
+    robust: bool = False
+
+
+DEFAULT_VARIANTS = [
+    LambdaVariant("ols"),
+    LambdaVariant("huber", robust=True),
+    LambdaVariant("vw", weight="volume"),
+    LambdaVariant("kyle", spec="kyle"),
+    LambdaVariant("kyle_huber", spec="kyle", robust=True),
+    LambdaVariant("kyle_psi", spec="kyle_psi"),
+]
+
+
+# ==========================================
+# 1. 批次 WLS
+# ==========================================
+def batched_wls(group, X, y, w, n_groups):
+    """
+    每組各自的加權最小平方法。X: m × k，group: 每列的組別。
+    回傳 (coef G × k、inv(X'WX) G × k × k)；樣本不足或奇異的組為 NaN。
+    """
+    k = X.shape[1]
+    A = np.empty((n_groups, k, k))
+    b = np.empty((n_groups, k))
+    for i in range(k):
+        wx = w * X[:, i]
+        b[:, i] = np.bincount(group, weights=wx * y, minlength=n_groups)
+        for j in range(i, k):
+            A[:, i, j] = A[:, j, i] = np.bincount(group, weights=wx * X[:, j], minlength=n_groups)
+
+    # |det| <= 對角線乘積 (半正定)，相對值太小視為共線
+    diag = np.prod(np.diagonal(A, axis1=1, axis2=2), axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bad = ~(np.linalg.det(A) / diag > 1e-10)
+    A[bad] = np.eye(k)
+    inv = np.linalg.inv(A)
+    coef = np.einsum("gij,gj->gi", inv, b)
+    coef[bad] = np.nan
+    inv[bad] = np.nan
+    return coef, inv
+
+
+def group_median(group, values, n_groups):
+    """
+    每組的中位數；空組為 NaN。values 須 >= 0。
+    (組別, 值) 合成一個 float key 只排序一次，比 lexsort 快數倍；極接近的值順序可能互換，不影響中位數。
+    """
+    top = values.max() if len(values) else 0.0
+    key = group + (values / (top * (1 + 1e-9)) if top > 0 else 0.0)
+    v = values[np.argsort(key)]
+    counts = np.bincount(group, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    out = np.full(n_groups, np.nan)
+    has = counts > 0
+    lo = starts[has] + (counts[has] - 1) // 2
+    hi = starts[has] + counts[has] // 2
+    out[has] = (v[lo] + v[hi]) / 2
+    return out
+
+
+def _huber_scale(group, resid, n_groups):
+    """σ ≈ MAD / 0.6745；tick 的 dP 多半為 0 會讓 MAD = 0，這時改用平均絕對殘差 × √(π/2)"""
+    a = np.abs(resid)
+    scale = group_median(group, a, n_groups) / 0.6745
+    mean_abs = np.bincount(group, weights=a, minlength=n_groups) / np.maximum(np.bincount(group, minlength=n_groups), 1)
+    return np.where(scale > 0, scale, mean_abs * np.sqrt(np.pi / 2))
+
+
+def robust_wls(group, X, y, w, n_groups, c=HUBER_C, max_iter=50, tol=1e-6):
+    """
+    Huber IRLS：所有組一起迭代，每輪重估尺度與權重。
+    已收斂 (係數相對變動 <= tol) 的組之後不再參與，後面幾輪只剩少數難收斂的 bucket。
+    回傳 (coef, inv(X'WX), 最後的權重)
+    """
+    coef, inv = batched_wls(group, X, y, w, n_groups)
+    w_final = w.copy()
+    rows = np.arange(len(y))
+    g, Xa, ya, wa = group, X, y, w
+    active = np.ones(n_groups, dtype=bool)
+    for _ in range(max_iter):
+        resid = ya - np.einsum("mk,mk->m", Xa, coef[g])
+        scale = _huber_scale(g, resid, n_groups)[g]
+        a = np.abs(resid)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            hw = np.where(a <= c * scale, 1.0, c * scale / a)
+        hw[~np.isfinite(hw)] = 1.0
+        w_final[rows] = wa * hw
+        new, new_inv = batched_wls(g, Xa, ya, wa * hw, n_groups)
+
+        with np.errstate(invalid="ignore"):
+            change = np.max(np.abs(new - coef) / (np.abs(coef) + tol), axis=1)
+        coef[active] = new[active]
+        inv[active] = new_inv[active]
+        active &= change > tol
+        keep = active[g]
+        if not keep.any():
+            break
+        if not keep.all():
+            rows, g, Xa, ya, wa = rows[keep], g[keep], Xa[keep], ya[keep], wa[keep]
+    return coef, inv, w_final
+
+
+# ==========================================
+# 2. 估計
+# ==========================================
+def _design(ticks, index, spec, side_col):
+    close = index.take(ticks, "close").astype(float)
+    volume = index.take(ticks, "volume").astype(float)
+    dP = index.diff(close)
+    if spec == "dvol":
+        dVol = index.diff(volume)
+        return dP, np.column_stack([np.ones(len(dP)), dVol]), dVol
+
+    side = index.take(ticks, side_col).astype(float)
+    side = np.where(np.isnan(side), 0.0, side)
+    q = side * volume
+    if spec == "kyle":
+        return dP, np.column_stack([np.ones(len(dP)), q]), q
+    if spec == "kyle_psi":
+        return dP, np.column_stack([q, index.diff(side)]), q
+    raise ValueError(f"未知的 spec {spec}，可用：{', '.join(SPECS)}")
+
+
+def estimate_lambda(ticks, index, variant=LambdaVariant("ols"), side_col="side", lambda_col="lambda"):
+    """
+    每個 bucket 的 lambda (variant 見 LambdaVariant)。
+    回傳欄位同 compute_lambda：code, date, bucket, lambda, intercept, lambda_se, n_ticks (kyle_psi 另有 psi)
+    """
+    y, X, x_main = _design(ticks, index, variant.spec, side_col)
+    size = index.sizes[index.group]
+    valid = (size >= 3) & ~np.isnan(y) & ~np.isnan(X).any(axis=1)
+    grp = index.group[valid]
+    X, y, x_main = X[valid], y[valid], x_main[valid]
+    w = index.take(ticks, "volume").astype(float)[valid] if variant.weight == "volume" else np.ones(len(y))
+
+    G = index.n_groups
+    if variant.robust:
+        coef, inv, w = robust_wls(grp, X, y, w, G)
+    else:
+        coef, inv = batched_wls(grp, X, y, w, G)
+
+    names = SPECS[variant.spec]
+    k = len(names)
+    n = np.bincount(grp, minlength=G).astype(float)
+    resid = y - np.einsum("mk,mk->m", X, coef[grp])
+    # Σw·r² / (n - k) × (X'WX)⁻¹：權重整體放大縮小不影響結果
+    rss = np.bincount(grp, weights=w * resid * resid, minlength=G)
+    li = names.index("lambda")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        se = np.sqrt(rss / (n - k) * inv[:, li, li])
+    se[n <= k] = np.nan
+
+    out = index.keys.copy()
+    out[lambda_col] = coef[:, li]
+    out["intercept"] = coef[:, names.index("intercept")] if "intercept" in names else np.nan
+    out["lambda_se"] = se
+    out["n_ticks"] = n.astype(int)
+    if "psi" in names:
+        out["psi"] = coef[:, names.index("psi")]
+
+    sabs = np.bincount(grp, weights=np.abs(x_main), minlength=G)
+    keep = (n > 0) & (sabs != 0)
+    return out[keep].reset_index(drop=True)
+
+
+def compute_lambda_variants(ticks, windows, variants=DEFAULT_VARIANTS, side_col="side"):
+    """
+    同一份排序好的 ticks，對每個時間窗 × 每種估計方式算 lambda 與 info_pressure (= OIB × lambda)。
+    回傳 long format：window, variant, code, date, bucket, lambda, intercept, lambda_se, n_ticks, OIB, info_pressure
+    """
+    frames = []
+    for w in windows:
+        if isinstance(w, str):
+            w = floor_window(w)
+        index = build_bucket_index(ticks, w)
+        oib = compute_oib(ticks, index, side_col)[["code", "date", "bucket", "OIB"]]
+        for v in variants:
+            est = estimate_lambda(ticks, index, v, side_col=side_col)
+            est = est.merge(oib, on=["code", "date", "bucket"], how="inner")
+            est["info_pressure"] = est["OIB"] * est["lambda"]
+            est.insert(0, "variant", v.name)
+            est.insert(0, "window", w.name)
+            frames.append(est)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,311 @@
+import math
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from oib_lambda import DAY_NS, README_WINDOWS, compute_info_pressure, encode_side, floor_window, time_to_ns
+from tick_store import read_ticks
+from tick_writer import has_table, read_day_ticks
+
+# ==========================================
+# 盤中即時 OIB × Lambda (每筆 tick O(1) 更新)
+# ==========================================
+# 每個 (window, code, date, bucket) 一個 WindowAccumulator，只存加總：
+#   買 / 賣量、ΣdP、ΣdVol、ΣdP·dVol、ΣdVol²、ΣdP²、Σ|dVol| 與上一筆的價量
+# 任何時刻都能由加總算出 OIB、lambda (閉式 OLS，與 compute_lambda 相同公式) 與 info_pressure，
+# 9:30 一到就能對 watch-list 排名，9:35 進場前不必重跑批次。
+# 餵資料的介面與永豐 on_tick_stk_v1 callback 相同 (exchange, tick)：
+#   即時：engine.attach(api, contracts) 訂閱並掛上 callback
+#   回放：replay(engine, ticks) 把存下來的 ticks 依時間順序 (可加速) 推過同一個 callback，
+#         量測每筆延遲，並可用 check_against_batch 與 compute_info_pressure 的結果比對。
+
+LIVE_WINDOWS = README_WINDOWS
+
+
+class WindowAccumulator:
+    __slots__ = ("n_ticks", "n", "sx", "sy", "sxy", "sxx", "syy", "sabs",
+                 "buy", "sell", "n_signed", "last_close", "last_volume")
+
+    def __init__(self):
+        self.n_ticks = 0
+        self.n = 0
+        self.sx = self.sy = self.sxy = self.sxx = self.syy = self.sabs = 0.0
+        self.buy = self.sell = 0.0
+        self.n_signed = 0
+        self.last_close = self.last_volume = None
+
+    def update(self, close, volume, side):
+        self.n_ticks += 1
+        if side > 0:
+            self.buy += volume
+            self.n_signed += 1
+        elif side < 0:
+            self.sell += volume
+            self.n_signed += 1
+        if self.last_close is not None:
+            y = close - self.last_close
+            x = volume - self.last_volume
+            self.n += 1
+            self.sx += x
+            self.sy += y
+            self.sxy += x * y
+            self.sxx += x * x
+            self.syy += y * y
+            self.sabs += abs(x)
+        self.last_close = close
+        self.last_volume = volume
+
+    @property
+    def oib(self):
+        return self.buy - self.sell
+
+    def regression(self):
+        """(lambda, intercept, lambda_se)；樣本不足或 dVol 為常數時 lambda 為 NaN"""
+        n = self.n
+        if self.n_ticks < 3 or n == 0:
+            return math.nan, math.nan, math.nan
+        Sxx = self.sxx - self.sx * self.sx / n
+        Sxy = self.sxy - self.sx * self.sy / n
+        Syy = self.syy - self.sy * self.sy / n
+        slope = Sxy / Sxx if Sxx > 0 else math.nan
+        intercept = self.sy / n - slope * self.sx / n
+        se = math.nan
+        if n > 2 and Sxx > 0:
+            se = math.sqrt(max(Syy - slope * Sxy, 0.0) / (n - 2) / Sxx)
+        return slope, intercept, se
+
+    def ready(self):
+        """與批次版相同的保留條件：至少 3 筆、dVol 不全為 0、至少一筆有買賣方向"""
+        return self.n_ticks >= 3 and self.n > 0 and self.sabs != 0 and self.n_signed > 0
+
+
+def tick_side(tick_type):
+    """永豐 tick_type：1 外盤 → +1、2 內盤 → -1，其他 0 (同 encode_side)"""
+    return 1 if tick_type == 1 else -1 if tick_type == 2 else 0
+
+
+class OnlineInfoPressure:
+    """
+    engine = OnlineInfoPressure(windows, watch=["2330", "2317"])
+    engine.on_tick(code, ts, close, volume, tick_type)   或   engine.shioaji_callback(exchange, tick)
+    engine.ranking("0900_0930")                          → 當下 info_pressure 由大到小
+    """
+
+    def __init__(self, windows=LIVE_WINDOWS, watch=None):
+        self.windows = []
+        for w in windows:
+            if isinstance(w, str):
+                w = floor_window(w)
+            if w.freq is not None:
+                self.windows.append((w.name, pd.Timedelta(w.freq).value, None, None))
+            else:
+                self.windows.append((w.name, None, time_to_ns(w.start), time_to_ns(w.end)))
+        self.watch = None if watch is None else {str(c) for c in watch}
+        self.acc = {}
+        self.lock = threading.Lock()
+        self.n_ticks = 0
+
+    def on_tick(self, code, ts, close, volume, tick_type):
+        """ts 為 datetime / Timestamp (交易所當地時間)"""
+        code = str(code)
+        if self.watch is not None and code not in self.watch:
+            return
+        tod = ((ts.hour * 60 + ts.minute) * 60 + ts.second) * 1_000_000_000 + ts.microsecond * 1000
+        day = ts.date()
+        side = tick_side(tick_type)
+        close = float(close)
+        volume = float(volume)
+        with self.lock:
+            self.n_ticks += 1
+            for name, step, start, end in self.windows:
+                if step is not None:
+                    bucket = tod - tod % step
+                elif start <= tod < end:
+                    bucket = start
+                else:
+                    continue
+                key = (name, code, day, bucket)
+                acc = self.acc.get(key)
+                if acc is None:
+                    acc = self.acc[key] = WindowAccumulator()
+                acc.update(close, volume, side)
+
+    def shioaji_callback(self, exchange, tick):
+        """
+        永豐 TickSTKv1 callback：close 為 Decimal、volume 為張、datetime 為當地時間。
+        simtrade (集合競價前的試撮) 不是真的成交，歷史 ticks 也沒有，略過才會與批次結果一致。
+        """
+        if getattr(tick, "simtrade", False):
+            return
+        self.on_tick(tick.code, tick.datetime, tick.close, tick.volume, tick.tick_type)
+
+    def attach(self, api, contracts):
+        """即時訂閱：contracts 為 api.Contracts.Stocks[code] 的 list"""
+        import shioaji as sj
+
+        api.quote.set_on_tick_stk_v1_callback(self.shioaji_callback)
+        for c in contracts:
+            api.quote.subscribe(c, quote_type=sj.constant.QuoteType.Tick, version=sj.constant.QuoteVersion.v1)
+
+    def snapshot(self, window=None):
+        """
+        目前所有 bucket 的結果；欄位同 compute_info_pressure：
+        window, code, date, bucket, lambda, intercept, lambda_se, n_ticks, buy_volume, sell_volume, OIB, info_pressure
+        """
+        with self.lock:
+            items = [(k, a) for k, a in self.acc.items() if (window is None or k[0] == window) and a.ready()]
+            rows = []
+            for (name, code, day, bucket), a in items:
+                slope, intercept, se = a.regression()
+                rows.append((name, code, day, bucket, slope, intercept, se, a.n, a.buy, a.sell, a.oib))
+        out = pd.DataFrame(rows, columns=[
+            "window", "code", "date", "bucket", "lambda", "intercept", "lambda_se", "n_ticks",
+            "buy_volume", "sell_volume", "OIB",
+        ])
+        out["date"] = pd.to_datetime(out["date"])
+        out["bucket"] = out["date"] + pd.to_timedelta(out["bucket"].astype("int64"), unit="ns")
+        out["info_pressure"] = out["OIB"] * out["lambda"]
+        return out
+
+    def ranking(self, window, day=None):
+        """某時段 info_pressure 由大到小 (lambda 為 NaN 的排最後)；day 預設為最新的交易日"""
+        snap = self.snapshot(window)
+        if day is None and len(snap):
+            day = snap["date"].max()
+        if day is not None:
+            snap = snap[snap["date"] == pd.Timestamp(day)]
+        return snap.sort_values("info_pressure", ascending=False, na_position="last").reset_index(drop=True)
+
+
+# ==========================================
+# 回放
+# ==========================================
+def load_replay_ticks(db_path, date, codes=None, tick_store_dir=None):
+    """某個交易日的 ticks (code, ts, close, volume, tick_type)，依 ts 排序"""
+    date = str(pd.Timestamp(date).date())
+    cols = ["code", "ts", "close", "volume", "tick_type"]
+    if tick_store_dir:
+        df = read_ticks(tick_store_dir, codes=codes, dates=[date], columns=cols)
+    elif has_table(db_path, "day_ticks"):
+        conn = sqlite3.connect(db_path)
+        sql = "SELECT day_id FROM tick_days WHERE real_date = ?"
+        params = [date]
+        if codes is not None:
+            codes = [str(c) for c in codes]
+            sql += f" AND code IN ({', '.join('?' * len(codes))})"
+            params += codes
+        day_ids = [r[0] for r in conn.execute(sql, params)]
+        conn.close()
+        df = read_day_ticks(db_path, columns=tuple(cols), day_ids=day_ids)
+    else:
+        conn = sqlite3.connect(db_path)
+        df = pd.read_sql("SELECT DISTINCT code, ts, close, volume, tick_type FROM ticks WHERE real_date = ?",
+                         conn, params=(date,))
+        conn.close()
+        df["ts"] = pd.to_datetime(df["ts"], format="mixed")
+        if codes is not None:
+            df = df[df["code"].astype(str).isin([str(c) for c in codes])]
+    df["code"] = df["code"].astype(str)
+    return df.sort_values("ts", kind="stable").reset_index(drop=True)
+
+
+@dataclass
+class ReplayStats:
+    n_ticks: int
+    wall_seconds: float
+    latency_us: np.ndarray   # 每筆 callback 的處理時間 (微秒)
+
+    def summary(self):
+        lat = self.latency_us
+        return {
+            "n_ticks": self.n_ticks,
+            "wall_seconds": self.wall_seconds,
+            "ticks_per_sec": self.n_ticks / self.wall_seconds if self.wall_seconds > 0 else np.nan,
+            "latency_mean_us": float(lat.mean()) if len(lat) else np.nan,
+            "latency_p99_us": float(np.percentile(lat, 99)) if len(lat) else np.nan,
+            "latency_max_us": float(lat.max()) if len(lat) else np.nan,
+        }
+
+
+def replay(engine, ticks, speed=None, at=None, exchange="TSE"):
+    """
+    把 ticks (load_replay_ticks 的格式) 依時間順序推過 engine.shioaji_callback。
+    speed : None = 不等待全速回放；60 = 60 倍速 (依 tick 間隔 sleep)
+    at    : {"09:30": fn(engine, ts)}，第一筆 >= 該時間的 tick 送出前呼叫 (例如 9:30 排名)
+    """
+    ts = pd.to_datetime(ticks["ts"])
+    ts_ns = ts.to_numpy(dtype="datetime64[ns]").view("int64")
+    tod = ts_ns % DAY_NS
+    triggers = sorted((time_to_ns(t), fn) for t, fn in (at or {}).items())
+
+    codes = ticks["code"].astype(str).to_numpy()
+    close = ticks["close"].to_numpy(dtype=float)
+    volume = ticks["volume"].to_numpy()
+    tick_type = pd.to_numeric(ticks["tick_type"], errors="coerce").fillna(0).to_numpy(dtype=np.int64)
+    stamps = ts.dt.to_pydatetime()
+
+    latency = np.empty(len(ticks))
+    callback = engine.shioaji_callback
+    wall0 = time.perf_counter()
+    for i in range(len(ticks)):
+        while triggers and tod[i] >= triggers[0][0]:
+            triggers.pop(0)[1](engine, stamps[i])
+        if speed and i:
+            target = (ts_ns[i] - ts_ns[0]) / 1e9 / speed - (time.perf_counter() - wall0)
+            if target > 0:
+                time.sleep(target)
+        tick = SimpleNamespace(code=codes[i], datetime=stamps[i], close=close[i], volume=int(volume[i]),
+                               tick_type=int(tick_type[i]))
+        t0 = time.perf_counter()
+        callback(exchange, tick)
+        latency[i] = (time.perf_counter() - t0) * 1e6
+    for _, fn in triggers:
+        fn(engine, stamps[-1] if len(stamps) else None)
+    return ReplayStats(n_ticks=len(ticks), wall_seconds=time.perf_counter() - wall0, latency_us=latency)
+
+
+def check_against_batch(engine, ticks, windows=LIVE_WINDOWS):
+    """
+    回放後的即時結果 vs compute_info_pressure (同一份 ticks)。
+    回傳各欄位的最大相對誤差與兩邊的 bucket 數
+    """
+    batch_ticks = ticks.assign(side=encode_side(ticks["tick_type"]))
+    batch = compute_info_pressure(batch_ticks, windows)
+    live = engine.snapshot()
+    batch["code"] = batch["code"].astype(str)
+    m = batch.merge(live, on=["window", "code", "date", "bucket"], how="outer", suffixes=("_batch", "_live"),
+                    indicator=True)
+    out = {"n_batch": len(batch), "n_live": len(live), "n_unmatched": int((m["_merge"] != "both").sum())}
+    both = m[m["_merge"] == "both"]
+    for col in ("OIB", "lambda", "info_pressure"):
+        a, b = both[f"{col}_batch"].to_numpy(dtype=float), both[f"{col}_live"].to_numpy(dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rel = np.abs(a - b) / np.maximum(np.abs(a), 1e-12)
+        rel = rel[~(np.isnan(a) & np.isnan(b))]
+        out[f"max_rel_err_{col}"] = float(np.nanmax(rel)) if len(rel) else 0.0
+    return out
+
+
+if __name__ == "__main__":
+    import os
+
+    BASE_DIR = r"D:\我才不要走量化"
+    db_path = os.path.join(BASE_DIR, "Data_Warehouse", "event01.db")
+    date = "2021-01-21"
+
+    ticks = load_replay_ticks(db_path, date)
+    engine = OnlineInfoPressure(LIVE_WINDOWS)
+
+    def rank_at_0930(engine, ts):
+        print(f"⏰ {ts} 9:00~9:30 info_pressure 排名：")
+        print(engine.ranking("0900_0930").head(10)[["code", "OIB", "lambda", "info_pressure"]].to_string(index=False))
+
+    stats = replay(engine, ticks, at={"09:30": rank_at_0930})
+    for k, v in stats.summary().items():
+        print(f"  {k}: {v}")
+    print("🔍 與批次結果比對：", check_against_batch(engine, ticks))
@@ -0,0 +1,72 @@
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from oib_lambda import encode_side
+from tick_store import TICK_SCHEMA, write_tick_table
+from tick_writer import bump_day_versions, connect, has_table, migrate_legacy_ticks
+
+# ==========================================
+# 一次性搬移：side 改為寫入時算好的整數 (+1 買 / -1 賣 / 0)
+# ==========================================
+# 1. 舊版 ticks 表 (side TEXT 'b'/'s') → day_ticks + event_days，side 在搬移時算好
+# 2. day_ticks 中 side 為 NULL 的列 (早期沒有 side 欄位) → 依 tick_type 補一次
+# 3. parquet 儲存中沒有 side 欄位的檔案 → 補欄位後覆寫
+# 之後 code.py 不再需要 ALTER TABLE / UPDATE ticks SET side。
+
+BASE_DIR = r"D:\我才不要走量化"
+db_path = os.path.join(BASE_DIR, "Data_Warehouse", "event01.db")
+tick_store_dir = os.path.join(BASE_DIR, "Data_Warehouse", "ticks_parquet")
+DROP_LEGACY = False  # 搬完後是否刪掉舊 ticks 表 (刪完會 VACUUM，需要一段時間)
+
+
+def migrate_sqlite(db_path, drop_legacy=False):
+    if has_table(db_path, "ticks"):
+        print("🔄 搬移舊版 ticks 表 → day_ticks / event_days ...")
+        migrate_legacy_ticks(db_path)
+
+    conn = connect(db_path)
+    with conn:
+        # 補值的交易日內容變了：換新 version，info_metrics 下次會重算這些天
+        day_ids = [r[0] for r in conn.execute("SELECT DISTINCT day_id FROM day_ticks WHERE side IS NULL")]
+        n = conn.execute(
+            """
+            UPDATE day_ticks
+            SET side = CASE CAST(tick_type AS INTEGER) WHEN 1 THEN 1 WHEN 2 THEN -1 ELSE 0 END
+            WHERE side IS NULL
+            """
+        ).rowcount
+        bump_day_versions(conn, day_ids)
+    print(f"✓ day_ticks 補上 side：{n} 筆")
+
+    if drop_legacy and has_table(db_path, "ticks"):
+        # DROP 先在自己的 transaction 裡 commit，VACUUM 不能在 transaction 中執行
+        with conn:
+            conn.execute("DROP TABLE ticks")
+        conn.execute("VACUUM")
+        print("✓ 已刪除舊版 ticks 表")
+    conn.close()
+
+
+def migrate_store(root):
+    n = 0
+    for dirpath, _, files in os.walk(root):
+        for f in files:
+            if not f.endswith(".parquet"):
+                continue
+            path = os.path.join(dirpath, f)
+            if "side" in pq.read_schema(path).names:
+                continue
+            table = pq.read_table(path)
+            side = encode_side(table.column("tick_type").to_numpy(zero_copy_only=False))
+            table = table.append_column("side", pa.array(side, type=pa.int8())).cast(TICK_SCHEMA)
+            write_tick_table(path, table)
+            n += 1
+    print(f"✓ parquet 補上 side：{n} 個檔案")
+
+
+if __name__ == "__main__":
+    migrate_sqlite(db_path, drop_legacy=DROP_LEGACY)
+    if os.path.isdir(tick_store_dir):
+        migrate_store(tick_store_dir)
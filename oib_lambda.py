@@ -0,0 +1,302 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# OIB × Lambda 計算引擎
+# ==========================================
+# 1. sort_ticks：整張 tick 表只排序一次 (code, date, ts)，需要的欄位一次搬成排序後的陣列。
+# 2. build_bucket_index：對任一時間窗 (固定切割 5m/15m/30m 或 [start, end) 時段)，
+#    在已排序的陣列上直接切出分組邊界 offsets，不需重新排序。
+#    (同一天內 bucket 隨 ts 單調遞增，所以 (code, date, ts) 的順序也就是 (code, date, bucket, ts))
+# 3. OIB 與 Lambda 都吃同一份 index，diff 不會跨日、跨股票。
+# 4. Lambda 以閉式解 (closed-form OLS) 一次算完所有 bucket：
+#      slope     = Sxy / Sxx
+#      intercept = mean(dP) - slope * mean(dVol)
+#      se(slope) = sqrt( RSS / (n - 2) / Sxx )
+#    Sxx、Sxy、RSS 全部由分組加總 (ΣdP, ΣdVol, ΣdP·dVol, ΣdVol², ΣdP²) 得到。
+
+DAY_NS = 86_400 * 10**9
+
+
+def ts_to_ns(ts):
+    """把 ts 欄位轉成 int64 奈秒 (不論原本的 datetime 精度)"""
+    return pd.to_datetime(ts).to_numpy(dtype="datetime64[ns]").view("int64")
+
+
+def encode_side(tick_type):
+    """
+    Shioaji tick_type → side (int8)：1 (外盤/買) → +1，2 (內盤/賣) → -1，其他 (0 / 缺值) → 0
+    在寫入時算一次，OIB 直接用 side * volume。
+    """
+    t = pd.to_numeric(pd.Series(tick_type), errors="coerce").to_numpy(dtype=float)
+    return ((t == 1).astype(np.int8) - (t == 2).astype(np.int8))
+
+
+def time_to_ns(t):
+    """'09:30' / '09:30:00' → 距離午夜的奈秒數"""
+    return pd.Timedelta(str(t) if str(t).count(":") == 2 else f"{t}:00").value
+
+
+# ==========================================
+# 1. 時間窗設定
+# ==========================================
+@dataclass(frozen=True)
+class WindowSpec:
+    """
+    freq 有值：整天依 freq 固定切割 (例如 "30min")
+    否則：每天一個 [start, end) 時段 (例如 "09:00" ~ "09:30")
+    """
+    name: str
+    freq: str = None
+    start: str = None
+    end: str = None
+
+
+def floor_window(freq, name=None):
+    return WindowSpec(name=name or freq, freq=freq)
+
+
+def session_window(name, start, end):
+    return WindowSpec(name=name, start=start, end=end)
+
+
+# README 策略用到的時段；9:30:00～9:34:59 即 [09:30, 09:35)
+README_WINDOWS = [
+    session_window("0900_0930", "09:00", "09:30"),
+    session_window("1100_1130", "11:00", "11:30"),
+    session_window("1000_1200", "10:00", "12:00"),
+    session_window("0930_0935", "09:30", "09:35"),
+]
+
+
+# ==========================================
+# 2. 排序一次的 tick 陣列與分組索引
+# ==========================================
+@dataclass
+class SortedTicks:
+    """依 (code, date, ts) 排好的欄位陣列；code 以 factorize 後的整數表示"""
+    code_id: np.ndarray
+    code_uniques: np.ndarray
+    day: np.ndarray
+    ts_ns: np.ndarray
+    columns: dict
+
+    def __len__(self):
+        return len(self.ts_ns)
+
+
+def sort_ticks(df, columns=("close", "volume", "side")):
+    """只做一次 lexsort，把需要的欄位搬成排序後的 numpy 陣列"""
+    ts_ns = ts_to_ns(df["ts"])
+    code_id, code_uniques = pd.factorize(df["code"], sort=True)
+    day = ts_ns - ts_ns % DAY_NS
+    # 依 (code, ts) 寫入的來源 (tick store 的單日目錄) 通常已排好，檢查一次比 lexsort 便宜得多
+    prev, nxt = code_id[:-1], code_id[1:]
+    if np.all((nxt > prev) | ((nxt == prev) & (ts_ns[1:] >= ts_ns[:-1]))):
+        order = slice(None)
+    else:
+        order = np.lexsort((ts_ns, day, code_id))
+    return SortedTicks(
+        code_id=code_id[order],
+        code_uniques=np.asarray(code_uniques),
+        day=day[order],
+        ts_ns=ts_ns[order],
+        columns={c: df[c].to_numpy()[order] for c in columns if c in df.columns},
+    )
+
+
+@dataclass
+class BucketIndex:
+    """
+    某個時間窗下的分組索引。
+    rows    : 屬於此時間窗的 tick 在 SortedTicks 中的位置 (None 表示全部)
+    offsets : 長度 n_groups + 1 的分組邊界
+    group   : 每筆 tick 所屬的組別編號
+    keys    : 每組的 (code, date, bucket)
+    """
+    rows: np.ndarray
+    offsets: np.ndarray
+    group: np.ndarray
+    keys: pd.DataFrame
+
+    @property
+    def n_groups(self):
+        return len(self.offsets) - 1
+
+    @property
+    def sizes(self):
+        return np.diff(self.offsets)
+
+    def take(self, ticks, col):
+        values = ticks.columns[col]
+        return values if self.rows is None else values[self.rows]
+
+    def group_sum(self, values):
+        return np.bincount(self.group, weights=values, minlength=self.n_groups)
+
+    def diff(self, values):
+        """組內一階差分，每組第一筆為 NaN"""
+        out = np.empty(len(values), dtype=float)
+        out[0:1] = np.nan
+        np.subtract(values[1:], values[:-1], out=out[1:])
+        out[self.offsets[:-1]] = np.nan
+        return out
+
+
+def build_bucket_index(ticks, window, bucket_col="bucket"):
+    """
+    在已排序的 ticks 上切出 window 的分組邊界。
+    window 可以是 WindowSpec 或 freq 字串 (例如 "30min")。
+    """
+    if isinstance(window, str):
+        window = floor_window(window)
+
+    rows = None
+    c, d, ts = ticks.code_id, ticks.day, ticks.ts_ns
+    if window.freq is not None:
+        step = pd.Timedelta(window.freq).value
+        bucket = ts - ts % step
+    else:
+        start, end = time_to_ns(window.start), time_to_ns(window.end)
+        tod = ts - d
+        rows = np.flatnonzero((tod >= start) & (tod < end))
+        c, d = c[rows], d[rows]
+        bucket = d + start
+
+    change = np.empty(len(c), dtype=bool)
+    change[0:1] = True
+    change[1:] = (c[1:] != c[:-1]) | (d[1:] != d[:-1]) | (bucket[1:] != bucket[:-1])
+    starts = np.flatnonzero(change)
+
+    keys = pd.DataFrame({
+        "code": ticks.code_uniques[c[starts]],
+        "date": d[starts].astype("datetime64[ns]"),
+        bucket_col: bucket[starts].astype("datetime64[ns]"),
+    })
+    return BucketIndex(
+        rows=rows,
+        offsets=np.append(starts, len(c)),
+        group=np.cumsum(change) - 1,
+        keys=keys,
+    )
+
+
+# ==========================================
+# 3. 指標計算
+# ==========================================
+def compute_oib(ticks, index, side_col="side"):
+    """
+    每個 bucket 的買方量、賣方量與 OIB (= buy - sell，保留方向)。
+    只保留至少有一筆買或賣的 bucket (與舊版 groupby 結果一致)。
+    side_col：整數 side (寫入時由 tick_type 編碼) 以 0 表示未分類；
+              trade_sign 的 float side 以 NaN 表示未分類，可為 -1 ~ +1 的小數 (bulk volume)。
+    """
+    raw = index.take(ticks, side_col)
+    volume = index.take(ticks, "volume").astype(float)
+    if np.issubdtype(raw.dtype, np.floating):
+        classified = ~np.isnan(raw)
+        side = np.where(classified, raw, 0.0)
+    else:
+        classified = raw != 0
+        side = raw.astype(float)
+
+    # side 為 +1 / -1 / 0：signed volume 直接相乘，不做字串比對或布林篩選
+    oib_net = index.group_sum(side * volume)
+    gross = index.group_sum(classified * volume)
+    n_signed = index.group_sum(classified.astype(float))
+
+    oib = index.keys.copy()
+    oib["buy_volume"] = (gross + oib_net) / 2
+    oib["sell_volume"] = (gross - oib_net) / 2
+    oib["OIB"] = oib_net
+    return oib[n_signed > 0].reset_index(drop=True)
+
+
+def compute_lambda(ticks, index, lambda_col="lambda_30m"):
+    """
+    以分組加總計算每個 bucket 的 Kyle's lambda。
+    回傳欄位：code, date, bucket, lambda, intercept, lambda_se, n_ticks
+    """
+    close = index.take(ticks, "close").astype(float)
+    volume = index.take(ticks, "volume").astype(float)
+    dP = index.diff(close)
+    dVol = index.diff(volume)
+
+    # 原本：len(g) < 3 直接跳過；diff 後 dropna 掉第一筆
+    size = index.sizes[index.group]
+    valid = (size >= 3) & ~np.isnan(dP) & ~np.isnan(dVol)
+    grp = index.group[valid]
+    x = dVol[valid]
+    y = dP[valid]
+
+    def gsum(w):
+        return np.bincount(grp, weights=w, minlength=index.n_groups)
+
+    n = gsum(np.ones(len(x)))
+    sx, sy = gsum(x), gsum(y)
+    sxy, sxx, syy = gsum(x * y), gsum(x * x), gsum(y * y)
+    sabs = gsum(np.abs(x))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        Sxx = sxx - sx * sx / n
+        Sxy = sxy - sx * sy / n
+        Syy = syy - sy * sy / n
+        # dVol 在 bucket 內為常數時 Sxx = 0，斜率無法識別 → NaN
+        slope = np.where(Sxx > 0, Sxy / Sxx, np.nan)
+        intercept = sy / n - slope * sx / n
+        rss = np.clip(Syy - slope * Sxy, 0.0, None)
+        se = np.where(n > 2, np.sqrt(rss / (n - 2) / Sxx), np.nan)
+
+    lambda_df = index.keys.copy()
+    lambda_df[lambda_col] = slope
+    lambda_df["intercept"] = intercept
+    lambda_df["lambda_se"] = se
+    lambda_df["n_ticks"] = n.astype(int)
+
+    # 避免成交量變化總和為零
+    keep = (n > 0) & (sabs != 0)
+    return lambda_df[keep].reset_index(drop=True)
+
+
+def compute_vwap(ticks, index):
+    """每個 bucket 的成交量加權平均價 (回測的進出場價)；沒有成交量的 bucket 不輸出"""
+    close = index.take(ticks, "close").astype(float)
+    volume = index.take(ticks, "volume").astype(float)
+    pv = index.group_sum(close * volume)
+    vol = index.group_sum(volume)
+
+    vwap = index.keys.copy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vwap["vwap"] = pv / vol
+    vwap["volume"] = vol
+    return vwap[vol > 0].reset_index(drop=True)
+
+
+def compute_info_pressure(ticks, windows, side_col="side"):
+    """
+    一次排序，對多個時間窗計算 OIB、lambda 與 info_pressure (= OIB × lambda)。
+    ticks 可以是 DataFrame 或 sort_ticks 的結果；side_col 見 compute_oib。
+    回傳 long format：window, code, date, bucket, buy_volume, sell_volume, OIB,
+                     lambda, intercept, lambda_se, n_ticks, info_pressure
+    """
+    if isinstance(ticks, pd.DataFrame):
+        ticks = sort_ticks(ticks)
+
+    frames = []
+    for w in windows:
+        if isinstance(w, str):
+            w = floor_window(w)
+        index = build_bucket_index(ticks, w)
+        merged = pd.merge(
+            compute_lambda(ticks, index, lambda_col="lambda"),
+            compute_oib(ticks, index, side_col),
+            on=["code", "date", "bucket"],
+            how="inner",
+        )
+        merged["info_pressure"] = merged["OIB"] * merged["lambda"]
+        merged.insert(0, "window", w.name)
+        frames.append(merged)
+
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,166 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from oib_lambda import (
+    DAY_NS, compute_info_pressure, encode_side, floor_window, time_to_ns, ts_to_ns,
+)
+from tick_store import PARTITIONING, TICK_SCHEMA
+
+# ==========================================
+# 串流 (chunked) OIB × Lambda：記憶體上限 ≈ 一個 chunk
+# ==========================================
+# ticks 依 (code, real_date) 分區連續、分區內依 ts 排序讀進來，每次 fetchmany 一個 chunk。
+# chunk 的最後一個分區可能還沒讀完：
+#   cut = 各時間窗「最後一筆 tick 所在、還沒結束的 bucket」起點的最小值
+#   bucket 起點 < cut 的結果已經完整，直接輸出；>= cut 的 ticks 帶到下一個 chunk 重算。
+# 其他分區的 bucket 都已完整。結果與一次讀進記憶體的 compute_info_pressure 完全相同。
+# side 為 NULL (還沒跑 migrate_side 的舊資料) 時與 read_ticks 一樣由 tick_type 補算。
+
+DEFAULT_CHUNK_ROWS = 2_000_000
+
+
+def open_bucket_start(window, ts_ns):
+    """ts 所在 bucket 的起點 (ns)；ts 不在此時間窗內 (時段已結束或未開始) 回傳 None"""
+    if window.freq is not None:
+        step = pd.Timedelta(window.freq).value
+        return ts_ns - ts_ns % step
+    day = ts_ns - ts_ns % DAY_NS
+    start, end = day + time_to_ns(window.start), day + time_to_ns(window.end)
+    return start if start <= ts_ns < end else None
+
+
+# ==========================================
+# 1. 依分區順序讀 ticks
+# ==========================================
+def _fill_side(df):
+    """side 缺值的列由 tick_type 補算，之後丟掉 tick_type"""
+    missing = df["side"].isna().to_numpy()
+    side = df["side"].fillna(0).to_numpy(dtype=np.int8)
+    if missing.any():
+        side[missing] = encode_side(df["tick_type"].to_numpy()[missing])
+    df["side"] = side
+    return df.drop(columns="tick_type")
+
+
+def iter_sqlite_chunks(db_path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """day_ticks 依 (day_id, ts) 順序 fetchmany；每個 day_id 就是一個 (code, real_date)"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.execute(
+        "SELECT code, ts, close, volume, side, tick_type FROM day_ticks JOIN tick_days USING (day_id) "
+        "ORDER BY day_id, ts"
+    )
+    cols = ["code", "ts", "close", "volume", "side", "tick_type"]
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            df = pd.DataFrame.from_records(rows, columns=cols)
+            df["ts"] = df["ts"].to_numpy(dtype="int64").view("datetime64[ns]")
+            yield _fill_side(df)
+    finally:
+        conn.close()
+
+
+def iter_store_chunks(root, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    parquet 儲存：一個檔案一個分區 (檔內已依 ts 排序)，單執行緒掃描保持順序。
+    與 read_ticks 用同一個 schema，舊檔沒有 side 欄位時讀成 null 再補算。
+    """
+    schema = pa.unify_schemas([TICK_SCHEMA, PARTITIONING.schema])
+    dataset = ds.dataset(root, format="parquet", partitioning=PARTITIONING, schema=schema)
+    scanner = dataset.scanner(
+        columns=["code", "ts", "close", "volume", "side", "tick_type"], batch_size=chunk_rows, use_threads=False,
+    )
+    buf, n = [], 0
+    for batch in scanner.to_batches():
+        if batch.num_rows == 0:
+            continue
+        buf.append(batch.to_pandas())
+        n += batch.num_rows
+        if n >= chunk_rows:
+            yield _finish_store_chunk(buf)
+            buf, n = [], 0
+    if buf:
+        yield _finish_store_chunk(buf)
+
+
+def _finish_store_chunk(frames):
+    df = pd.concat(frames, ignore_index=True)
+    df["ts"] = df["ts"].to_numpy().view("datetime64[ns]")
+    return _fill_side(df)
+
+
+# ==========================================
+# 2. 串流計算
+# ==========================================
+def _bucket_ns(result, col):
+    return result[col].to_numpy(dtype="datetime64[ns]").view("int64")
+
+
+def stream_info_pressure(chunks, windows):
+    """
+    chunks：依分區順序的 tick DataFrame (code, ts, close, volume, side)
+    逐 chunk 產出已經完成的 bucket 結果 (欄位同 compute_info_pressure)
+    """
+    windows = [floor_window(w) if isinstance(w, str) else w for w in windows]
+    carry = None
+    prev = None  # 上一個 chunk 被切開的分區 (code, day, cut)
+
+    def emit(chunk, hold):
+        result = compute_info_pressure(chunk, windows)
+        if prev is not None:
+            # 帶過來的 ticks 也會落在 cut 之前 (上次已完整輸出) 的 bucket，這些只有部分資料，丟掉
+            code, day, cut = prev
+            dup = (result["code"] == code) & (_bucket_ns(result, "date") == day) & (_bucket_ns(result, "bucket") < cut)
+            result = result[~dup]
+        if hold is not None:
+            code, day, cut = hold
+            pending = (result["code"] == code) & (_bucket_ns(result, "date") == day) & (_bucket_ns(result, "bucket") >= cut)
+            result = result[~pending]
+        return result.reset_index(drop=True)
+
+    for chunk in chunks:
+        if carry is not None and len(carry):
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        if not len(chunk):
+            continue
+
+        last_code = chunk["code"].iloc[-1]
+        ts_ns = ts_to_ns(chunk["ts"])
+        last_ts = int(ts_ns[-1])
+        last_day = last_ts - last_ts % DAY_NS
+        starts = [s for s in (open_bucket_start(w, last_ts) for w in windows) if s is not None]
+        hold = (last_code, last_day, min(starts)) if starts else None
+
+        result = emit(chunk, hold)
+        if hold is None:
+            carry = None
+        else:
+            in_last = (chunk["code"] == last_code).to_numpy() & (ts_ns - ts_ns % DAY_NS == last_day)
+            carry = chunk[in_last & (ts_ns >= hold[2])]
+        prev = hold
+
+        if len(result):
+            yield result
+
+    if carry is not None and len(carry):
+        result = emit(carry, None)
+        if len(result):
+            yield result
+
+
+def compute_info_pressure_streaming(chunks, windows):
+    """把 stream_info_pressure 的結果接起來，排序與 compute_info_pressure 一致"""
+    parts = list(stream_info_pressure(chunks, windows))
+    if not parts:
+        return pd.DataFrame()
+    order = {w if isinstance(w, str) else w.name: i for i, w in enumerate(windows)}
+    out = pd.concat(parts, ignore_index=True)
+    out["_w"] = out["window"].map(order)
+    out = out.sort_values(["_w", "code", "date", "bucket"], kind="mergesort").drop(columns="_w")
+    return out.reset_index(drop=True)
@@ -0,0 +1,270 @@
+import itertools
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from backtest import StrategyConfig, load_event_calendar
+from info_metrics import event_metrics
+from oib_lambda import build_bucket_index, compute_vwap, floor_window, session_window, sort_ticks
+from tick_store import read_ticks
+from tick_writer import read_day_ticks
+
+# ==========================================
+# 策略參數掃描
+# ==========================================
+# 1. build_features：所有候選事件的特徵與價格只算一次
+#    - 資訊指標：T-1 各時段 (11:00~11:30、10:00~12:00 …)、T0 9:00~9:30
+#    - 每個 (code, 交易日) 的日統計：收盤價、成交值、9:30 前最後價、進出場 VWAP、各段最低價
+#      (日統計與事件無關，同一天被多場 event 用到也只算一次)
+# 2. 特徵矩陣存成 .npy，worker 以 np.load(mmap_mode="r") 唯讀共用，不必 pickle 整張表
+# 3. 每組參數在 worker 裡只做陣列篩選、排名、bincount，加一個參數維度幾乎不花時間
+# 同事建議對應的參數：max_gap (9:30 前漲幅上限)、min_turnover (T-1 成交值下限)、
+#   t1_window (10:00~12:00)、hold_days (受限於 event_days 只存到 T+2)、stop_loss (停損)
+# 停損以「進場後到出場前的最低價 <= 進場價 × (1 - stop_loss)」判定，並假設剛好成交在停損價。
+
+SHARES_PER_LOT = 1000  # tick 的 volume 單位是張
+T1_WINDOWS = ("1100_1130", "1000_1200")
+DAY_STATS = [
+    "close", "turnover", "p_0930", "entry_vwap", "exit_vwap", "low_post_entry", "low_pre_exit", "low",
+]
+
+DEFAULT_GRID = {
+    "top_n": [1, 2, 3],
+    "t1_window": list(T1_WINDOWS),
+    "t1_below": [0.0],
+    "t0_min": [0.0],
+    "max_gap": [np.inf, 0.07],
+    "min_turnover": [0.0, 30_000_000.0],
+    "hold_days": [1, 2],
+    "stop_loss": [np.inf, 0.03],
+}
+
+
+# ==========================================
+# 1. 特徵
+# ==========================================
+def _last(index, values):
+    return values[index.offsets[1:] - 1]
+
+
+def _min(index, values):
+    return np.minimum.reduceat(values, index.offsets[:-1]) if index.n_groups else values[:0]
+
+
+def day_stats(ticks, cfg=StrategyConfig()):
+    """每個 (code, date) 一列 (DAY_STATS)；ticks 為 sort_ticks 的結果"""
+    def keyed(index, name, values):
+        out = index.keys[["code", "date"]].copy()
+        out[name] = values
+        return out
+
+    close = ticks.columns["close"].astype(float)
+    volume = ticks.columns["volume"].astype(float)
+    day = build_bucket_index(ticks, floor_window("1D"))
+    stats = keyed(day, "close", _last(day, close))
+    stats["turnover"] = day.group_sum(close * volume) * SHARES_PER_LOT
+    stats["low"] = _min(day, close)
+
+    parts = []
+    pre = build_bucket_index(ticks, session_window("pre_0930", "00:00", "09:30"))
+    parts.append(keyed(pre, "p_0930", _last(pre, pre.take(ticks, "close").astype(float))))
+    post = build_bucket_index(ticks, session_window("post_entry", cfg.entry[1], "23:59:59"))
+    parts.append(keyed(post, "low_post_entry", _min(post, post.take(ticks, "close").astype(float))))
+    pre_exit = build_bucket_index(ticks, session_window("pre_exit", "00:00", cfg.exit[0]))
+    parts.append(keyed(pre_exit, "low_pre_exit", _min(pre_exit, pre_exit.take(ticks, "close").astype(float))))
+    for name, (start, end) in (("entry_vwap", cfg.entry), ("exit_vwap", cfg.exit)):
+        vwap = compute_vwap(ticks, build_bucket_index(ticks, session_window(name, start, end)))
+        parts.append(vwap[["code", "date", "vwap"]].rename(columns={"vwap": name}))
+
+    for p in parts:
+        stats = stats.merge(p, on=["code", "date"], how="left")
+    stats["code"] = stats["code"].astype(str)
+    stats["date"] = stats["date"].dt.strftime("%Y-%m-%d")
+    return stats[["code", "date"] + DAY_STATS]
+
+
+def build_features(db_path, cfg=StrategyConfig(), tick_store_dir=None, t1_windows=T1_WINDOWS, batch_days=2000):
+    """
+    每場 event 一列：date_0、T-1 / T0 指標，以及 T-1 ~ T+2 的日統計 ({stat}_{rel})。
+    ticks 依 batch_days 個交易日分批讀，記憶體只需一批。
+    """
+    features = {f"ip_t1_{w}": (w, -1) for w in t1_windows}
+    features["ip_t0"] = (cfg.t0_window, 0)
+    cal = load_event_calendar(db_path)
+    feats = cal.merge(event_metrics(db_path, features).drop(columns="code"), on="event_id", how="left")
+    feats = feats.dropna(subset=["date_0"]).reset_index(drop=True)
+
+    rels = (-1, 0, 1, 2)
+    pairs = pd.concat([
+        feats[["code", f"date_{r}", f"day_{r}"]].set_axis(["code", "date", "day_id"], axis=1) for r in rels
+    ]).dropna().drop_duplicates()
+    stats = []
+    for start in range(0, len(pairs), batch_days):
+        batch = pairs.iloc[start:start + batch_days]
+        if tick_store_dir:
+            df = read_ticks(tick_store_dir, codes=batch["code"].unique(), dates=batch["date"].unique(),
+                            columns=["code", "real_date", "ts", "close", "volume"])
+            df = df.merge(batch[["code", "date"]].rename(columns={"date": "real_date"}), on=["code", "real_date"])
+        else:
+            df = read_day_ticks(db_path, columns=("code", "ts", "close", "volume"), day_ids=batch["day_id"])
+        if len(df):
+            stats.append(day_stats(sort_ticks(df, columns=("close", "volume")), cfg))
+        print(f"✅ 日統計 {min(start + batch_days, len(pairs))} / {len(pairs)}")
+    stats = pd.concat(stats, ignore_index=True) if stats else pd.DataFrame(columns=["code", "date"] + DAY_STATS)
+
+    for r in rels:
+        s = stats.rename(columns={"date": f"date_{r}", **{c: f"{c}_{r}" for c in DAY_STATS}})
+        feats = feats.merge(s, on=["code", f"date_{r}"], how="left")
+    return feats
+
+
+# ==========================================
+# 2. 共用的特徵矩陣
+# ==========================================
+def feature_matrix(feats, t1_windows=T1_WINDOWS):
+    """
+    依 (date_0, ip_t0 由大到小) 排序後轉成 float64 矩陣，回傳 (矩陣, 欄名, 各 date_idx 對應的日期)。
+    排序固定，worker 取 top_n 只需在篩選後的列上算組內序號。
+    """
+    f = feats.sort_values(["date_0", "ip_t0"], ascending=[True, False], na_position="last").reset_index(drop=True)
+    cols = {
+        "date_idx": pd.factorize(f["date_0"], sort=True)[0].astype(float),
+        "ip_t0": f["ip_t0"],
+        "gap": f["p_0930_0"] / f["close_-1"] - 1,
+        "turnover_t1": f["turnover_-1"],
+        "entry": f["entry_vwap_0"],
+        "exit_1": f["exit_vwap_1"],
+        "exit_2": f["exit_vwap_2"],
+        # 進場後到出場前的最低價
+        "low_1": np.fmin(f["low_post_entry_0"], f["low_pre_exit_1"]),
+        "low_2": np.fmin(np.fmin(f["low_post_entry_0"], f["low_1"]), f["low_pre_exit_2"]),  # low_1：T+1 全天最低
+    }
+    for w in t1_windows:
+        cols[f"ip_t1_{w}"] = f[f"ip_t1_{w}"]
+    columns = list(cols)
+    matrix = np.column_stack([np.asarray(cols[c], dtype=float) for c in columns])
+    return matrix, columns, np.asarray(pd.factorize(f["date_0"], sort=True)[1])
+
+
+_shared = {}
+
+
+def _init_worker(path, columns, dates, cfg):
+    _shared["X"] = np.load(path, mmap_mode="r")
+    _shared["col"] = {c: i for i, c in enumerate(columns)}
+    _shared["dates"] = dates
+    _shared["cfg"] = cfg
+
+
+def sample_years(dates):
+    if not len(dates):
+        return 1.0
+    return max((pd.Timestamp(dates[-1]) - pd.Timestamp(dates[0])).days / 365.25, 1 / 252)
+
+
+def evaluate(params, X=None, col=None, dates=None, cfg=None):
+    """單組參數的回測指標；不給 X 時用 worker 共用的 memmap"""
+    X = _shared["X"] if X is None else X
+    col = _shared["col"] if col is None else col
+    dates = _shared["dates"] if dates is None else dates
+    cfg = _shared["cfg"] if cfg is None else cfg
+    n_dates = len(dates)
+
+    def c(name):
+        return X[:, col[name]]
+
+    hold = int(params["hold_days"])
+    mask = (c(f"ip_t1_{params['t1_window']}") < params["t1_below"]) & (c("ip_t0") >= params["t0_min"])
+    mask &= ~(c("gap") >= params["max_gap"])
+    mask &= ~(c("turnover_t1") < params["min_turnover"])
+    rows = np.flatnonzero(mask)
+
+    # 排序已是 (date, ip_t0 desc)：組內序號 < top_n 即為前 top_n 檔
+    date = c("date_idx")[rows].astype(np.int64)
+    first = np.empty(len(rows), dtype=bool)
+    first[0:1] = True
+    first[1:] = date[1:] != date[:-1]
+    start = np.maximum.accumulate(np.where(first, np.arange(len(rows)), 0))
+    rows = rows[np.arange(len(rows)) - start < params["top_n"]]
+
+    entry, exit_, low = c("entry")[rows], c(f"exit_{hold}")[rows], c(f"low_{hold}")[rows]
+    filled = (entry > 0) & (exit_ > 0)
+    rows, entry, exit_, low = rows[filled], entry[filled], exit_[filled], low[filled]
+    stop_price = entry * (1 - params["stop_loss"])
+    stopped = low <= stop_price
+    exit_ = np.where(stopped, stop_price, exit_)
+    net_ret = exit_ * (1 - cfg.sell_cost) / (entry * (1 + cfg.buy_cost)) - 1
+
+    # 當天等權：日報酬 = 成交檔數的平均報酬
+    date = c("date_idx")[rows].astype(np.int64)
+    n_day = np.bincount(date, minlength=n_dates)
+    day_ret = np.bincount(date, weights=net_ret, minlength=n_dates)
+    traded = n_day > 0
+    daily = day_ret[traded] / n_day[traded]
+
+    n_years = sample_years(dates)
+    sd = daily.std(ddof=1) if len(daily) > 1 else np.nan
+    return {
+        **params,
+        "n_trades": len(rows),
+        "n_days": int(traded.sum()),
+        "total_pnl": float(daily.sum() * cfg.capital),
+        "sharpe": float(daily.mean() / sd * np.sqrt(252)) if sd and sd > 0 else np.nan,
+        "hit_rate": float((net_ret > 0).mean()) if len(rows) else np.nan,
+        "avg_trade_ret": float(net_ret.mean()) if len(rows) else np.nan,
+        "stop_rate": float(stopped.mean()) if len(rows) else np.nan,
+        # 每年買進 + 賣出的成交金額 / 本金
+        "turnover": float(2 * traded.sum() / n_years),
+    }
+
+
+def _evaluate_chunk(chunk):
+    return [evaluate(p) for p in chunk]
+
+
+def param_grid(grid):
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def run_sweep(feats, grid=DEFAULT_GRID, cfg=StrategyConfig(), workers=None, chunk_size=64, workdir=None):
+    """在 process pool 跑完整個 grid；特徵矩陣以 memmap 共用。回傳依 sharpe 排序的結果表"""
+    t1_windows = tuple(grid.get("t1_window", T1_WINDOWS))
+    X, columns, dates = feature_matrix(feats, t1_windows)
+    params = param_grid(grid)
+    workers = os.cpu_count() if workers is None else workers
+
+    if workers <= 1:
+        col = {c: i for i, c in enumerate(columns)}
+        rows = [evaluate(p, X, col, dates, cfg) for p in params]
+    else:
+        with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+            path = os.path.join(tmp, "features.npy")
+            np.save(path, X)
+            chunks = [params[i:i + chunk_size] for i in range(0, len(params), chunk_size)]
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(path, columns, dates, cfg)) as pool:
+                rows = [r for part in pool.map(_evaluate_chunk, chunks) for r in part]
+    return pd.DataFrame(rows).sort_values("sharpe", ascending=False, na_position="last").reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    BASE_DIR = r"D:\我才不要走量化"
+    db_path = os.path.join(BASE_DIR, "Data_Warehouse", "event01.db")
+    tick_store_dir = os.path.join(BASE_DIR, "Data_Warehouse", "ticks_parquet")
+    out_dir = os.path.join(BASE_DIR, "法說會", "Backtest")
+    os.makedirs(out_dir, exist_ok=True)
+
+    t0 = time.perf_counter()
+    feats = build_features(db_path, tick_store_dir=tick_store_dir if os.path.isdir(tick_store_dir) else None)
+    print(f"⏱️ 特徵計算 {time.perf_counter() - t0:.1f} 秒，共 {len(feats)} 場 event")
+
+    t0 = time.perf_counter()
+    results = run_sweep(feats)
+    print(f"⏱️ 掃描 {len(results)} 組參數 {time.perf_counter() - t0:.1f} 秒")
+    print(results.head(20).to_string(index=False))
+    results.to_csv(os.path.join(out_dir, "sweep_results.csv"), index=False, encoding="utf-8-sig")
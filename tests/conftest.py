@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 腳本都放在 repo 根目錄 (沒有 package)，測試直接 import；放在最後，避免根目錄的 code.py 蓋掉標準庫
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,11 @@
+import numpy as np
+
+from ar_model import GAP, _window_sums
+
+
+def test_default_gap_keeps_estimation_out_of_event_window():
+    T, E = 400, 300
+    event_window = np.zeros((T, 1))
+    event_window[E - 10:E + 11] = 1.0
+    overlap = _window_sums(event_window, 250, GAP)[E - 10:E + 11, 0]
+    assert (overlap == 0).all()
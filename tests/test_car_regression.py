@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.formula.api as smf
+
+from car_regression import RegSpec, run_regressions
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(7)
+    n = 400
+    df = pd.DataFrame({
+        "code": rng.choice([f"{1100 + i}" for i in range(40)], n),
+        "event_date": rng.choice(pd.bdate_range("2021-01-04", periods=25), n),
+        "ip": rng.normal(size=n),
+        "size": rng.normal(size=n),
+    })
+    df["car"] = 0.3 * df["ip"] - 0.1 * df["size"] + rng.normal(scale=0.5, size=n)
+    df.loc[rng.choice(n, 30, replace=False), "ip"] = np.nan   # 各 spec 用自己的有效樣本
+    return df
+
+
+SPECS = [RegSpec("car~ip", "car", ("ip",)), RegSpec("car~ip+size", "car", ("ip",), ("size",))]
+
+
+def _statsmodels(df, spec, **fit_kwargs):
+    sample = df.dropna(subset=[spec.y, *spec.terms[1:]])
+    if "groups" in fit_kwargs:
+        fit_kwargs = {"cov_type": "cluster", "cov_kwds": {"groups": pd.factorize(sample[fit_kwargs.pop("groups")])[0]}}
+    fit = smf.ols(f"{spec.y} ~ {' + '.join(spec.terms[1:])}", data=sample).fit(**fit_kwargs)
+    return fit.params.to_numpy(), fit.bse.to_numpy(), fit.rsquared, len(sample)
+
+
+@pytest.mark.parametrize("cluster, fit_kwargs", [
+    (None, {"cov_type": "HC1"}),
+    ("date", {"groups": "event_date"}),
+    ("firm", {"groups": "code"}),
+])
+def test_pooled_matches_statsmodels(data, cluster, fit_kwargs):
+    table = run_regressions(data, SPECS, cluster=cluster, fama_macbeth=False)
+    for spec in SPECS:
+        got = table[table["spec"] == spec.name]
+        coef, se, r2, n_obs = _statsmodels(data, spec, **dict(fit_kwargs))
+        np.testing.assert_allclose(got["coef"], coef, rtol=1e-10)
+        np.testing.assert_allclose(got["se"], se, rtol=1e-10)
+        np.testing.assert_allclose(got["r2"], r2, rtol=1e-10)
+        assert (got["n_obs"] == n_obs).all()
+
+
+def test_fama_macbeth_matches_per_period_ols(data):
+    table = run_regressions(data, SPECS, cluster=None, fama_macbeth=True)
+    for spec in SPECS:
+        coefs = []
+        for _, g in data.groupby("event_date"):
+            g = g.dropna(subset=[spec.y, *spec.terms[1:]])
+            if len(g) > len(spec.terms):
+                coefs.append(smf.ols(f"{spec.y} ~ {' + '.join(spec.terms[1:])}", data=g).fit().params.to_numpy())
+        coefs = np.array(coefs)
+        got = table[(table["spec"] == spec.name) & (table["model"] == "fama_macbeth")]
+        np.testing.assert_allclose(got["coef"], coefs.mean(axis=0), rtol=1e-10)
+        np.testing.assert_allclose(got["se"], coefs.std(axis=0, ddof=1) / np.sqrt(len(coefs)), rtol=1e-10)
+        assert (got["n_groups"] == len(coefs)).all()
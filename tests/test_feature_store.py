@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_store import FeatureStore, monthly_release
+
+
+def _daily(rows):
+    return pd.DataFrame(rows, columns=["Code", "Date", "turnover"]).assign(Date=lambda d: pd.to_datetime(d["Date"]))
+
+
+def test_exclusive_table_never_returns_same_day_data():
+    daily = _daily([("2330", "2021-01-04", 1.0), ("2330", "2021-01-05", 2.0), ("2330", "2021-01-06", 3.0)])
+    store = FeatureStore().add("daily", daily, ["turnover"])
+    store.add("intraday", daily.rename(columns={"turnover": "gap"}), ["gap"], inclusive=True)
+
+    out = store.asof(["2330"] * 3, pd.to_datetime(["2021-01-04", "2021-01-05", "2021-01-07"]), with_dates=True)
+    np.testing.assert_array_equal(out["turnover"], [np.nan, 1.0, 3.0])
+    assert (out["daily_date"].dropna() < pd.to_datetime(["2021-01-05", "2021-01-07"])).all()
+    # inclusive 的表 (盤中已知) 當天即可用
+    np.testing.assert_array_equal(out["gap"], [1.0, 2.0, 3.0])
+
+
+def test_monthly_revenue_respects_release_lag():
+    rev = pd.DataFrame({
+        "Code": ["2330", "2330"],
+        "Month": pd.to_datetime(["2020-12-01", "2021-01-01"]),
+        "revenue_yoy": [0.1, 0.2],
+    })
+    store = FeatureStore().add("revenue", rev, ["revenue_yoy"], date_col="Month", release=monthly_release(10))
+
+    dates = pd.to_datetime(["2021-01-10", "2021-01-11", "2021-02-10", "2021-02-11"])
+    out = store.asof(["2330"] * 4, dates)
+    # 1 月營收 2/10 公告：2/10 當天 (收盤後才知道) 還看不到，2/11 才用得到
+    np.testing.assert_array_equal(out["revenue_yoy"], [np.nan, 0.1, 0.1, 0.2])
+
+
+def test_max_age_expires_stale_rows():
+    daily = _daily([("2330", "2021-01-04", 1.0), ("2317", "2021-01-04", 5.0)])
+    gap = _daily([("2330", "2021-01-05", 0.07)]).rename(columns={"turnover": "gap_0930"})
+    store = FeatureStore().add("daily", daily, ["turnover"]).add("open_gap", gap, ["gap_0930"], inclusive=True)
+
+    codes = ["2330", "2330", "2330", "2317"]
+    dates = pd.to_datetime(["2021-01-05", "2021-01-14", "2022-06-01", "2021-01-15"])
+    out = store.asof(codes, dates)
+    # daily 預設 10 天、open_gap 只能是當天
+    np.testing.assert_array_equal(out["turnover"], [1.0, 1.0, np.nan, np.nan])
+    np.testing.assert_array_equal(out["gap_0930"], [0.07, np.nan, np.nan, np.nan])
+
+    # 呼叫端可以放寬或收緊
+    wider = store.asof(codes, dates, max_age={"daily": 400})
+    np.testing.assert_array_equal(wider["turnover"], [1.0, 1.0, np.nan, 5.0])
+    assert np.isnan(store.asof(codes, dates, max_age=0)["turnover"]).all()
+
+
+@pytest.mark.parametrize("inclusive", [False, True])
+def test_asof_matches_merge_asof(inclusive):
+    rng = np.random.default_rng(0)
+    days = pd.bdate_range("2021-01-04", periods=60)
+    daily = pd.DataFrame({
+        "Code": rng.choice(["1101", "2317", "2330"], 150),
+        "Date": rng.choice(days, 150),
+        "turnover": rng.normal(size=150),
+    }).drop_duplicates(["Code", "Date"])
+    events = pd.DataFrame({
+        "code": rng.choice(["1101", "2317", "2330", "9999"], 200),
+        "date_0": rng.choice(pd.date_range("2021-01-01", "2021-04-15"), 200),
+    })
+    store = FeatureStore().add("daily", daily, ["turnover"], inclusive=inclusive, max_age=10**6)
+    got = store.attach(events, "code", "date_0")
+
+    expected = pd.merge_asof(
+        events.reset_index().sort_values("date_0"), daily.sort_values("Date"),
+        left_on="date_0", right_on="Date", left_by="code", right_by="Code", allow_exact_matches=inclusive,
+    ).sort_values("index")
+    np.testing.assert_array_equal(got["turnover"].to_numpy(), expected["turnover"].to_numpy())
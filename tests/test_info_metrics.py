@@ -0,0 +1,24 @@
+from info_metrics import refresh_info_metrics
+from tick_writer import TickWriter, _synthetic_day, bump_day_versions, connect
+
+
+def test_only_new_or_rewritten_days_are_recomputed(tmp_path):
+    db = str(tmp_path / "event.db")
+    writer = TickWriter(db)
+    days = [(d, rel, _synthetic_day(200, seed, d)) for seed, (d, rel) in enumerate([("2021-01-04", -1), ("2021-01-05", 0)])]
+    writer.add_event("2330_20210105", "2330", "2021-01-05", "14:00", days)
+    writer.close()
+
+    assert refresh_info_metrics(db) == 2
+    assert refresh_info_metrics(db) == 0
+
+    # 改寫既有交易日的 ticks (side 全部翻成賣方) 並換新 version
+    conn = connect(db)
+    day_id, = conn.execute("SELECT day_id FROM tick_days WHERE real_date = '2021-01-05'").fetchone()
+    with conn:
+        conn.execute("UPDATE day_ticks SET side = -1 WHERE day_id = ?", (day_id,))
+        bump_day_versions(conn, [day_id])
+    conn.close()
+
+    assert refresh_info_metrics(db) == 1
+    assert refresh_info_metrics(db) == 0
@@ -0,0 +1,70 @@
+import sqlite3
+
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+
+import tick_store
+from migrate_side import migrate_sqlite, migrate_store
+from oib_lambda import encode_side
+from tick_store import read_ticks, tick_path, write_tick_day
+from tick_writer import TickWriter, _legacy_save, _synthetic_day, has_table
+
+
+def test_migrates_legacy_ticks_and_backfills_side(tmp_path):
+    db = str(tmp_path / "event.db")
+    # 舊版 ticks 表：兩場 event 共用 2021-01-05
+    _legacy_save(db, _synthetic_day(30, seed=1), "2330_20210104", "2330", "2021-01-04", 0)
+    _legacy_save(db, _synthetic_day(40, 2, "2021-01-05"), "2330_20210104", "2330", "2021-01-05", 1)
+    _legacy_save(db, _synthetic_day(40, 2, "2021-01-05"), "2330_20210105", "2330", "2021-01-05", 0)
+    # 早期 day_ticks：side 還沒算 (NULL)
+    writer = TickWriter(db)
+    writer.add_event("2317_20210104", "2317", "2021-01-04", "14:00", [("2021-01-04", 0, _synthetic_day(25, seed=3))])
+    writer.close()
+    conn = sqlite3.connect(db)
+    with conn:
+        conn.execute("UPDATE day_ticks SET side = NULL")
+    conn.close()
+
+    migrate_sqlite(db, drop_legacy=True)
+
+    assert not has_table(db, "ticks")
+    conn = sqlite3.connect(db)
+    links = conn.execute("SELECT event_id, relative_day, code, real_date FROM event_days ORDER BY 1, 2").fetchall()
+    assert links == [
+        ("2317_20210104", 0, "2317", "2021-01-04"),
+        ("2330_20210104", 0, "2330", "2021-01-04"),
+        ("2330_20210104", 1, "2330", "2021-01-05"),
+        ("2330_20210105", 0, "2330", "2021-01-05"),
+    ]
+    # 共用的交易日只存一份
+    assert conn.execute("SELECT COUNT(*) FROM day_ticks").fetchone()[0] == 25 + 30 + 40
+    tick_type, side = np.array(conn.execute("SELECT tick_type, side FROM day_ticks").fetchall(), dtype=float).T
+    np.testing.assert_array_equal(side, encode_side(tick_type))
+    # 補過 side 的交易日換了新 version
+    versions = dict(conn.execute("SELECT code, COALESCE(version, day_id) > day_id FROM tick_days WHERE real_date = '2021-01-04'"))
+    assert versions == {"2317": 1, "2330": 0}
+    conn.close()
+
+
+def test_store_migration_crash_leaves_no_duplicate_ticks(tmp_path, monkeypatch):
+    root = str(tmp_path / "store")
+    write_tick_day(root, _synthetic_day(30, 1, "2021-01-04"), "2330", "2021-01-04")
+    path = tick_path(root, "2330", "2021-01-04")
+    pq.write_table(pq.read_table(path).drop(["side"]), path)
+
+    # 暫存檔寫完、換上之前中斷
+    def crash(src, dst):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(tick_store.os, "replace", crash)
+    with pytest.raises(KeyboardInterrupt):
+        migrate_store(root)
+    monkeypatch.undo()
+
+    assert len(read_ticks(root)) == 30
+    assert len(read_ticks(root, codes=["2330"], dates=["2021-01-04"])) == 30
+
+    migrate_store(root)
+    assert "side" in pq.read_schema(path).names
+    assert len(read_ticks(root)) == 30
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import statsmodels.formula.api as smf
+
+from oib_lambda import build_bucket_index, compute_lambda, floor_window, sort_ticks
+from tick_writer import _synthetic_day
+
+
+def _ols_baseline(ticks, freq="30min"):
+    """舊版做法：每個 (code, date, bucket) 各跑一次 smf.ols('dP ~ dVol')"""
+    df = ticks.sort_values(["code", "ts"], kind="mergesort").assign(
+        date=lambda d: d["ts"].dt.normalize(), bucket=lambda d: d["ts"].dt.floor(freq),
+    )
+    rows = []
+    for (code, date, bucket), g in df.groupby(["code", "date", "bucket"], sort=True):
+        if len(g) < 3:
+            continue
+        reg = pd.DataFrame({"dP": g["close"].diff(), "dVol": g["volume"].diff()}).dropna()
+        if reg["dVol"].abs().sum() == 0:
+            continue
+        fit = smf.ols("dP ~ dVol", data=reg).fit()
+        rows.append((code, date, bucket, fit.params["dVol"], fit.params["Intercept"], fit.bse["dVol"], len(reg)))
+    out = pd.DataFrame(rows, columns=["code", "date", "bucket", "lambda_30m", "intercept", "lambda_se", "n_ticks"])
+    return out.astype({"date": "datetime64[ns]", "bucket": "datetime64[ns]"})
+
+
+def test_lambda_matches_statsmodels():
+    ticks = pd.concat([
+        _synthetic_day(400, seed, date).assign(code=code)
+        for seed, (code, date) in enumerate([("1101", "2021-01-04"), ("2330", "2021-01-04"), ("2330", "2021-01-05")])
+    ] + [_synthetic_day(2, 9, "2021-01-06").assign(code="2330")], ignore_index=True)  # 少於 3 筆的 bucket 跳過
+
+    sorted_ticks = sort_ticks(ticks)
+    got = compute_lambda(sorted_ticks, build_bucket_index(sorted_ticks, floor_window("30min")))
+    expected = _ols_baseline(ticks)
+
+    assert len(got) == len(expected) > 0
+    pd.testing.assert_frame_equal(got[["code", "date", "bucket"]].astype({"code": str}),
+                                  expected[["code", "date", "bucket"]].astype({"code": str}))
+    for col in ["lambda_30m", "intercept", "lambda_se"]:
+        np.testing.assert_allclose(got[col], expected[col], rtol=1e-9, atol=1e-12)
+    np.testing.assert_array_equal(got["n_ticks"], expected["n_ticks"])
@@ -0,0 +1,56 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from migrate_side import migrate_sqlite
+from oib_lambda import encode_side
+from tick_cache import TickCache, build_tick_cache, is_stale
+from tick_writer import TickWriter, _synthetic_day
+
+
+def test_empty_db_builds_empty_cache(tmp_path):
+    db = str(tmp_path / "empty.db")
+    TickWriter(db).close()
+    cache_dir = str(tmp_path / "cache")
+
+    assert build_tick_cache(db, cache_dir) == 0
+    cache = TickCache.open(db, cache_dir)
+    assert len(cache) == 0
+    assert cache.window("2330_20210105") is None
+
+
+def test_cache_matches_written_days(tmp_path):
+    db = str(tmp_path / "event.db")
+    writer = TickWriter(db)
+    days = [("2021-01-04", -1, _synthetic_day(30, 1, "2021-01-04")),
+            ("2021-01-05", 0, _synthetic_day(40, 2, "2021-01-05"))]
+    writer.add_event("2330_20210105", "2330", "2021-01-05", "14:00", days)
+    writer.close()
+
+    cache = TickCache.open(db, str(tmp_path / "cache"))
+    assert len(cache) == 1
+    t0 = cache.window("2330_20210105", 0)
+    np.testing.assert_allclose(np.asarray(t0.price), days[1][2]["close"].to_numpy())
+    morning = cache.window("2330_20210105", 0, "09:00", "09:30")
+    assert len(morning) == int((days[1][2]["ts"] < pd.Timestamp("2021-01-05 09:30")).sum())
+
+
+def test_side_backfill_makes_cache_stale(tmp_path):
+    db = str(tmp_path / "event.db")
+    writer = TickWriter(db)
+    writer.add_event("2330_20210105", "2330", "2021-01-05", "14:00",
+                     [("2021-01-05", 0, _synthetic_day(50, 3, "2021-01-05"))])
+    writer.close()
+    conn = sqlite3.connect(db)
+    with conn:
+        conn.execute("UPDATE day_ticks SET side = NULL")
+    conn.close()
+
+    cache_dir = str(tmp_path / "cache")
+    assert not TickCache.open(db, cache_dir).window("2330_20210105", 0).side.any()
+
+    migrate_sqlite(db)
+    assert is_stale(db, cache_dir)
+    side = TickCache.open(db, cache_dir).window("2330_20210105", 0).side
+    np.testing.assert_array_equal(side, encode_side(_synthetic_day(50, 3, "2021-01-05")["tick_type"].to_numpy()))
@@ -0,0 +1,110 @@
+from types import SimpleNamespace
+
+import pandas as pd
+
+from tick_downloader import BYTES_PER_REQUEST, BYTES_PER_TICK, ByteBudget, FakeShioaji, download_events
+from trading_calendar import TradingCalendar
+
+N_TICKS = 10
+DATES = [d.strftime("%Y-%m-%d") for d in pd.bdate_range("2021-01-04", "2021-01-22")]
+
+
+def _fake_api(codes=("2330", "2317")):
+    ticks = {}
+    for code in codes:
+        for d in DATES:
+            ticks[(code, d)] = pd.DataFrame({
+                "ts": pd.date_range(f"{d} 09:00", periods=N_TICKS, freq="s"),
+                "close": [100.0] * N_TICKS, "volume": [1] * N_TICKS,
+            })
+    return FakeShioaji(ticks)
+
+
+def _run(api, events, existing_ids=(), limit_bytes=1 << 30, **kwargs):
+    saved = {}
+
+    def save_event(event_id, code, e_date, e_time, days):
+        saved[event_id] = [(d, rel) for d, rel, _ in days]
+
+    counts = download_events(api, events, save_event, set(existing_ids), limit_bytes, rate=1000, **kwargs)
+    return counts, saved
+
+
+def test_downloads_window_and_resumes_from_existing_ids():
+    api = _fake_api()
+    events = [("2330", "2021-01-08", "14:00"), ("2317", "2021-01-08", "14:00"), ("2330", "2021-01-13", "14:30")]
+    counts, saved = _run(api, events, existing_ids={"2317_20210108"}, workers=2)
+
+    assert counts["SUCCESS"] == 2 and counts["SKIPPED"] == 1
+    assert set(saved) == {"2330_20210108", "2330_20210113"}
+    # 2021-01-08 為週五：T+1 / T+2 跳過週末
+    assert saved["2330_20210108"] == [
+        ("2021-01-08", 0), ("2021-01-07", -1), ("2021-01-06", -2), ("2021-01-11", 1), ("2021-01-12", 2),
+    ]
+
+
+def test_limit_stops_downloads_without_partial_events():
+    api = _fake_api()
+    events = [("2330", "2021-01-08", "14:00"), ("2317", "2021-01-08", "14:00"), ("2330", "2021-01-13", "14:30")]
+    per_request = BYTES_PER_REQUEST + N_TICKS * BYTES_PER_TICK
+    counts, saved = _run(api, events, limit_bytes=7 * per_request, workers=1)
+
+    assert counts["SUCCESS"] == 1 and counts["STOPPED"] == 2
+    assert list(saved) == ["2330_20210108"]
+    # 熔斷後最多再多送出一個請求
+    assert api.bytes < 8 * per_request
+
+
+def test_unexpected_error_counts_as_error_and_pool_continues():
+    api = _fake_api()
+    events = [("2330", None, "14:00"), ("2330", "2021-01-08", "14:00")]
+    counts, saved = _run(api, events, workers=2)
+
+    assert counts["ERROR"] == 1 and counts["SUCCESS"] == 1
+    assert list(saved) == ["2330_20210108"]
+
+
+def test_calendar_probe_uses_downloader_budget(tmp_path):
+    api = _fake_api(codes=("2330",))
+    calendar = TradingCalendar(str(tmp_path / "cal.db"))
+    counts, saved = _run(api, [("2330", "2021-01-08", "14:00")], calendar=calendar,
+                         calendar_ref="2330", probe_query={"last_cnt": 1})
+
+    assert counts["SUCCESS"] == 1
+    assert calendar.days["2021-01-08"] == 1
+
+
+def test_budget_reconcile_adds_difference_only():
+    class Api:
+        bytes = 0
+        on_usage = None
+
+        def usage(self):
+            if self.on_usage:
+                self.on_usage()
+            return SimpleNamespace(bytes=self.bytes)
+
+    api = Api()
+    budget = ByteBudget(api, limit_bytes=1 << 30, reconcile_every=10**6)
+    per_request = BYTES_PER_REQUEST + N_TICKS * BYTES_PER_TICK
+    budget.charge(N_TICKS)
+    api.bytes = 5000
+    # usage() 進行中另一個 worker 記下一筆估算：校正後仍要算進去
+    api.on_usage = lambda: budget.charge(N_TICKS)
+    budget.reconcile()
+    assert budget.used == 5000 + per_request
+
+
+def test_write_failures_are_not_counted_as_success():
+    api = _fake_api()
+    events = [("2330", "2021-01-08", "14:00"), ("2317", "2021-01-08", "14:00")]
+    saved = []
+
+    def save_event(event_id, code, e_date, e_time, days):
+        if code == "2317":
+            raise RuntimeError("database is locked")
+        saved.append(event_id)
+
+    counts = download_events(api, events, save_event, set(), 1 << 30, workers=2, rate=1000)
+    assert counts["SUCCESS"] == 1 and counts["WRITE_FAILED"] == 1
+    assert saved == ["2330_20210108"]
@@ -0,0 +1,36 @@
+import sqlite3
+
+from tick_writer import TickWriter, _synthetic_day
+
+
+def _day(date):
+    return _synthetic_day(20, date=date)
+
+
+def test_discard_event_drops_partially_staged_event(tmp_path):
+    db = str(tmp_path / "event.db")
+    writer = TickWriter(db)
+    writer.add_event("2330_20210105", "2330", "2021-01-05", "14:00",
+                     [("2021-01-05", 0, _day("2021-01-05")), ("2021-01-06", 1, _day("2021-01-06"))])
+    # 第二場 event 抓到一半熔斷：2021-01-06 與第一場共用，2021-01-07 只屬於它
+    writer.add_day(_day("2021-01-06"), "2330_20210107", "2330", "2021-01-07", "14:00", "2021-01-06", -1)
+    writer.add_day(_day("2021-01-07"), "2330_20210107", "2330", "2021-01-07", "14:00", "2021-01-07", 0)
+    writer.discard_event("2330_20210107")
+    writer.close()
+
+    conn = sqlite3.connect(db)
+    assert [r[0] for r in conn.execute("SELECT DISTINCT event_id FROM event_days")] == ["2330_20210105"]
+    assert [r[0] for r in conn.execute("SELECT real_date FROM tick_days ORDER BY real_date")] == [
+        "2021-01-05", "2021-01-06",
+    ]
+    assert conn.execute("SELECT COUNT(*) FROM day_ticks").fetchone()[0] == 40
+    conn.close()
+
+    # resume：同一天重新暫存會拿到新的 day_id，不會撞到被丟掉的
+    writer = TickWriter(db)
+    writer.add_event("2330_20210107", "2330", "2021-01-07", "14:00",
+                     [("2021-01-06", -1, _day("2021-01-06")), ("2021-01-07", 0, _day("2021-01-07"))])
+    writer.close()
+    conn = sqlite3.connect(db)
+    assert conn.execute("SELECT COUNT(*) FROM day_ticks").fetchone()[0] == 60
+    conn.close()
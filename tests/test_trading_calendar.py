@@ -0,0 +1,89 @@
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+import pandas as pd
+
+from tick_downloader import ByteBudget, FakeShioaji, TickFetcher, TokenBucket
+from trading_calendar import TickDayCache, TradingCalendar
+
+
+def _ticks(n=3):
+    return pd.DataFrame({
+        "ts": pd.date_range("2021-01-05 09:00", periods=n, freq="s"),
+        "close": [100.0] * n, "volume": [1] * n,
+    })
+
+
+def test_probe_runs_outside_lock_and_persists(tmp_path):
+    db = str(tmp_path / "cal.db")
+    seen = []
+
+    def probe(d_str):
+        seen.append((d_str, cal.lock.locked()))
+        return d_str != "2021-01-06"
+
+    cal = TradingCalendar(db, probe=probe)
+    assert cal.is_open("2021-01-05")
+    assert not cal.is_open("2021-01-06")
+    assert not cal.is_open("2021-01-09")  # 週六不探測
+    assert seen == [("2021-01-05", False), ("2021-01-06", False)]
+
+    reloaded = TradingCalendar(db)
+    assert reloaded.days == {"2021-01-05": 1, "2021-01-06": 0}
+
+
+class _FlakyFetcher:
+    def __init__(self, fail_times):
+        self.fail_times = fail_times
+        self.calls = 0
+
+    def fetch(self, contract, date_str):
+        self.calls += 1
+        if self.calls <= self.fail_times:
+            raise ConnectionError("timeout")
+        return _ticks()
+
+
+def test_day_cache_does_not_remember_failures():
+    fetcher = _FlakyFetcher(fail_times=1)
+    cache = TickDayCache(fetcher)
+    contract = SimpleNamespace(code="2330")
+
+    assert cache.fetch(contract, "2021-01-05") is None
+    assert len(cache.fetch(contract, "2021-01-05")) == 3
+    assert len(cache.fetch(contract, "2021-01-05")) == 3
+    assert fetcher.calls == 2
+
+
+def test_calendar_probe_goes_through_fetcher():
+    api = FakeShioaji({("2330", "2021-01-05"): _ticks(5)})
+    budget = ByteBudget(api, limit_bytes=1 << 30)
+    fetcher = TickFetcher(api, TokenBucket(100), budget, threading.Event())
+    ref = api.Contracts.Stocks["2330"]
+
+    assert fetcher.probe(ref, "2021-01-05", last_cnt=1) is True
+    assert fetcher.probe(ref, "2021-01-06", last_cnt=1) is False
+    assert budget.requests == 2
+    assert api.calls == 2
+
+
+def test_locked_db_does_not_turn_fetched_day_into_no_ticks(tmp_path):
+    db = str(tmp_path / "event.db")
+    cal = TradingCalendar(db, probe=lambda d_str: True, timeout=0.05)
+    cache = TickDayCache(_FlakyFetcher(fail_times=0), calendar=cal)
+    contract = SimpleNamespace(code="2330")
+
+    # 另一條連線 (例如 TickWriter 正在 flush) 佔著寫入鎖
+    blocker = sqlite3.connect(db)
+    blocker.execute("BEGIN EXCLUSIVE")
+    try:
+        assert len(cache.fetch(contract, "2021-01-05")) == 3
+        assert cal.is_open("2021-01-06")
+    finally:
+        blocker.rollback()
+        blocker.close()
+
+    assert cal.days == {"2021-01-05": 1, "2021-01-06": 1}
+    assert len(cache.fetch(contract, "2021-01-05")) == 3
+    assert cache.fetcher.calls == 1
@@ -0,0 +1,221 @@
+import json
+import os
+import shutil
+import sqlite3
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from oib_lambda import DAY_NS, time_to_ns
+from tick_writer import read_day_ticks
+
+# ==========================================
+# 每場 event 的 tick 視窗快取 (memory-mapped)
+# ==========================================
+# 把每場 event T-2 ~ T+2 的 ticks 依 (event_id, relative_day, ts) 順序接成連續陣列，
+# 各欄位一個 .npy (ts int64 奈秒、price float64、volume int32、side int8)，以 mmap 開啟。
+# index.npz：(event_id, relative_day) → [start, stop)，同一場 event 的所有交易日也是連續的一段。
+# 取任一 event / 交易日 / 時段只是 searchsorted + slice，回傳的是 memmap 的 view，不複製資料。
+# 同一個交易日被多場 event 用到時會各存一份 (換取每場 event 連續)。
+# 來源是 tick_writer 的 day_ticks；舊的 ticks 表請先跑 tick_writer.migrate_legacy_ticks。
+
+COLUMNS = {"ts": np.int64, "price": np.float64, "volume": np.int32, "side": np.int8}
+SOURCE_COLS = {"ts": "ts", "price": "close", "volume": "volume", "side": "side"}
+
+
+@lru_cache(maxsize=None)
+def _tod_ns(t):
+    # pd.Timedelta 解析字串比 slice 本身慢得多，同一個時段字串只解析一次
+    return time_to_ns(t)
+
+
+@dataclass
+class TickWindow:
+    ts: np.ndarray
+    price: np.ndarray
+    volume: np.ndarray
+    side: np.ndarray
+
+    def __len__(self):
+        return len(self.ts)
+
+    def to_frame(self):
+        return pd.DataFrame({
+            "ts": self.ts.view("datetime64[ns]"), "close": self.price, "volume": self.volume, "side": self.side,
+        })
+
+
+def _source_signature(conn):
+    """
+    event_days / tick_days 的筆數、最大 day_id 與最大內容版本；有新資料寫入、
+    或既有交易日被改寫 (bump_day_versions，例如補 side) 就會不同
+    """
+    n_links, = conn.execute("SELECT COUNT(*) FROM event_days").fetchone()
+    n_days, max_day = conn.execute("SELECT COUNT(*), COALESCE(MAX(day_id), 0) FROM tick_days").fetchone()
+    cols = [row[1] for row in conn.execute("PRAGMA table_info(tick_days)")]
+    max_version = max_day
+    if "version" in cols:
+        max_version, = conn.execute("SELECT COALESCE(MAX(COALESCE(version, day_id)), 0) FROM tick_days").fetchone()
+    return [n_links, n_days, max_day, max_version]
+
+
+def build_tick_cache(db_path, cache_dir, batch_events=500):
+    """
+    由 day_ticks 建立快取；先寫到 cache_dir + ".tmp"，完成後再換上，建到一半不會留下壞掉的快取。
+    回傳總 tick 筆數。
+    """
+    conn = sqlite3.connect(db_path)
+    links = pd.read_sql(
+        "SELECT e.event_id, e.relative_day, e.day_id, e.real_date, t.n_ticks "
+        "FROM event_days e JOIN tick_days t USING (day_id) ORDER BY e.event_id, e.relative_day",
+        conn,
+    )
+    signature = _source_signature(conn)
+    conn.close()
+
+    n = links["n_ticks"].to_numpy(dtype=np.int64)
+    stops = np.cumsum(n)
+    starts = stops - n
+    total = int(stops[-1]) if len(stops) else 0
+
+    tmp = cache_dir + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    arrays = {
+        c: np.lib.format.open_memmap(os.path.join(tmp, f"{c}.npy"), mode="w+", dtype=dt, shape=(total,))
+        for c, dt in COLUMNS.items()
+    }
+
+    event_ids = links["event_id"].to_numpy()
+    # 空的 DB (還沒有任何 event)：不跑迴圈，直接寫出 0 筆的快取
+    first_of_event = np.flatnonzero(np.r_[True, event_ids[1:] != event_ids[:-1]]) if len(links) else np.array([], int)
+    bounds = np.r_[first_of_event, len(links)]
+    for b in range(0, len(bounds) - 1, batch_events):
+        lo, hi = bounds[b], bounds[min(b + batch_events, len(bounds) - 1)]
+        part = links.iloc[lo:hi]
+        ticks = read_day_ticks(db_path, columns=("day_id", "ts", "close", "volume", "side"), day_ids=part["day_id"].unique())
+        ticks = ticks.sort_values(["day_id", "ts"], kind="stable")
+        day_ids = ticks["day_id"].to_numpy()
+        day_bounds = np.searchsorted(day_ids, part["day_id"].to_numpy(), side="left")
+        # 依 event 順序取出每天的 ticks 位置，一次 fancy indexing 寫進 memmap
+        lens = part["n_ticks"].to_numpy(dtype=np.int64)
+        out_start = np.cumsum(lens) - lens
+        take = np.arange(lens.sum()) + np.repeat(day_bounds - out_start, lens)
+        dst = slice(int(starts[lo]), int(stops[hi - 1]))
+        for c, src in SOURCE_COLS.items():
+            values = ticks[src].to_numpy()
+            if c == "ts":
+                values = values.view("int64")
+            arrays[c][dst] = values[take].astype(COLUMNS[c])
+        print(f"✅ 快取 event {min(b + batch_events, len(bounds) - 1)} / {len(bounds) - 1}")
+
+    for a in arrays.values():
+        a.flush()
+    del arrays
+    np.savez(
+        os.path.join(tmp, "index.npz"),
+        event_id=event_ids.astype(str), relative_day=links["relative_day"].to_numpy(dtype=np.int8),
+        real_date=links["real_date"].to_numpy().astype(str), start=starts, stop=stops,
+    )
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"source": os.path.abspath(db_path), "signature": signature, "n_ticks": total}, f)
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp, cache_dir)
+    return total
+
+
+def is_stale(db_path, cache_dir):
+    meta_path = os.path.join(cache_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return True
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    conn = sqlite3.connect(db_path)
+    signature = _source_signature(conn)
+    conn.close()
+    return meta["signature"] != signature
+
+
+class TickCache:
+    """
+    cache = TickCache(cache_dir)
+    cache.window("2330_20210121", 0, "09:00", "09:30")  → TickWindow (memmap view)
+    cache.window("2330_20210121")                        → 整場 event (T-2 ~ T+2)
+    """
+
+    def __init__(self, cache_dir):
+        self.arrays = {c: np.load(os.path.join(cache_dir, f"{c}.npy"), mmap_mode="r") for c in COLUMNS}
+        index = np.load(os.path.join(cache_dir, "index.npz"))
+        self.starts = index["start"]
+        self.stops = index["stop"]
+        self.rel_days = index["relative_day"]
+        self.real_dates = index["real_date"]
+        ids = index["event_id"]
+        self.slots = {(e, int(r)): i for i, (e, r) in enumerate(zip(ids, self.rel_days))}
+        self.events = {}
+        for i, e in enumerate(ids):
+            first, last = self.events.get(e, (i, i))
+            self.events[e] = (first, i)
+
+    @classmethod
+    def open(cls, db_path, cache_dir, rebuild=True):
+        """快取不存在或 DB 有新資料時 (rebuild=True) 先重建"""
+        if rebuild and is_stale(db_path, cache_dir):
+            build_tick_cache(db_path, cache_dir)
+        return cls(cache_dir)
+
+    def __len__(self):
+        return len(self.events)
+
+    @property
+    def event_ids(self):
+        return list(self.events)
+
+    def _slice(self, start, stop):
+        return TickWindow(**{c: a[start:stop] for c, a in self.arrays.items()})
+
+    def span(self, event_id, relative_day=None):
+        """(start, stop)；找不到回傳 None"""
+        if relative_day is None:
+            slots = self.events.get(event_id)
+            return None if slots is None else (int(self.starts[slots[0]]), int(self.stops[slots[1]]))
+        i = self.slots.get((event_id, int(relative_day)))
+        return None if i is None else (int(self.starts[i]), int(self.stops[i]))
+
+    def window(self, event_id, relative_day=None, start=None, end=None):
+        """
+        event 的 ticks (relative_day=None 為整場)；start / end 為當日時段 [start, end)，需指定 relative_day。
+        找不到回傳 None。
+        """
+        span = self.span(event_id, relative_day)
+        if span is None:
+            return None
+        lo, hi = span
+        if (start is not None or end is not None) and relative_day is not None and hi > lo:
+            ts = self.arrays["ts"][lo:hi]
+            day = int(ts[0]) - int(ts[0]) % DAY_NS
+            if start is not None:
+                lo += int(np.searchsorted(ts, day + _tod_ns(start), side="left"))
+            if end is not None:
+                hi = span[0] + int(np.searchsorted(ts, day + _tod_ns(end), side="left"))
+        return self._slice(lo, max(lo, hi))
+
+
+if __name__ == "__main__":
+    BASE_DIR = r"D:\我才不要走量化"
+    db_path = os.path.join(BASE_DIR, "Data_Warehouse", "event01.db")
+    cache_dir = os.path.join(BASE_DIR, "Data_Warehouse", "tick_cache")
+
+    t0 = time.perf_counter()
+    cache = TickCache.open(db_path, cache_dir)
+    print(f"⏱️ 開啟快取 {time.perf_counter() - t0:.2f} 秒，共 {len(cache)} 場 event")
+
+    ids = cache.event_ids
+    t0 = time.perf_counter()
+    n = sum(len(cache.window(e, 0, "09:00", "09:30")) for e in ids)
+    dt = time.perf_counter() - t0
+    print(f"⚡ {len(ids)} 場 event 的 T0 9:00~9:30：{n} 筆 tick，平均每場 {dt / max(len(ids), 1) * 1e6:.1f} µs")
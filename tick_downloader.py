@@ -0,0 +1,318 @@
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pandas as pd
+
+from trading_calendar import TickDayCache, walk_days
+
+# ==========================================
+# 併發 tick 下載器 (worker pool + token bucket + 單一寫入執行緒)
+# ==========================================
+# - 多個 worker 同時抓不同 event，每次 api.ticks 前先向 TokenBucket 拿 token (限速)
+# - 流量用本地估算 (每筆 tick 約 BYTES_PER_TICK)，每 reconcile_every 次請求才呼叫 api.usage() 校正
+# - 超過 limit_bytes 觸發熔斷 (InterruptedError("TRAFFIC_LIMIT_REACHED"))，所有 worker 停止
+# - 一場 event 的 T-2 ~ T+2 全部抓完才交給寫入執行緒，DB 只有一條執行緒在寫
+#   (中途熔斷的 event 不會寫一半進 DB，下次 resume 會整場重抓)
+#   SUCCESS 在寫入執行緒的 save_event 成功後才計數；save_event 丟例外記成 WRITE_FAILED
+# - 有交易日曆時只對交易日發請求；(code, date) 經 TickDayCache 去重，重疊的 event 視窗不會重抓
+#   日曆探測未知日期也走同一個 TickFetcher (同樣限速、計入流量)
+
+BYTES_PER_TICK = 64
+BYTES_PER_REQUEST = 512
+
+
+class TokenBucket:
+    """每秒補 rate 個 token，最多累積 capacity 個；acquire 拿不到就等"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ByteBudget:
+    """
+    本地追蹤的流量預算。
+    charge() 以 tick 筆數估算流量；每 reconcile_every 次請求用 api.usage() 的真實值校正。
+    校正只加上差額：used = 上次 api.usage() + 之後的估算 (pending)，
+    呼叫 usage() 期間其他 worker 記下的估算不會被蓋掉。
+    """
+
+    def __init__(self, api, limit_bytes, reconcile_every=50):
+        self.api = api
+        self.limit_bytes = limit_bytes
+        self.reconcile_every = reconcile_every
+        self.used = 0
+        self.reported = 0
+        self.pending = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.reconcile()
+
+    def reconcile(self):
+        with self.lock:
+            counted = self.pending
+        try:
+            usage = self.api.usage()
+        except Exception as e:
+            print(f"⚠️ 無法取得流量資訊: {e}")
+            return
+        if usage is None:
+            return
+        with self.lock:
+            self.used += usage.bytes - self.reported - counted
+            self.reported = usage.bytes
+            self.pending -= counted
+        print(f"📊 目前流量使用: {self.used / 1024**3:.4f} GB / {self.limit_bytes / 1024**3:.4f} GB")
+
+    def charge(self, n_ticks):
+        with self.lock:
+            estimate = BYTES_PER_REQUEST + n_ticks * BYTES_PER_TICK
+            self.used += estimate
+            self.pending += estimate
+            self.requests += 1
+            due = self.requests % self.reconcile_every == 0
+        if due:
+            self.reconcile()
+
+    def exceeded(self):
+        return self.used >= self.limit_bytes
+
+
+class TickFetcher:
+    """
+    限速 + 流量控管後的 api.ticks。
+    fetch 失敗 (api 丟例外) 時照樣往外丟，由 TickDayCache 決定不快取；沒有 tick 回傳 None。
+    """
+
+    def __init__(self, api, bucket, budget, stop):
+        self.api = api
+        self.bucket = bucket
+        self.budget = budget
+        self.stop = stop
+
+    def fetch(self, contract, date_str):
+        if self.stop.is_set() or self.budget.exceeded():
+            self.stop.set()
+            raise InterruptedError("TRAFFIC_LIMIT_REACHED")
+
+        self.bucket.acquire()
+        try:
+            ticks = self.api.ticks(contract, date=date_str)
+            df = pd.DataFrame({**ticks})
+        except Exception:
+            self.budget.charge(0)
+            raise
+
+        self.budget.charge(len(df))
+        if df.empty:
+            return None
+        df['ts'] = pd.to_datetime(df['ts'])
+        df['close'] = df['close'].astype(float)
+        df['volume'] = df['volume'].astype(float)
+        return df
+
+    def probe(self, contract, date_str, **query):
+        """
+        交易日曆用：只抓少量 tick 判斷當天有沒有開盤 → True / False / None(無法判斷)。
+        query 直接傳給 api.ticks (例如 query_type=LastCount, last_cnt=1)；熔斷後不再發請求。
+        """
+        if self.stop.is_set() or self.budget.exceeded():
+            return None
+        self.bucket.acquire()
+        try:
+            n_ticks = len(pd.DataFrame({**self.api.ticks(contract, date=date_str, **query)}))
+        except Exception:
+            self.budget.charge(0)
+            return None
+        self.budget.charge(n_ticks)
+        return n_ticks > 0
+
+
+def parse_event_date(event_date_str):
+    for fmt in ('%Y-%m-%d', '%Y/%m/%d'):
+        try:
+            return datetime.strptime(event_date_str, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def fetch_event_days(fetcher, contract, event_date_obj, calendar=None):
+    """
+    與 process_single_event 相同的日期邏輯：
+    T=0 往後最多找 5 天；T-1, T-2 與 T+1, T+2 各往前/往後最多 20 天。
+    有 calendar 時只試交易日 (停牌沒 tick 的交易日照舊跳過)。
+    回傳 [(real_date_str, relative_day, df), ...]，找不到 T=0 回傳 None
+    """
+    days = []
+    real_t0 = None
+    for d in walk_days(event_date_obj, 1, 0, 4, calendar):
+        df = fetcher.fetch(contract, d.strftime('%Y-%m-%d'))
+        if df is not None:
+            real_t0 = d
+            days.append((d.strftime('%Y-%m-%d'), 0, df))
+            break
+    if real_t0 is None:
+        return None
+
+    for step in (-1, 1):
+        found = 0
+        for d in walk_days(real_t0, step, 1, 20, calendar):
+            df = fetcher.fetch(contract, d.strftime('%Y-%m-%d'))
+            if df is not None:
+                found += 1
+                days.append((d.strftime('%Y-%m-%d'), step * found, df))
+                if found == 2:
+                    break
+    return days
+
+
+def download_events(api, events, save_event, existing_ids, limit_bytes,
+                    workers=4, rate=5.0, burst=None, reconcile_every=50,
+                    calendar=None, store_dir=None, calendar_ref=None, probe_query=None):
+    """
+    併發下載多場 event。
+    events       : [(code, event_date_str, event_time_str), ...]
+    save_event   : save_event(event_id, code, event_date_str, event_time_str, days)，只會在寫入執行緒被呼叫
+    existing_ids : 已在 DB 的 event_id，直接跳過 (resume)
+    calendar     : TradingCalendar，有的話只對交易日發請求
+    calendar_ref : 日曆探測用的參考股票代號；有的話 calendar 的未知日期改由這裡的 TickFetcher 探測
+    probe_query  : 探測時額外傳給 api.ticks 的參數 (例如只抓最後一筆)
+    store_dir    : 欄式 tick 儲存，已存在的 (code, date) 直接讀檔不下載
+    回傳各狀態的計數 dict (SUCCESS 只算 save_event 成功的；失敗的記在 WRITE_FAILED)。
+    """
+    stop = threading.Event()
+    budget = ByteBudget(api, limit_bytes, reconcile_every=reconcile_every)
+    tick_fetcher = TickFetcher(api, TokenBucket(rate, burst), budget, stop)
+    if calendar is not None and calendar_ref is not None:
+        ref_contract = api.Contracts.Stocks[str(calendar_ref)]
+        calendar.probe = lambda d_str: tick_fetcher.probe(ref_contract, d_str, **(probe_query or {}))
+    fetcher = TickDayCache(tick_fetcher, store_dir=store_dir, calendar=calendar)
+    write_q = queue.Queue(maxsize=workers * 2)
+    counts = {"SUCCESS": 0, "SKIPPED": 0, "FAILED": 0, "ERROR": 0, "STOPPED": 0, "WRITE_FAILED": 0}
+    counts_lock = threading.Lock()
+
+    def count(status):
+        with counts_lock:
+            counts[status] += 1
+            if status == "SUCCESS" and counts["SUCCESS"] % 10 == 0:
+                print(f"⚡ 進度更新：新抓取 {counts['SUCCESS']} 筆...")
+
+    def writer():
+        while True:
+            item = write_q.get()
+            if item is None:
+                break
+            try:
+                save_event(*item)
+            except Exception as e:
+                print(f"⚠️ 寫入 DB 失敗 ({item[0]}): {e}")
+                count("WRITE_FAILED")
+            else:
+                count("SUCCESS")
+
+    def work(code, e_date, e_time):
+        event_date_obj = parse_event_date(e_date)
+        if event_date_obj is None:
+            return "ERROR"
+        event_id = f"{code}_{event_date_obj.strftime('%Y%m%d')}"
+        if event_id in existing_ids:
+            return "SKIPPED"
+        if stop.is_set():
+            return "STOPPED"
+
+        contract = api.Contracts.Stocks[str(code)]
+        if not contract:
+            return "ERROR"
+
+        try:
+            days = fetch_event_days(fetcher, contract, event_date_obj, calendar)
+        except InterruptedError:
+            return "STOPPED"
+        if days is None:
+            print(f"    放棄：{event_id} 找不到 T=0 交易日")
+            return "FAILED"
+
+        write_q.put((event_id, code, e_date, e_time, days))
+        return "QUEUED"
+
+    def run(event):
+        # 單場 event 的意外錯誤只記成 ERROR，不中斷整個 pool
+        try:
+            status = work(*event)
+        except Exception as e:
+            print(f"⚠️ {event[0]} {event[1]} 發生錯誤: {e}")
+            status = "ERROR"
+        if status != "QUEUED":
+            count(status)
+
+    writer_thread = threading.Thread(target=writer, name="tick-writer", daemon=True)
+    writer_thread.start()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for f in [pool.submit(run, e) for e in events]:
+                f.result()
+    finally:
+        write_q.put(None)
+        writer_thread.join()
+
+    print(f"🗂️ tick 日快取：下載 {fetcher.downloads} 次，命中 {fetcher.hits} 次")
+    if stop.is_set():
+        print(f"🛑 流量警報：已達到 {limit_bytes / 1024**3:.4f} GB 上限，啟動熔斷機制停止下載。")
+    return counts
+
+
+# ==========================================
+# 離線測試用：假的 Shioaji client
+# ==========================================
+class FakeShioaji:
+    """
+    提供 canned ticks 的假 api：ticks_by_day = {(code, 'YYYY-MM-DD'): DataFrame}
+    沒有資料的日期回傳空 ticks (相當於非交易日)；usage() 回傳實際送出的位元組估計。
+    """
+
+    def __init__(self, ticks_by_day, latency=0.0):
+        self.ticks_by_day = ticks_by_day
+        self.latency = latency
+        self.bytes = 0
+        self.calls = 0
+        self.lock = threading.Lock()
+        codes = {code for code, _ in ticks_by_day}
+        stocks = defaultdict(lambda: None, {c: SimpleNamespace(code=c) for c in codes})
+        self.Contracts = SimpleNamespace(Stocks=stocks)
+
+    def ticks(self, contract, date, last_cnt=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        df = self.ticks_by_day.get((contract.code, date))
+        if df is not None and last_cnt:
+            df = df.tail(last_cnt)
+        with self.lock:
+            self.calls += 1
+            self.bytes += BYTES_PER_REQUEST + (0 if df is None else len(df) * BYTES_PER_TICK)
+        if df is None:
+            return {"ts": [], "close": [], "volume": []}
+        return {c: df[c].tolist() for c in df.columns}
+
+    def usage(self):
+        return SimpleNamespace(bytes=self.bytes)
@@ -0,0 +1,216 @@
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from oib_lambda import encode_side
+
+# ==========================================
+# Parquet 欄式 tick 儲存 (取代 SQLite ticks 表)
+# ==========================================
+# 目錄結構 (hive partition)：
+#   {root}/real_date=2021-01-04/code=2330/part-0.parquet
+# 每個檔案 = 一檔股票一個交易日，重抓同一天直接覆寫。
+# side 在寫入時由 tick_type 算好 (+1 買 / -1 賣 / 0)。
+# ts 存成 int64 奈秒，另存 tod_ms (距午夜毫秒) 讓「9:00~9:30」這種條件可以用 row group 統計值跳過不需要的區塊。
+# 寫入時的暫存檔以 "." 開頭 (dataset 掃描會忽略)，寫到一半中斷留下的殘檔不會讓整個 store 讀不出來。
+
+TICK_SCHEMA = pa.schema([
+    ("ts", pa.int64()),
+    ("tod_ms", pa.int32()),
+    ("close", pa.float64()),
+    ("volume", pa.int64()),
+    ("bid_price", pa.float64()),
+    ("ask_price", pa.float64()),
+    ("tick_type", pa.int8()),
+    ("side", pa.int8()),
+])
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("real_date", pa.string()), ("code", pa.string())]),
+    flavor="hive",
+)
+
+ROW_GROUP_SIZE = 8192
+DAY_MS = 86_400_000
+
+
+def tick_path(root, code, real_date):
+    return os.path.join(root, f"real_date={real_date}", f"code={code}", "part-0.parquet")
+
+
+def to_tick_table(df):
+    """Shioaji ticks DataFrame → 有型別的 arrow table"""
+    ts_ns = pd.to_datetime(df["ts"]).to_numpy(dtype="datetime64[ns]").view("int64")
+    order = np.argsort(ts_ns, kind="stable")
+    ts_ns = ts_ns[order]
+
+    def col(name, dtype, fill):
+        if name not in df.columns:
+            return np.full(len(df), fill, dtype=dtype)
+        return pd.to_numeric(df[name], errors="coerce").fillna(fill).to_numpy(dtype=dtype)[order]
+
+    tick_type = col("tick_type", np.int8, 0)
+    return pa.table({
+        "ts": ts_ns,
+        "tod_ms": ((ts_ns // 1_000_000) % DAY_MS).astype(np.int32),
+        "close": col("close", np.float64, np.nan),
+        "volume": col("volume", np.int64, 0),
+        "bid_price": col("bid_price", np.float64, np.nan),
+        "ask_price": col("ask_price", np.float64, np.nan),
+        "tick_type": tick_type,
+        "side": encode_side(tick_type),
+    }, schema=TICK_SCHEMA)
+
+
+def write_tick_table(path, table):
+    """先寫到同目錄 "." 開頭的暫存檔再換上；中斷時 dataset 掃描看不到殘檔"""
+    folder, name = os.path.split(path)
+    os.makedirs(folder, exist_ok=True)
+    tmp = os.path.join(folder, f".{name}.tmp")
+    pq.write_table(table, tmp, compression="zstd", row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp, path)
+
+
+def write_tick_day(root, df, code, real_date):
+    """寫入 (覆寫) 一檔股票一天的 ticks"""
+    write_tick_table(tick_path(root, str(code), str(real_date)), to_tick_table(df))
+
+
+def has_tick_day(root, code, real_date):
+    return os.path.exists(tick_path(root, str(code), str(real_date)))
+
+
+def _time_ms(t):
+    return int(pd.Timedelta(str(t) if str(t).count(":") == 2 else f"{t}:00").value // 1_000_000)
+
+
+def _partition_files(root, codes, dates):
+    """codes / dates 對應的 part 檔路徑；只列出需要的 real_date 目錄，不掃整個 store"""
+    if dates is None:
+        date_dirs = list_dates(root)
+    else:
+        date_dirs = sorted({str(pd.Timestamp(d).date()) for d in dates})
+    wanted = None if codes is None else {str(c) for c in codes}
+    paths = []
+    for real_date in date_dirs:
+        folder = os.path.join(root, f"real_date={real_date}")
+        if not os.path.isdir(folder):
+            continue
+        for d in sorted(os.listdir(folder)):
+            if d.startswith("code=") and (wanted is None or d[5:] in wanted):
+                path = tick_path(root, d[5:], real_date)
+                if os.path.exists(path):
+                    paths.append(path)
+    return paths
+
+
+def read_ticks(root, codes=None, dates=None, start=None, end=None, columns=None):
+    """
+    讀取 ticks，條件會往下推到 partition 與 row group：
+      codes / dates : 只打開這些 code / real_date 的檔案 (由 tick_path 直接組出路徑，不掃整個 store)
+      start / end   : 當日時段 [start, end)，例如 "09:00", "09:30"
+      columns       : 只讀需要的欄位 (可含 code, real_date)
+    回傳 DataFrame，ts 為 datetime64[ns] (不需再 parse 字串)。
+    """
+    # 指定 schema：舊檔沒有 side 欄位時讀成 null (可用 migrate_side.py 補齊)
+    schema = pa.unify_schemas([TICK_SCHEMA, PARTITIONING.schema])
+    if codes is None and dates is None:
+        dataset = ds.dataset(root, format="parquet", partitioning=PARTITIONING, schema=schema)
+    else:
+        dataset = ds.dataset(_partition_files(root, codes, dates), format="parquet", partitioning=PARTITIONING,
+                             partition_base_dir=root, schema=schema)
+
+    expr = None
+
+    def both(a, b):
+        return b if a is None else a & b
+
+    if start is not None:
+        expr = both(expr, ds.field("tod_ms") >= _time_ms(start))
+    if end is not None:
+        expr = both(expr, ds.field("tod_ms") < _time_ms(end))
+
+    # 舊檔沒有 side 時由 tick_type 補算
+    read_cols = columns
+    if columns is not None and "side" in columns and "tick_type" not in columns:
+        read_cols = list(columns) + ["tick_type"]
+
+    table = dataset.to_table(columns=read_cols, filter=expr)
+    return _to_frame(table, columns, read_cols)
+
+
+def _to_frame(table, columns, read_cols):
+    df = table.to_pandas()
+    if "ts" in df.columns:
+        df["ts"] = df["ts"].to_numpy().view("datetime64[ns]")
+    if "side" in df.columns:
+        missing = df["side"].isna().to_numpy()
+        side = df["side"].fillna(0).to_numpy(dtype=np.int8)
+        if missing.any():
+            side[missing] = encode_side(df["tick_type"].to_numpy()[missing])
+        df["side"] = side
+    if read_cols is not columns:
+        df = df.drop(columns="tick_type")
+    return df
+
+
+def list_dates(root):
+    """store 裡有資料的交易日 (依日期排序)"""
+    if not os.path.isdir(root):
+        return []
+    return sorted(d.split("=", 1)[1] for d in os.listdir(root) if d.startswith("real_date="))
+
+
+def read_date_ticks(root, real_date, start=None, end=None, columns=None):
+    """
+    單一交易日全部股票的 ticks (全市場日因子用)。
+    只掃描該日的目錄，不必列出整個 store；code 讀成 categorical，百萬筆 tick 也不會產生大量字串。
+    """
+    path = os.path.join(root, f"real_date={real_date}")
+    codes = sorted(d.split("=", 1)[1] for d in os.listdir(path) if d.startswith("code="))
+    code_schema = pa.schema([("code", pa.dictionary(pa.int32(), pa.string()))])
+    part = ds.partitioning(code_schema, flavor="hive", dictionaries={"code": pa.array(codes, pa.string())})
+    dataset = ds.dataset(path, format="parquet", partitioning=part,
+                         schema=pa.unify_schemas([TICK_SCHEMA, code_schema]))
+
+    expr = None
+    if start is not None:
+        expr = ds.field("tod_ms") >= _time_ms(start)
+    if end is not None:
+        expr = (ds.field("tod_ms") < _time_ms(end)) if expr is None else expr & (ds.field("tod_ms") < _time_ms(end))
+
+    read_cols = columns
+    if columns is not None and "side" in columns and "tick_type" not in columns:
+        read_cols = list(columns) + ["tick_type"]
+    return _to_frame(dataset.to_table(columns=read_cols, filter=expr), columns, read_cols)
+
+
+def sqlite_to_store(db_path, root):
+    """
+    一次性搬移：把既有 SQLite ticks 表依 (code, real_date) 寫成 parquet。
+    以 event_id 逐場讀取 (走 idx_event_id)；同一個 (code, real_date) 被多場 event 抓過只保留一份。
+    """
+    conn = sqlite3.connect(db_path)
+    event_ids = [row[0] for row in conn.execute("SELECT DISTINCT event_id FROM ticks")]
+    n = 0
+    for event_id in event_ids:
+        df = pd.read_sql(
+            "SELECT code, real_date, ts, close, volume, bid_price, ask_price, tick_type "
+            "FROM ticks WHERE event_id = ?",
+            conn, params=(event_id,),
+        )
+        for (code, real_date), g in df.groupby(["code", "real_date"]):
+            if has_tick_day(root, code, real_date):
+                continue
+            g = g.assign(ts=pd.to_datetime(g["ts"], format="mixed"))
+            write_tick_day(root, g, code, real_date)
+            n += 1
+            if n % 500 == 0:
+                print(f"✅ 已搬移 {n} 個 (code, date)...")
+    conn.close()
+    print(f"🎉 搬移完成，共 {n} 個 (code, date)")
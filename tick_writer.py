@@ -0,0 +1,340 @@
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from oib_lambda import encode_side
+
+# ==========================================
+# 批次 SQLite tick 寫入器
+# ==========================================
+# - 整個下載過程只開一條連線 (WAL + synchronous=NORMAL)，多個交易日累積成一個 transaction 再 executemany
+# - event 的 metadata 不再複製到每一筆 tick：
+#     tick_days  : 每個 (code, real_date) 一列，給一個整數 day_id
+#                  version 為內容版本：NULL 表示寫入後沒改過 (視同 day_id)，
+#                  既有交易日的 ticks 被改寫 (例如補 side) 時由 bump_day_versions 換成更大的新值
+#     day_ticks  : 每筆 tick 只帶 day_id，ts 為 int64 奈秒 (day_id 遞增寫入，索引只在尾端 append)
+#                  side 在寫入時由 tick_type 算好：+1 買 / -1 賣 / 0
+#     event_days : (event_id, relative_day) → day_id 以及 event_date / event_time
+# - 同一個 (code, real_date) 被多場 event 需要時只存一份 ticks，多寫一列 event_days
+
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-262144",      # 256 MB
+    "PRAGMA mmap_size=1073741824",    # 1 GB
+]
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS tick_days (
+        day_id INTEGER PRIMARY KEY,
+        code TEXT,
+        real_date TEXT,
+        n_ticks INTEGER,
+        version INTEGER,
+        UNIQUE (code, real_date)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS day_ticks (
+        day_id INTEGER,
+        ts INTEGER,
+        close REAL,
+        volume REAL,
+        bid_price REAL,
+        ask_price REAL,
+        tick_type INTEGER,
+        side INTEGER
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_day_ticks ON day_ticks (day_id)",
+    """
+    CREATE TABLE IF NOT EXISTS event_days (
+        event_id TEXT,
+        relative_day INTEGER,
+        day_id INTEGER,
+        code TEXT,
+        event_date TEXT,
+        event_time TEXT,
+        real_date TEXT,
+        PRIMARY KEY (event_id, relative_day)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_event_days_day ON event_days (day_id)",
+]
+
+TICK_COLS = ["day_id", "ts", "close", "volume", "bid_price", "ask_price", "tick_type", "side"]
+INSERT_TICKS = f"INSERT INTO day_ticks ({', '.join(TICK_COLS)}) VALUES ({', '.join('?' * len(TICK_COLS))})"
+
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    for p in PRAGMAS:
+        conn.execute(p)
+    for stmt in SCHEMA:
+        conn.execute(stmt)
+    # 早期建立的 day_ticks 沒有 side 欄位：先補欄位，既有列由 migrate_side.py 一次補值
+    cols = [row[1] for row in conn.execute("PRAGMA table_info(day_ticks)")]
+    if "side" not in cols:
+        conn.execute("ALTER TABLE day_ticks ADD COLUMN side INTEGER")
+    # 早期的 tick_days 沒有 version 欄位：NULL 視同 day_id
+    cols = [row[1] for row in conn.execute("PRAGMA table_info(tick_days)")]
+    if "version" not in cols:
+        conn.execute("ALTER TABLE tick_days ADD COLUMN version INTEGER")
+    conn.commit()
+    return conn
+
+
+def bump_day_versions(conn, day_ids):
+    """
+    改寫既有交易日的 ticks 後呼叫 (與改寫放在同一個 transaction)：
+    這些 day 的 version 換成比所有 day_id / version 都大的新值，下游 (info_metrics) 才會重算。
+    """
+    day_ids = sorted(int(d) for d in day_ids)
+    if not day_ids:
+        return
+    stamp, = conn.execute("SELECT MAX(COALESCE(MAX(version), 0), COALESCE(MAX(day_id), 0)) + 1 FROM tick_days").fetchone()
+    for i in range(0, len(day_ids), 500):
+        chunk = day_ids[i:i + 500]
+        conn.execute(
+            f"UPDATE tick_days SET version = ? WHERE day_id IN ({', '.join('?' * len(chunk))})", [stamp, *chunk],
+        )
+
+
+def _column(df, name, dtype):
+    if name not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=dtype)
+
+
+def tick_rows(df, day_id):
+    """一天的 ticks → executemany 用的 row iterator (不複製 metadata 到 DataFrame)"""
+    ts_ns = pd.to_datetime(df["ts"]).to_numpy(dtype="datetime64[ns]").view("int64")
+    tick_type = _column(df, "tick_type", float)
+    return zip(
+        [day_id] * len(df),
+        ts_ns.tolist(),
+        _column(df, "close", float).tolist(),
+        _column(df, "volume", float).tolist(),
+        _column(df, "bid_price", float).tolist(),
+        _column(df, "ask_price", float).tolist(),
+        # INTEGER 欄位：1.0 會存成 1，NaN 存成 NULL
+        tick_type.tolist(),
+        encode_side(tick_type).tolist(),
+    )
+
+
+class TickWriter:
+    """
+    單一連線、批次 transaction 的寫入器。
+    add_day() 只先暫存；end_event() 在累積超過 batch_days 個交易日時才 commit，
+    所以同一場 event 的所有交易日一定在同一個 transaction 裡 (不會寫一半)。
+    """
+
+    def __init__(self, db_path, batch_days=50):
+        self.conn = connect(db_path)
+        self.batch_days = batch_days
+        self.day_ids = {
+            (code, real_date): day_id
+            for day_id, code, real_date in self.conn.execute("SELECT day_id, code, real_date FROM tick_days")
+        }
+        self.next_day_id = max(self.day_ids.values(), default=0) + 1
+        self.staged_ticks = []
+        self.staged_links = []
+        self.staged_keys = set()
+        self.rows_written = 0
+
+    def existing_event_ids(self):
+        return set(r[0] for r in self.conn.execute("SELECT DISTINCT event_id FROM event_days"))
+
+    def add_day(self, df, event_id, code, event_date, event_time, real_date, rel_day):
+        key = (str(code), str(real_date))
+        day_id = self.day_ids.get(key)
+        if day_id is None:
+            day_id = self.next_day_id
+            self.next_day_id += 1
+            self.day_ids[key] = day_id
+            self.staged_ticks.append((df, key, day_id))
+            self.staged_keys.add(key)
+        self.staged_links.append((event_id, rel_day, day_id, key[0], event_date, event_time, key[1]))
+
+    def add_event(self, event_id, code, event_date, event_time, days):
+        for real_date, rel_day, df in days:
+            self.add_day(df, event_id, code, event_date, event_time, real_date, rel_day)
+        self.end_event()
+
+    def end_event(self):
+        if len(self.staged_keys) >= self.batch_days:
+            self.flush()
+
+    def discard_event(self, event_id):
+        """
+        丟掉還沒 commit 的某場 event (例如抓到一半熔斷)，之後 close() 不會把半場 event 寫進 DB。
+        只被這場 event 用到的新交易日一併丟掉；已被其他暫存 event 引用的交易日保留。
+        """
+        self.staged_links = [link for link in self.staged_links if link[0] != event_id]
+        used = {link[2] for link in self.staged_links}
+        kept = []
+        for df, key, day_id in self.staged_ticks:
+            if day_id in used:
+                kept.append((df, key, day_id))
+            else:
+                del self.day_ids[key]
+                self.staged_keys.discard(key)
+        self.staged_ticks = kept
+
+    def flush(self):
+        if not self.staged_links:
+            return
+        with self.conn:
+            for df, (code, real_date), day_id in self.staged_ticks:
+                self.conn.execute(
+                    "INSERT INTO tick_days (day_id, code, real_date, n_ticks) VALUES (?, ?, ?, ?)",
+                    (day_id, code, real_date, len(df)),
+                )
+                self.conn.executemany(INSERT_TICKS, tick_rows(df, day_id))
+                self.rows_written += len(df)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO event_days "
+                "(event_id, relative_day, day_id, code, event_date, event_time, real_date) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self.staged_links,
+            )
+        self.staged_ticks, self.staged_links, self.staged_keys = [], [], set()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+def read_day_ticks(db_path, columns=("code", "ts", "close", "volume", "side"), day_ids=None):
+    """
+    讀 day_ticks (join tick_days 取 code / real_date)，ts 由 int64 奈秒直接轉 datetime。
+    day_ids 有值時只讀這些交易日 (走 idx_day_ticks)。
+    """
+    conn = sqlite3.connect(db_path)
+    sql = f"SELECT {', '.join(columns)} FROM day_ticks JOIN tick_days USING (day_id)"
+    if day_ids is None:
+        df = pd.read_sql(sql + " ORDER BY day_id", conn)
+    else:
+        day_ids = sorted(int(d) for d in day_ids)
+        parts = [
+            pd.read_sql(f"{sql} WHERE day_id IN ({', '.join('?' * len(chunk))}) ORDER BY day_id", conn, params=chunk)
+            for chunk in (day_ids[i:i + 500] for i in range(0, len(day_ids), 500))
+        ]
+        df = pd.concat(parts, ignore_index=True) if parts else pd.read_sql(sql + " LIMIT 0", conn)
+    conn.close()
+    if "ts" in df.columns:
+        df["ts"] = df["ts"].to_numpy(dtype="int64").view("datetime64[ns]")
+    if "side" in df.columns:
+        df["side"] = df["side"].fillna(0).to_numpy(dtype=np.int8)
+    return df
+
+
+def has_table(db_path, table):
+    conn = sqlite3.connect(db_path)
+    found = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table,)).fetchone()
+    conn.close()
+    return found is not None
+
+
+def migrate_legacy_ticks(db_path, batch_days=200):
+    """
+    一次性搬移：舊 ticks 表 (每筆 tick 帶 event metadata) → day_ticks + event_days。
+    以 event_id 逐場讀取 (走 idx_event_id)。
+    """
+    writer = TickWriter(db_path, batch_days=batch_days)
+    done = writer.existing_event_ids()
+    event_ids = [r[0] for r in writer.conn.execute("SELECT DISTINCT event_id FROM ticks")]
+    for i, event_id in enumerate(event_ids, 1):
+        if event_id in done:
+            continue
+        df = pd.read_sql("SELECT * FROM ticks WHERE event_id = ?", writer.conn, params=(event_id,))
+        for (real_date, rel_day), g in df.groupby(["real_date", "relative_day"]):
+            first = g.iloc[0]
+            g = g.assign(ts=pd.to_datetime(g["ts"], format="mixed"))
+            writer.add_day(g, event_id, first["code"], first["event_date"], first["event_time"],
+                           real_date, int(rel_day))
+        writer.end_event()
+        if i % 500 == 0:
+            print(f"✅ 已搬移 {i} / {len(event_ids)} 場 event...")
+    writer.close()
+    print(f"🎉 搬移完成，共寫入 {writer.rows_written} 筆 ticks")
+
+
+# ==========================================
+# Benchmark：舊 save_to_db (每天開連線 + to_sql) vs TickWriter
+# ==========================================
+def _synthetic_day(n, seed=0, date="2021-01-04"):
+    """一天 n 筆的假 ticks (09:00 ~ 13:30)；測試也共用"""
+    rng = np.random.default_rng(seed)
+    ts = pd.Timestamp(f"{date} 09:00") + pd.to_timedelta(np.sort(rng.integers(0, 16_200_000, n)), unit="ms")
+    close = 500 + np.cumsum(rng.choice([-0.5, 0, 0.5], n))
+    return pd.DataFrame({
+        "ts": ts,
+        "close": close,
+        "volume": rng.integers(1, 50, n).astype(float),
+        "bid_price": close - 0.5,
+        "ask_price": close,
+        "tick_type": rng.choice([0, 1, 2], n),
+    })
+
+
+def _legacy_save(db_path, df, event_id, code, real_date, rel_day):
+    df = df.copy()
+    df['event_id'] = event_id
+    df['code'] = str(code)
+    df['event_date'] = real_date
+    df['event_time'] = "14:00"
+    df['real_date'] = real_date
+    df['relative_day'] = rel_day
+    df['ts'] = df['ts'].astype(str)
+    cols = ['event_id', 'code', 'event_date', 'event_time', 'real_date', 'relative_day',
+            'ts', 'close', 'volume', 'bid_price', 'ask_price', 'tick_type']
+    local_conn = sqlite3.connect(db_path)
+    df[cols].to_sql("ticks", local_conn, if_exists="append", index=False)
+    local_conn.commit()
+    local_conn.close()
+
+
+def benchmark(n_ticks=50_000, n_days=20, workdir=None):
+    import os
+    import tempfile
+
+    workdir = workdir or tempfile.mkdtemp()
+    day = _synthetic_day(n_ticks)
+
+    # 舊版 schema 與 抓tickdata.py 相同 (含 idx_event_id)
+    legacy_db = os.path.join(workdir, "legacy.db")
+    conn = sqlite3.connect(legacy_db)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS ticks (event_id TEXT, code TEXT, event_date TEXT, event_time TEXT, "
+        "real_date TEXT, relative_day INTEGER, ts TEXT, close REAL, volume REAL, bid_price REAL, "
+        "ask_price REAL, side TEXT, tick_type TEXT)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_event_id ON ticks (event_id)")
+    conn.commit()
+    conn.close()
+    t = time.perf_counter()
+    for i in range(n_days):
+        _legacy_save(legacy_db, day, f"E{i}", 2330 + i, "2021-01-04", 0)
+    legacy = n_ticks * n_days / (time.perf_counter() - t)
+
+    new_db = os.path.join(workdir, "writer.db")
+    t = time.perf_counter()
+    writer = TickWriter(new_db, batch_days=10)
+    for i in range(n_days):
+        writer.add_event(f"E{i}", 2330 + i, "2021-01-04", "14:00", [("2021-01-04", 0, day)])
+    writer.close()
+    bulk = n_ticks * n_days / (time.perf_counter() - t)
+
+    print(f"📈 save_to_db : {legacy:,.0f} rows/s")
+    print(f"📈 TickWriter : {bulk:,.0f} rows/s  ({bulk / legacy:.1f}x)")
+    return legacy, bulk
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import norm, t as student_t
+
+# ==========================================
+# 交易方向分類 (trade-sign classification)
+# ==========================================
+# 全部在 sort_ticks 排好的陣列上做，以 (code, date) 為組，不逐筆迴圈、不跨日跨股票：
+#   tick_type    : 永豐 tick_type (1 外盤 +1、2 內盤 -1)，0 / 缺值為未分類
+#   tick_rule    : 成交價比前一筆高 → 買、低 → 賣；價格不變沿用前一個非零方向 (zero-tick)
+#   quote        : 成交價 > 買賣中價 → 買、< 中價 → 賣 (中價或報價缺值為未分類)
+#   lee_ready    : quote，成交在中價或沒有報價時改用 tick_rule
+#   tick_type_lr : tick_type，未分類 (tick_type 0，多為集合競價) 的改用 lee_ready
+#   bvc          : bulk volume classification。每根 bar 的買方比例 = Φ(ΔP / σ)，
+#                  ΔP 為 bar 收盤價變化、σ 為當日各 bar ΔP 的標準差；side = 2Φ - 1 (小數)
+# 回傳 float 陣列：-1 ~ +1，NaN 表示未分類。
+# compute_oib(..., side_col=...) 可直接吃這個欄位：buy = Σ V (1 + s) / 2、sell = Σ V (1 - s) / 2，
+# 所以 bvc 的小數方向也能正確拆成買賣量。
+# 用法：ticks = sort_ticks(df, columns=SIGN_COLUMNS)；ticks.columns["side_lr"] = classify(ticks, "lee_ready")
+
+SIGN_COLUMNS = ("close", "volume", "side", "bid_price", "ask_price")
+
+
+def _group_start(ticks):
+    """每個 (code, date) 的第一筆"""
+    c, d = ticks.code_id, ticks.day
+    start = np.empty(len(c), dtype=bool)
+    start[0:1] = True
+    start[1:] = (c[1:] != c[:-1]) | (d[1:] != d[:-1])
+    return start
+
+
+def _ffill_nonzero(sign, start):
+    """組內把 0 換成前一個非零值；組內第一個非零值之前為 NaN"""
+    pos = np.arange(len(sign))
+    keep = (sign != 0) | start
+    last = np.maximum.accumulate(np.where(keep, pos, 0))
+    out = sign[last].astype(float)
+    out[out == 0] = np.nan
+    return out
+
+
+def from_tick_type(ticks):
+    side = ticks.columns["side"].astype(float)
+    side[side == 0] = np.nan
+    return side
+
+
+def tick_rule(ticks):
+    price = ticks.columns["close"].astype(float)
+    start = _group_start(ticks)
+    sign = np.zeros(len(price))
+    sign[1:] = np.sign(price[1:] - price[:-1])
+    sign[start] = 0
+    return _ffill_nonzero(sign, start)
+
+
+def quote_rule(ticks):
+    price = ticks.columns["close"].astype(float)
+    bid = ticks.columns["bid_price"].astype(float)
+    ask = ticks.columns["ask_price"].astype(float)
+    ok = (bid > 0) & (ask >= bid)
+    with np.errstate(invalid="ignore"):
+        side = np.sign(price - (bid + ask) / 2)
+    side[~ok | (side == 0)] = np.nan
+    return side
+
+
+def lee_ready(ticks):
+    side = quote_rule(ticks)
+    missing = np.isnan(side)
+    side[missing] = tick_rule(ticks)[missing]
+    return side
+
+
+def tick_type_lee_ready(ticks):
+    side = from_tick_type(ticks)
+    missing = np.isnan(side)
+    side[missing] = lee_ready(ticks)[missing]
+    return side
+
+
+def bulk_volume(ticks, bar="1min", dof=None):
+    """
+    bar 內所有成交同一個方向 2Φ(ΔP / σ) - 1。
+    第一根 bar 的 ΔP 為 bar 內 (收 - 開)，其餘為本根收盤 - 前一根收盤；σ 為同一 (code, date) 各 bar ΔP 的標準差。
+    dof 有值時 Φ 改用 t 分配 (尾部較厚)。σ = 0 (整天沒變價) 時買賣各半 (side = 0)。
+    """
+    price = ticks.columns["close"].astype(float)
+    ts = ticks.ts_ns
+    step = pd.Timedelta(bar).value
+    bucket = ts - ts % step
+    start = _group_start(ticks)
+
+    change = start.copy()
+    change[1:] |= bucket[1:] != bucket[:-1]
+    bar_start = np.flatnonzero(change)
+    bar_id = np.cumsum(change) - 1
+    bar_end = np.append(bar_start[1:], len(price)) - 1
+    close = price[bar_end]
+    first_bar = start[bar_start]
+    dp = np.empty(len(bar_start))
+    dp[1:] = close[1:] - close[:-1]
+    dp[first_bar] = close[first_bar] - price[bar_start[first_bar]]
+
+    # 每個 (code, date) 的 ΔP 標準差 (ddof = 1)
+    day_id = np.cumsum(first_bar) - 1
+    n = np.bincount(day_id).astype(float)
+    s1 = np.bincount(day_id, weights=dp)
+    s2 = np.bincount(day_id, weights=dp * dp)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var = np.clip((s2 - s1 * s1 / n) / (n - 1), 0.0, None)
+        z = dp / np.sqrt(var)[day_id]
+    z[~np.isfinite(z)] = 0.0
+    cdf = norm.cdf(z) if dof is None else student_t.cdf(z, dof)
+    return (2 * cdf - 1)[bar_id]
+
+
+METHODS = {
+    "tick_type": from_tick_type,
+    "tick_rule": tick_rule,
+    "quote": quote_rule,
+    "lee_ready": lee_ready,
+    "tick_type_lr": tick_type_lee_ready,
+    "bvc": bulk_volume,
+}
+
+
+def classify(ticks, method="lee_ready", **kwargs):
+    """依 method 名稱分類，回傳 float side (排序同 ticks)"""
+    if method not in METHODS:
+        raise ValueError(f"未知的分類方法 {method}，可用：{', '.join(METHODS)}")
+    return METHODS[method](ticks, **kwargs)
+
+
+def add_side(ticks, method="lee_ready", col=None, **kwargs):
+    """把分類結果放進 ticks.columns，回傳欄位名稱 (給 compute_oib 的 side_col)"""
+    col = col or f"side_{method}"
+    ticks.columns[col] = classify(ticks, method, **kwargs)
+    return col
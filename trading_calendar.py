@@ -0,0 +1,173 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from tick_store import has_tick_day, read_ticks
+
+# ==========================================
+# 交易日曆 + (code, date) tick 快取
+# ==========================================
+# TradingCalendar：交易日存在 DB 的 trading_days 表，週末直接判定休市；
+#   未知的平日只用參考股票 (預設 2330) 探測一次 (只抓最後一筆 tick)，結果落地，之後不再花流量。
+#   相對日 (T0, T±1, T±2) 就能在本地算，不用逐日打 api.ticks 試。
+# TickDayCache：同一個 (code, date) 一次執行內只下載一次；
+#   有欄式儲存 (tick_store) 時跨執行也共用，多個 event 需要同一天就直接拿快取。
+
+
+def _to_date_str(d):
+    return d if isinstance(d, str) else d.strftime('%Y-%m-%d')
+
+
+class TradingCalendar:
+    """
+    probe(date_str) → True / False / None(無法判斷)，只有過去的日期會被寫入 DB。
+    與 TickWriter 共用同一個 DB：寫入時等 timeout 秒的鎖，仍然失敗只印警告 (記憶體裡的結果照用)。
+    """
+
+    def __init__(self, db_path, probe=None, timeout=30.0):
+        self.db_path = db_path
+        self.probe = probe
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        conn = sqlite3.connect(db_path, timeout=timeout)
+        conn.execute("CREATE TABLE IF NOT EXISTS trading_days (date TEXT PRIMARY KEY, is_open INTEGER)")
+        conn.commit()
+        self.days = dict(conn.execute("SELECT date, is_open FROM trading_days").fetchall())
+        conn.close()
+
+    def _persist(self, rows):
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            try:
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO trading_days (date, is_open) VALUES (?, ?)", rows)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ 交易日曆寫入失敗 (下次執行再補): {e}")
+
+    def seed_from_ticks(self, table="ticks"):
+        """DB 裡已經有 ticks 的 real_date 一定是交易日"""
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+        try:
+            dates = [r[0] for r in conn.execute(f"SELECT DISTINCT real_date FROM {table}")]
+        except sqlite3.OperationalError:
+            dates = []
+        conn.close()
+        new = [(d, 1) for d in dates if self.days.get(d) != 1]
+        with self.lock:
+            self.days.update(dict(new))
+        if new:
+            self._persist(new)
+        return len(new)
+
+    def mark_open(self, d):
+        d = _to_date_str(d)
+        with self.lock:
+            if self.days.get(d) == 1:
+                return
+            self.days[d] = 1
+        self._persist([(d, 1)])
+
+    def is_open(self, d):
+        d_str = _to_date_str(d)
+        if datetime.strptime(d_str, '%Y-%m-%d').weekday() >= 5:
+            return False
+        with self.lock:
+            known = self.days.get(d_str)
+        if known is not None:
+            return bool(known)
+        # 未知平日：探測一次 (網路請求不佔著 lock，其他 worker 查已知日期不用等)
+        is_open = self.probe(d_str) if self.probe else None
+        if is_open is None:
+            return True  # 無法判斷就當交易日，交給實際抓取決定
+        if d_str < datetime.now().strftime('%Y-%m-%d'):
+            with self.lock:
+                self.days[d_str] = int(is_open)
+            self._persist([(d_str, int(is_open))])
+        return bool(is_open)
+
+
+def walk_days(origin, step, first, last, calendar=None):
+    """origin + step*i (i = first..last)，有 calendar 就跳過休市日"""
+    for i in range(first, last + 1):
+        d = origin + timedelta(days=step * i)
+        if calendar is None or calendar.is_open(d):
+            yield d
+
+
+class TickDayCache:
+    """
+    包住 fetcher.fetch(contract, date_str)：
+    1. 記憶體 LRU (含「這天沒有 tick」的結果)
+    2. 欄式儲存已有的 (code, date) 直接讀檔
+    3. 同一個 key 正在被別的 worker 下載時，等它完成而不是重抓
+    成功抓到資料時順便把該日標為交易日。
+    fetcher.fetch 丟出例外 (斷線、逾時) 時這次回傳 None 但不快取，之後再遇到同一天會重抓；
+    InterruptedError (流量熔斷) 照樣往外丟。
+    """
+
+    def __init__(self, fetcher, store_dir=None, calendar=None, max_days=512):
+        self.fetcher = fetcher
+        self.store_dir = store_dir
+        self.calendar = calendar
+        self.max_days = max_days
+        self.memory = OrderedDict()
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.downloads = 0
+
+    def _remember(self, key, df):
+        with self.lock:
+            self.memory[key] = df
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_days:
+                self.memory.popitem(last=False)
+
+    def _from_store(self, code, date_str):
+        if not self.store_dir or not has_tick_day(self.store_dir, code, date_str):
+            return None
+        df = read_ticks(self.store_dir, codes=[code], dates=[date_str],
+                        columns=["ts", "close", "volume", "bid_price", "ask_price", "tick_type"])
+        df["volume"] = df["volume"].astype(float)
+        return df
+
+    def fetch(self, contract, date_str):
+        key = (str(contract.code), date_str)
+        while True:
+            with self.lock:
+                if key in self.memory:
+                    self.hits += 1
+                    self.memory.move_to_end(key)
+                    df = self.memory[key]
+                    return None if df is None else df.copy()
+                waiting = self.inflight.get(key)
+                if waiting is None:
+                    self.inflight[key] = threading.Event()
+                    break
+            waiting.wait()
+
+        try:
+            df = self._from_store(*key)
+            if df is not None:
+                self.hits += 1
+            else:
+                self.downloads += 1
+                df = self.fetcher.fetch(contract, date_str)
+            self._remember(key, df)
+        except InterruptedError:
+            raise
+        except Exception as e:
+            print(f"⚠️ 抓取 {key[0]} {date_str} 失敗 (不快取): {e}")
+            df = None
+        finally:
+            with self.lock:
+                self.inflight.pop(key).set()
+        # 日曆落地放在抓取的 try 之外：DB 被 TickWriter 鎖住也不會把抓到的資料當成沒有 tick
+        if df is not None and self.calendar is not None:
+            self.calendar.mark_open(date_str)
+        return None if df is None else df.copy()
@@ -2,9 +2,14 @@ import pandas as pd
 import sqlite3
 import shioaji as sj
 import time
-from datetime import datetime, timedelta, time as dt_time
+from datetime import datetime, timedelta
 import os
 import sys
+from tick_store import has_tick_day, write_tick_day
+from tick_downloader import download_events
+from trading_calendar import TradingCalendar
+from tick_writer import TickWriter, has_table
+from events_master import after_market_close, load_events
 
 # ==========================================
 # 1. 設定與初始化 (Configuration)
@@ -13,6 +18,8 @@ import sys
 BASE_DIR = r"D:\我才不要走量化"
 csv_path = os.path.join(BASE_DIR, "法說會", "TMBA_Events_Master.csv")
 db_path = os.path.join(BASE_DIR, "Data_Warehouse", "event01.db") 
+# 欄式 tick 儲存 (parquet, 依 real_date/code 分區)；設為 None 則只寫 SQLite
+tick_store_dir = os.path.join(BASE_DIR, "Data_Warehouse", "ticks_parquet")
 
 # 確保資料夾存在
 os.makedirs(os.path.dirname(db_path), exist_ok=True)
@@ -21,6 +28,13 @@ os.makedirs(os.path.dirname(db_path), exist_ok=True)
 LIMIT_GB = 0.5
 BYTES_LIMIT = LIMIT_GB * 1024 * 1024 * 1024 
 
+# ⚡ 併發下載設定 (CONCURRENT_WORKERS = 0 則使用原本逐筆下載)
+CONCURRENT_WORKERS = 4
+REQUESTS_PER_SEC = 5.0     # token bucket 限速
+USAGE_CHECK_EVERY = 50     # 每幾次請求才呼叫 api.usage() 校正本地流量估算
+CALENDAR_REF_CODE = "2330" # 交易日曆探測用的參考股票
+WRITE_BATCH_DAYS = 50      # 每累積幾個交易日的 ticks 才 commit 一次
+
 api = sj.Shioaji()
 # ⚠️ 請填入你的 API Key
 api.login(
@@ -59,39 +73,28 @@ def check_usage_limit():
 # ==========================================
 # 3. 資料庫準備
 # ==========================================
-conn = sqlite3.connect(db_path)
-cursor = conn.cursor()
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS ticks (
-    event_id TEXT,       
-    code TEXT,
-    event_date TEXT,
-    event_time TEXT,
-    real_date TEXT,      
-    relative_day INTEGER,
-    ts TEXT,
-    close REAL,
-    volume REAL,
-    bid_price REAL,
-    ask_price REAL,
-    side TEXT,
-    tick_type TEXT
-)
-""")
-cursor.execute("CREATE INDEX IF NOT EXISTS idx_event_id ON ticks (event_id)")
-conn.commit()
+# 單一連線 (WAL) 的批次寫入器：
+#   day_ticks  每個 (code, real_date) 的 ticks 只存一份
+#   event_days event_id / relative_day / event_date / event_time 等 metadata
+writer = TickWriter(db_path, batch_days=WRITE_BATCH_DAYS)
 
-# 讀取進度
+# 讀取進度 (新表 event_days + 舊版 ticks 表)
 print("🔍 檢查資料庫已存在的進度...")
 try:
-    cursor.execute("SELECT DISTINCT event_id FROM ticks")
-    existing_ids = set(row[0] for row in cursor.fetchall())
+    existing_ids = writer.existing_event_ids()
+    if has_table(db_path, "ticks"):
+        existing_ids |= set(row[0] for row in writer.conn.execute("SELECT DISTINCT event_id FROM ticks"))
     print(f"✅ 資料庫中已有 {len(existing_ids)} 場法說會資料，將自動跳過。")
 except Exception as e:
     print("⚠️ 讀取現有進度失敗，將從頭開始。")
     existing_ids = set()
 
+# 交易日曆：DB 已有 ticks 的日期直接視為交易日，其餘平日才用參考股票探測一次
+#   探測由 download_events 接到同一個 TickFetcher (限速 + 流量控管)，只抓最後一筆 tick
+PROBE_QUERY = dict(query_type=sj.constant.TicksQueryType.LastCount, last_cnt=1)
+calendar = TradingCalendar(db_path)
+print(f"📅 交易日曆：由既有 ticks 補入 {calendar.seed_from_ticks('tick_days') + calendar.seed_from_ticks('ticks')} 個交易日")
+
 # ==========================================
 # 4. 核心功能函數
 # ==========================================
@@ -116,32 +119,13 @@ def get_ticks_df(contract, date_str):
 
 def save_to_db(df, event_id, code, event_date, event_time, real_date, rel_day):
     try:
-        df['event_id'] = event_id
-        df['code'] = str(code)
-        df['event_date'] = event_date
-        df['event_time'] = event_time 
-        df['real_date'] = real_date
-        df['relative_day'] = rel_day
-        df['ts'] = df['ts'].astype(str)
-        
-        cols = ['event_id', 'code', 'event_date', 'event_time', 'real_date', 'relative_day', 
-                'ts', 'close', 'volume', 'bid_price', 'ask_price', 'tick_type']
-        
-        for c in cols:
-            if c not in df.columns: df[c] = None
-        
-        # 建立連線
-        local_conn = sqlite3.connect(db_path)
-        
-        # 寫入資料
-        df[cols].to_sql("ticks", local_conn, if_exists="append", index=False)
-        
-        # 🔥【關鍵修正】顯式提交，確保資料落地 🔥
-        local_conn.commit()
-        
-        # 關閉連線
-        local_conn.close()
-        
+        # 同一天的 ticks 也寫一份到欄式儲存；已經在儲存裡的不重寫 (mtime 是 info_metrics 的版本)
+        if tick_store_dir and not has_tick_day(tick_store_dir, code, real_date):
+            write_tick_day(tick_store_dir, df, code, real_date)
+
+        # 先暫存在批次寫入器，event 結束 (writer.end_event) 累積夠多天才一次 commit
+        writer.add_day(df, event_id, code, event_date, event_time, real_date, rel_day)
+
     except Exception as e:
         print(f"⚠️ 寫入 DB 失敗: {e}")
 
@@ -164,6 +148,14 @@ def process_single_event(stock_code, event_date_str, event_time_str):
 
     print(f"🔄 正在抓取: {stock_code} ({event_date_str}) EventID: {event_id}")
 
+    try:
+        return fetch_and_stage_event(contract, event_id, stock_code, event_date_obj, event_date_str, event_time_str)
+    except InterruptedError:
+        # 熔斷時這場 event 只暫存了一部分：丟掉，下次 resume 整場重抓
+        writer.discard_event(event_id)
+        raise
+
+def fetch_and_stage_event(contract, event_id, stock_code, event_date_obj, event_date_str, event_time_str):
     # === T=0 ===
     center_date = event_date_obj
     t0_df = None
@@ -214,57 +206,71 @@ def process_single_event(stock_code, event_date_str, event_time_str):
 # 5. 主執行邏輯
 # ==========================================
 
-def is_afternoon_session(time_val):
-    try:
-        t_str = str(time_val).strip()
-        if ':' in t_str:
-            parts = t_str.split(':')
-            h, m = int(parts[0]), int(parts[1])
-            return dt_time(h, m) >= dt_time(13, 30)
-        return False
-    except:
-        return False
-
 print("📂 讀取並篩選事件表...")
 try:
-    df_events = pd.read_csv(csv_path)
-    df_events.columns = [c.strip() for c in df_events.columns]
-    stock_col = 'StockCode' if 'StockCode' in df_events.columns else 'Code'
-    mask = df_events['Time'].apply(is_afternoon_session)
-    df_target = df_events[mask].copy()
+    # 共用的事件表載入器：Code 已正規化成字串、Date 已解析，13:30 (含) 以後為 SESSION_AFTER_CLOSE
+    df_events = load_events(csv_path)
+    df_target = df_events[after_market_close(df_events) & df_events['Date'].notna()]
+    events = list(zip(
+        df_target['Code'], df_target['Date'].dt.strftime('%Y-%m-%d'), df_target['Time'].astype(str),
+    ))
     
     print(f"📊 待處理任務數: {len(df_target)}")
     
     processed_count = 0
     skipped_count = 0
 
-    for idx, row in df_target.iterrows():
-        code = str(row[stock_col]).replace('.0', '')
-        e_date = str(row['Date'])
-        e_time = str(row['Time'])
+    if CONCURRENT_WORKERS > 0:
+        # 只會在單一寫入執行緒被呼叫
+        def save_event(event_id, code, e_date, e_time, days):
+            try:
+                for d_str, rel_day, df in days:
+                    save_to_db(df, event_id, code, e_date, e_time, d_str, rel_day)
+                writer.end_event()
+            except Exception:
+                # 寫入失敗的 event 丟掉暫存，之後的 end_event 不會一直重試同一批
+                writer.discard_event(event_id)
+                raise
+
+        counts = download_events(
+            api, events, save_event, existing_ids, BYTES_LIMIT,
+            workers=CONCURRENT_WORKERS, rate=REQUESTS_PER_SEC, reconcile_every=USAGE_CHECK_EVERY,
+            calendar=calendar, store_dir=tick_store_dir,
+            calendar_ref=CALENDAR_REF_CODE, probe_query=PROBE_QUERY,
+        )
+        processed_count = counts["SUCCESS"]
+        skipped_count = counts["SKIPPED"]
+        if counts["WRITE_FAILED"]:
+            print(f"⚠️ 有 {counts['WRITE_FAILED']} 場 event 寫入 DB 失敗，下次執行會重抓")
+        if counts["STOPPED"]:
+            print("\n🚨🚨🚨 系統強制停止：流量已達上限 🚨🚨🚨")
+            print("請更換帳號或等待下個月額度重置。")
+    else:
+        for code, e_date, e_time in events:
         
-        try:
-            status = process_single_event(code, e_date, e_time)
+            try:
+                status = process_single_event(code, e_date, e_time)
+                writer.end_event()
             
-            if status == "SKIPPED":
-                skipped_count += 1
-                if skipped_count % 100 == 0: print(f"⏭️ 已跳過 {skipped_count} 筆...")
-            elif status == "SUCCESS":
-                processed_count += 1
-                time.sleep(1.2) # 保持禮貌
+                if status == "SKIPPED":
+                    skipped_count += 1
+                    if skipped_count % 100 == 0: print(f"⏭️ 已跳過 {skipped_count} 筆...")
+                elif status == "SUCCESS":
+                    processed_count += 1
+                    time.sleep(1.2) # 保持禮貌
                 
-        except InterruptedError:
-            print("\n🚨🚨🚨 系統強制停止：流量已達上限 🚨🚨🚨")
-            print("請更換帳號或等待下個月額度重置。")
-            break 
+            except InterruptedError:
+                print("\n🚨🚨🚨 系統強制停止：流量已達上限 🚨🚨🚨")
+                print("請更換帳號或等待下個月額度重置。")
+                break 
             
-        if processed_count > 0 and processed_count % 10 == 0:
-            print(f"⚡ 進度更新：新抓取 {processed_count} 筆... (檢查流量中)")
+            if processed_count > 0 and processed_count % 10 == 0:
+                print(f"⚡ 進度更新：新抓取 {processed_count} 筆... (檢查流量中)")
 
 except Exception as e:
     print(f"❌ 發生未預期錯誤: {e}")
 
 finally:
-    conn.close()
+    writer.close()
     api.logout()
     print(f"👋 任務結束。共跳過 {skipped_count} 筆，新抓取 {processed_count} 筆。")
\ No newline at end of file
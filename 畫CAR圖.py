@@ -1,137 +1,116 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 import os
-import platform
-from datetime import datetime
+
+from car_engine import build_ar_panel, read_ar_table
+from events_master import after_market_close, load_events
+from feature_store import README_FILTERS, FeatureStore, apply_filters
+from car_aggregate import aggregate_car, quantile_groups, render_group_charts, save_group_summary
+from car_render import render_car_charts, set_chinese_font
+from info_metrics import event_metrics
 
 # --- 1. 設定路徑 ---
 base_path = r"D:\我才不要走量化\法說會"
 path_model = os.path.join(base_path, "final_model_complete.csv")
 path_events = os.path.join(base_path, "TMBA_Events_Master.csv")
 output_folder = os.path.join(base_path, "CAR_Charts_After1330") # 改個資料夾名區隔
+RENDER_WORKERS = os.cpu_count() # 畫圖的 process 數，1 = 不開 process pool
+
+# --- 彙總模式設定 ---
+MODE = "events"          # "events"：每個事件一張圖；"groups"：分組彙總 (五爪圖)
+db_path = os.path.join(r"D:\我才不要走量化", "Data_Warehouse", "event01.db")  # info_metrics 所在的 DB
+group_folder = os.path.join(base_path, "CAR_Groups")
+GROUP_COL = "ip_0900_0930_t0"   # 分組欄位：T0 9:00~9:30 info_pressure，或事件表的任一數值欄
+N_GROUPS = 5
+PREFILTER_T1 = True             # 只留 T-1 11:00~11:30 info_pressure < 0 的事件
+GROUP_WINDOW = (0, 2)           # README 的 CAR[0,+2]
+N_BOOT = 2000
+
+# --- 事件濾網 (feature_store.py 建好的特徵庫；以事件日當下已知的值 as-of 對上) ---
+feature_store_dir = os.path.join(r"D:\我才不要走量化", "Data_Warehouse", "feature_store")
+EVENT_FILTERS = ()              # 例如 README_FILTERS；空的不篩選
 
 if not os.path.exists(output_folder):
     os.makedirs(output_folder)
 
 # --- 2. 畫圖設定 (修復中文) ---
-def set_chinese_font():
-    system = platform.system()
-    if system == 'Windows':
-        font_list = ['Microsoft JhengHei', 'SimHei', 'Arial']
-        plt.rcParams['font.sans-serif'] = font_list
-    elif system == 'Darwin': 
-        plt.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'Heiti TC']
-    else:
-        plt.rcParams['font.sans-serif'] = ['WenQuanYi Micro Hei']
-    plt.rcParams['axes.unicode_minus'] = False 
-
 set_chinese_font()
 
-# --- 輔助函數：判斷時間是否晚於 13:30 ---
-def is_after_market_close(time_str):
-    try:
-        # 將字串 (如 "14:30") 轉為時間物件
-        t = datetime.strptime(str(time_str).strip(), '%H:%M').time()
-        cutoff = datetime.strptime('13:30', '%H:%M').time()
-        return t >= cutoff # 大於等於 13:30 回傳 True
-    except:
-        return False # 格式錯誤或空值就略過
-
-def generate_car_plots_all_after_1330():
+def load_events_after_1330():
     print("🚀 載入資料中...")
-    df_model = pd.read_csv(path_model)
-    df_events = pd.read_csv(path_events)
-
-    # --- 格式清洗 ---
-    print("📅 格式化日期與代碼...")
-    df_model['Date'] = pd.to_datetime(df_model['Date'], format='%Y%m%d')
-    df_events['Date'] = pd.to_datetime(df_events['Date'])
-
-    if 'StockCode' in df_events.columns:
-        df_events.rename(columns={'StockCode': 'Code'}, inplace=True)
-    if 'StockCode' in df_model.columns:
-        df_model.rename(columns={'StockCode': 'Code'}, inplace=True)
+    # TEJ 的 final_model_complete.csv 或 ar_model.py 產生的 parquet (可自訂估計期 / 基準)
+    df_model = read_ar_table(path_model)
+    df_events = load_events(path_events)  # Code / Date 已正規化，結果快取在 CSV 旁
 
     # --- 關鍵修改：篩選 13:30 (含) 以後的所有事件 ---
     print("🔍 正在篩選 13:30 後的法說會...")
-    # 使用 apply 搭配上面的輔助函數
-    mask = df_events['Time'].apply(is_after_market_close)
-    df_events_filtered = df_events[mask].copy()
+    df_events_filtered = df_events[after_market_close(df_events)].copy()
     
     print(f"👉 原始事件數：{len(df_events)}")
     print(f"👉 篩選後 (>=13:30) 事件數：{len(df_events_filtered)}")
 
-    # --- 準備 CAR 計算 ---
-    df_model.sort_values(by=['Code', 'Date'], inplace=True)
-    df_model.set_index(['Code', 'Date'], inplace=True)
+    if EVENT_FILTERS:
+        store = FeatureStore.load(feature_store_dir)
+        df_events_filtered = store.attach(df_events_filtered, "Code", "Date")
+        df_events_filtered = df_events_filtered[apply_filters(df_events_filtered, EVENT_FILTERS)]
+        print(f"👉 特徵濾網後事件數：{len(df_events_filtered)}")
+    return df_model, df_events_filtered.reset_index(drop=True)
 
-    window = 5 
-    count = 0
-    print(f"🎨 開始繪製 CAR 圖表 (輸出至 {output_folder})...")
+def generate_car_plots_all_after_1330():
+    df_model, df_events_filtered = load_events_after_1330()
+
+    # --- 準備 CAR 計算 (所有事件一次算完) ---
+    window = 5
+    panel = build_ar_panel(df_model)
+    events = panel.locate(df_events_filtered['Code'], df_events_filtered['Date'])
+    res = panel.car(events, (-window, window))
+    print("📋 事件狀態：")
+    print(res.reason_counts().to_string())
 
-    # --- 迴圈處理 ---
-    for idx, row in df_events_filtered.iterrows():
-        ticker = row['Code']
-        event_date = row['Date']
-        event_time = row['Time']
-        raw_name = row.get('StockName')
-        name = str(raw_name) if pd.notna(raw_name) else str(ticker)
-
-        try:
-            # 檢查是否有該股票資料
-            if ticker not in df_model.index.levels[0]:
-                continue
-                
-            stock_data = df_model.loc[ticker]
-            
-            # 檢查日期是否存在
-            if event_date in stock_data.index:
-                loc_idx = stock_data.index.get_loc(event_date)
-                start_loc = loc_idx - window
-                end_loc = loc_idx + window
-                
-                # 確保窗口在資料範圍內
-                if start_loc >= 0 and end_loc < len(stock_data):
-                    subset = stock_data.iloc[start_loc : end_loc+1].copy()
-                    
-                    # 計算 CAR
-                    subset['CAR'] = subset['Abnormal_Return'].cumsum()
-                    subset['Relative_Day'] = range(-window, window + 1)
-
-                    # 繪圖
-                    plt.figure(figsize=(10, 6))
-                    plt.plot(subset['Relative_Day'], subset['CAR'], marker='o', color='#1f77b4', linewidth=2)
-                    
-                    # 標記線
-                    plt.axvline(x=0, color='red', linestyle='--', alpha=0.8, label=f'法說會 ({event_time})')
-                    plt.axhline(y=0, color='gray', linestyle='-', linewidth=0.5)
-                    
-                    # 標題
-                    plt.title(f"{name} ({ticker}) - 法說會 CAR 走勢\n日期: {event_date.strftime('%Y-%m-%d')} 時間: {event_time}", fontsize=16)
-                    plt.xlabel('相對天數', fontsize=12)
-                    plt.ylabel('累積異常報酬 (CAR)', fontsize=12)
-                    plt.legend(loc='best')
-                    plt.grid(True, alpha=0.3)
-                    
-                    # 存檔 (檔名加上時間以防重複)
-                    time_clean = str(event_time).replace(':', '')
-                    filename = f"{ticker}_{event_date.strftime('%Y%m%d')}_{time_clean}.png"
-                    save_path = os.path.join(output_folder, filename)
-                    plt.savefig(save_path)
-                    plt.close()
-                    
-                    count += 1
-                    if count % 100 == 0:
-                        print(f"✅ 已完成 {count} 張圖...")
-
-        except Exception as e:
-            # print(f"❌ Error: {e}") # 錯誤太多時可以註解掉
-            continue
+    # --- 畫圖：重複使用同一張 Agg figure，多個 process 分批畫，已是最新的 PNG 跳過 ---
+    print(f"🎨 開始繪製 CAR 圖表 (輸出至 {output_folder})...")
+    count = render_car_charts(
+        res, df_events_filtered, output_folder,
+        inputs=[path_model, path_events], workers=RENDER_WORKERS,
+    )
 
     print("-" * 30)
     print(f"🎉 全部完成！共產生 {count} 張圖表")
     print(f"📂 請查看資料夾：{output_folder}")
 
+def generate_car_group_summary():
+    """彙總模式 (五爪圖)：依 GROUP_COL 分位數分組，每組一張平均 / 中位數 CAR 圖，數字附加到 CSV"""
+    df_model, df_events = load_events_after_1330()
+
+    # 事件層級的資訊指標 (T0 9:00~9:30、T-1 11:00~11:30)，以 (Code, Date) 對上事件
+    if GROUP_COL not in df_events.columns or PREFILTER_T1:
+        feats = event_metrics(db_path).rename(columns={"code": "Code", "event_date": "Date"})
+        df_events['Code'] = df_events['Code'].astype(str)
+        df_events = df_events.merge(feats, on=['Code', 'Date'], how='left', suffixes=('', '_metric'))
+
+    panel = build_ar_panel(df_model)
+    res = panel.car(panel.locate(df_events['Code'], df_events['Date']), GROUP_WINDOW)
+
+    # 分位數以全部樣本 (有值的事件) 切，再套 T-1 濾網
+    groups = quantile_groups(df_events[GROUP_COL], N_GROUPS)
+    if PREFILTER_T1:
+        groups[~(df_events['ip_1100_1130_tm1'] < 0).to_numpy()] = 0
+    print(f"👉 納入分組的事件數：{int((res.ok & (groups > 0)).sum())}")
+
+    summary = aggregate_car(res, groups, n_boot=N_BOOT)
+    print(summary[summary['rel_day'] == GROUP_WINDOW[1]].to_string(index=False))
+
+    label = f"{GROUP_COL} 五分位" + (" (T-1 11:00~11:30 < 0)" if PREFILTER_T1 else "")
+    render_group_charts(summary, group_folder, label)
+    save_group_summary(
+        summary, os.path.join(group_folder, "car_group_summary.csv"),
+        group_col=GROUP_COL, n_groups=N_GROUPS, prefilter_t1=PREFILTER_T1,
+        window=list(GROUP_WINDOW), n_boot=N_BOOT,
+    )
+    print(f"📂 請查看資料夾：{group_folder}")
+
 if __name__ == "__main__":
-    generate_car_plots_all_after_1330()
+    if MODE == "groups":
+        generate_car_group_summary()
+    else:
+        generate_car_plots_all_after_1330()
 